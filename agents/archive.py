@@ -0,0 +1,263 @@
+"""Archival of idle agent sessions.
+
+Every session ever started stays in the agent session tables, which makes their indexes and the tables
+themselves grow with the number of conversations, not with the number of active ones. Archival moves
+sessions that were idle for `--idle-days` into `public.session_archive`, as one zlib compressed row each.
+
+Archived sessions are still listed by agents.storage.get_session_index and are moved back to the session
+table when an agent reads them, e.g. when one is selected in the ui (see agents.storage.AgentStorage).
+
+Sessions are archived with:
+    python -m agents.archive --dry-run
+    python -m agents.archive --table sage_sessions --idle-days 30 --vacuum
+"""
+
+import argparse
+import json
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects import postgresql
+
+from agents.compaction import SESSION_TABLES
+from agents.settings import agent_settings
+from db.tables.session_archive import SessionArchiveTable
+from utils.log import logger
+
+if TYPE_CHECKING:
+    from agents.storage import AgentStorage
+
+# Columns of an agent session row stored in the archive
+ARCHIVED_COLUMNS = (
+    "session_id",
+    "user_id",
+    "agent_id",
+    "team_session_id",
+    "memory",
+    "agent_data",
+    "session_data",
+    "extra_data",
+    "created_at",
+    "updated_at",
+)
+
+
+def compress_session(row: Dict[str, Any]) -> Tuple[bytes, int]:
+    """Return the compressed json of a session row and the size of the uncompressed json."""
+    uncompressed = json.dumps(row, separators=(",", ":"), default=str).encode()
+    return zlib.compress(uncompressed, level=6), len(uncompressed)
+
+
+def decompress_session(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data))
+
+
+def rehydrate_session(storage: "AgentStorage", session_id: str) -> bool:
+    """
+    Move an archived session back to the session table of the storage.
+
+    Args:
+        storage (AgentStorage): The storage the session was archived from.
+        session_id (str): The session to restore.
+
+    Returns:
+        bool: True if this call restored the session. False if it is not archived, e.g. because a concurrent
+            call restored it first, read the session table again in both cases.
+    """
+    archive = SessionArchiveTable.__table__
+    where = (archive.c.table_name == storage.table_name, archive.c.session_id == session_id)
+    with storage.Session() as sess, sess.begin():
+        # Locked so a concurrent read of the same session waits instead of restoring it twice
+        data = sess.execute(select(archive.c.data).where(*where).with_for_update()).scalar()
+        if data is None:
+            return False
+        row = decompress_session(data)
+        sess.execute(
+            postgresql.insert(storage.table)
+            .values({column: row.get(column) for column in ARCHIVED_COLUMNS})
+            .on_conflict_do_nothing(index_elements=["session_id"])
+        )
+        sess.execute(delete(archive).where(*where))
+    logger.info(f"Restored archived session {session_id} to {storage.table_name}")
+    return True
+
+
+def delete_archived_session(storage: "AgentStorage", session_id: str) -> None:
+    """Delete a session from the archive, if it is archived."""
+    archive = SessionArchiveTable.__table__
+    with storage.Session() as sess, sess.begin():
+        sess.execute(
+            delete(archive).where(archive.c.table_name == storage.table_name, archive.c.session_id == session_id)
+        )
+
+
+@dataclass
+class ArchiveReport:
+    table: str
+    dry_run: bool = False
+    sessions: int = 0
+    bytes_uncompressed: int = 0
+    bytes_compressed: int = 0
+    table_bytes_before: Optional[int] = None
+    table_bytes_after: Optional[int] = None
+    errors: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        ratio = self.bytes_uncompressed / self.bytes_compressed if self.bytes_compressed else 0.0
+        lines = [
+            f"{self.table}: {'would archive' if self.dry_run else 'archived'} {self.sessions} sessions",
+            f"  sessions: {self.bytes_uncompressed / 1e6:.2f} MB -> {self.bytes_compressed / 1e6:.2f} MB"
+            f" compressed ({ratio:.1f}x)",
+        ]
+        if self.table_bytes_before is not None and self.table_bytes_after is not None:
+            lines.append(
+                f"  table on disk: {self.table_bytes_before / 1e6:.2f} MB -> {self.table_bytes_after / 1e6:.2f} MB"
+            )
+        lines.extend(f"  error: {error}" for error in self.errors)
+        return "\n".join(lines)
+
+
+def archive_sessions(
+    table_name: str,
+    idle_days: float = agent_settings.session_archive_after_days,
+    batch_size: int = 100,
+    dry_run: bool = False,
+    vacuum: bool = False,
+) -> ArchiveReport:
+    """
+    Move sessions that were idle for `idle_days` from an agent session table to the archive.
+
+    Each batch is deleted from the session table and inserted into the archive in one transaction. Only
+    sessions still idle when they are deleted are archived, and sessions being written are skipped.
+
+    Args:
+        table_name (str): The agent storage table, e.g. "sage_sessions".
+        idle_days (float): Archive sessions without a run for this many days.
+        batch_size (int): Number of sessions moved per transaction.
+        dry_run (bool): Only report what would be archived.
+        vacuum (bool): Vacuum the session table afterwards, so the space is reused right away.
+
+    Returns:
+        ArchiveReport: Number and sizes of the archived sessions.
+    """
+    from agents.storage import get_agent_storage
+    from db.session import SessionLocal, db_engine
+
+    storage = get_agent_storage(table_name, compact_on_write=False, write_behind=False)
+    table = storage.table
+    archive = SessionArchiveTable.__table__
+    report = ArchiveReport(table=table_name, dry_run=dry_run)
+    if not storage.table_exists():
+        report.errors.append("table does not exist")
+        return report
+
+    cutoff = int(time.time() - idle_days * 86400)
+    last_activity = func.coalesce(table.c.updated_at, table.c.created_at)
+    relation = f"{storage.schema}.{table_name}"
+    with SessionLocal() as db:
+        report.table_bytes_before = db.execute(text("SELECT pg_total_relation_size(:t)"), {"t": relation}).scalar()
+
+    columns = [table.c[column] for column in ARCHIVED_COLUMNS]
+    if dry_run:
+        last_session_id: Optional[str] = None
+        while True:
+            stmt = select(*columns).where(last_activity < cutoff).order_by(table.c.session_id).limit(batch_size)
+            if last_session_id is not None:
+                stmt = stmt.where(table.c.session_id > last_session_id)
+            with SessionLocal() as db:
+                rows = db.execute(stmt).fetchall()
+            if not rows:
+                return report
+            last_session_id = rows[-1].session_id
+            for row in rows:
+                data, size = compress_session(dict(row._mapping))
+                report.sessions += 1
+                report.bytes_uncompressed += size
+                report.bytes_compressed += len(data)
+
+    while True:
+        idle_ids = (
+            select(table.c.session_id)
+            .where(last_activity < cutoff)
+            .order_by(table.c.session_id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        try:
+            with SessionLocal() as db, db.begin():
+                rows = db.execute(
+                    delete(table)
+                    .where(table.c.session_id.in_(idle_ids), last_activity < cutoff)
+                    .returning(*columns)
+                ).fetchall()
+                if not rows:
+                    break
+                values = []
+                for row in rows:
+                    session = dict(row._mapping)
+                    data, size = compress_session(session)
+                    report.bytes_uncompressed += size
+                    report.bytes_compressed += len(data)
+                    values.append(
+                        dict(
+                            table_name=table_name,
+                            session_id=session["session_id"],
+                            user_id=session["user_id"],
+                            agent_id=session["agent_id"],
+                            session_name=(session["session_data"] or {}).get("session_name"),
+                            created_at=session["created_at"],
+                            last_activity=session["updated_at"] or session["created_at"],
+                            data=data,
+                            size_bytes=size,
+                        )
+                    )
+                insert = postgresql.insert(archive).values(values)
+                db.execute(
+                    insert.on_conflict_do_update(
+                        index_elements=["table_name", "session_id"],
+                        set_={
+                            column: insert.excluded[column]
+                            for column in values[0]
+                            if column not in ("table_name", "session_id")
+                        },
+                    )
+                )
+        except Exception as e:
+            logger.error(f"Could not archive sessions of {table_name}: {e}")
+            report.errors.append(str(e))
+            break
+        report.sessions += len(rows)
+        logger.info(f"Archived {report.sessions} sessions of {table_name}")
+
+    if vacuum:
+        # VACUUM can't run in a transaction
+        with db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text(f"VACUUM (ANALYZE) {relation}"))
+    with SessionLocal() as db:
+        report.table_bytes_after = db.execute(text("SELECT pg_total_relation_size(:t)"), {"t": relation}).scalar()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive idle agent sessions")
+    parser.add_argument("--table", action="append", choices=SESSION_TABLES, help="Tables to archive, default all")
+    parser.add_argument("--idle-days", type=float, default=agent_settings.session_archive_after_days)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived")
+    parser.add_argument("--vacuum", action="store_true", help="Vacuum the session tables afterwards")
+    args = parser.parse_args()
+
+    for session_table in args.table or SESSION_TABLES:
+        print(
+            archive_sessions(
+                session_table,
+                idle_days=args.idle_days,
+                batch_size=args.batch_size,
+                dry_run=args.dry_run,
+                vacuum=args.vacuum,
+            )
+        )
@@ -0,0 +1,233 @@
+"""Compaction of agent sessions.
+
+Every run appends its messages, tool calls and tool results to the session memory, so sessions grow
+without bound and every load and write of a session gets slower. Compaction keeps the most recent runs
+verbatim and reduces older runs to the question, the answer and truncated tool results, which is all the
+ui shows for them.
+
+Sessions are compacted when they are written (see agents.storage.AgentStorage). Existing
+sessions can be compacted with:
+    python -m agents.compaction --dry-run
+    python -m agents.compaction --table sage_sessions --keep-runs 5
+"""
+
+import argparse
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, text
+
+from agents.settings import agent_settings
+from utils.log import logger
+
+SESSION_TABLES = ["sage_sessions", "scholar_sessions", "db2i_sessions"]
+
+TRUNCATED_MARKER = "\n... [truncated {} characters]"
+TRUNCATED_PATTERN = re.compile(r"\n\.\.\. \[truncated \d+ characters\]$")
+
+
+@dataclass
+class CompactionPolicy:
+    """How much of a session's history is kept."""
+
+    keep_runs: int = agent_settings.session_keep_runs
+    max_runs: int = agent_settings.session_max_runs
+    max_tool_output_chars: int = agent_settings.session_max_tool_output_chars
+
+
+def _truncate(content: Any, max_chars: int) -> Any:
+    if isinstance(content, str) and len(content) > max_chars and not TRUNCATED_PATTERN.search(content):
+        return content[:max_chars] + TRUNCATED_MARKER.format(len(content) - max_chars)
+    return content
+
+
+def _compact_run(run: Dict[str, Any], policy: CompactionPolicy) -> bool:
+    # The messages sent to the model repeat the history and every tool result
+    changed = run.pop("messages", None) is not None
+    response = run.get("response")
+    if not isinstance(response, dict):
+        return changed
+    changed |= response.pop("messages", None) is not None
+    # Knowledge references and reasoning steps
+    changed |= response.pop("extra_data", None) is not None
+    for tool in response.get("tools") or []:
+        if isinstance(tool, dict) and "content" in tool:
+            content = _truncate(tool["content"], policy.max_tool_output_chars)
+            changed |= content is not tool["content"]
+            tool["content"] = content
+    return changed
+
+
+def _trim_messages(messages: List[Dict[str, Any]], keep_runs: int) -> List[Dict[str, Any]]:
+    """Keep the system message and the messages of the last `keep_runs` runs, each run starts with a user message."""
+    user_indexes = [i for i, message in enumerate(messages) if message.get("role") == "user"]
+    if len(user_indexes) <= keep_runs:
+        return messages
+    start = user_indexes[-keep_runs] if keep_runs > 0 else len(messages)
+    system_messages = [message for message in messages[:start] if message.get("role") == "system"]
+    return system_messages + messages[start:]
+
+
+def compact_memory(memory: Optional[Dict[str, Any]], policy: CompactionPolicy) -> bool:
+    """
+    Compact the memory of a session in place.
+
+    Args:
+        memory (Optional[Dict[str, Any]]): The memory of an agent session, as stored by agno.
+        policy (CompactionPolicy): How much history to keep.
+
+    Returns:
+        bool: True if the memory was changed.
+    """
+    if not memory:
+        return False
+    changed = False
+
+    runs: List[Dict[str, Any]] = memory.get("runs") or []
+    if policy.max_runs > 0 and len(runs) > policy.max_runs:
+        del runs[: len(runs) - policy.max_runs]
+        changed = True
+    for run in runs[: max(len(runs) - policy.keep_runs, 0)]:
+        changed |= _compact_run(run, policy)
+
+    messages: List[Dict[str, Any]] = memory.get("messages") or []
+    trimmed = _trim_messages(messages, policy.keep_runs)
+    if trimmed is not messages:
+        memory["messages"] = trimmed
+        changed = True
+    return changed
+
+
+@dataclass
+class CompactionReport:
+    table: str
+    sessions: int = 0
+    compacted: int = 0
+    skipped: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    table_bytes_before: Optional[int] = None
+    table_bytes_after: Optional[int] = None
+    errors: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        saved = self.bytes_before - self.bytes_after
+        percent = 100 * saved / self.bytes_before if self.bytes_before else 0.0
+        lines = [
+            f"{self.table}: compacted {self.compacted} of {self.sessions} sessions"
+            + (f", skipped {self.skipped} written concurrently" if self.skipped else ""),
+            f"  memory: {self.bytes_before / 1e6:.2f} MB -> {self.bytes_after / 1e6:.2f} MB ({percent:.1f}% smaller)",
+        ]
+        if self.table_bytes_before is not None and self.table_bytes_after is not None:
+            lines.append(
+                f"  table on disk: {self.table_bytes_before / 1e6:.2f} MB -> {self.table_bytes_after / 1e6:.2f} MB"
+                " (space is reused after VACUUM)"
+            )
+        lines.extend(f"  error: {error}" for error in self.errors)
+        return "\n".join(lines)
+
+
+def compact_sessions(
+    table_name: str,
+    policy: Optional[CompactionPolicy] = None,
+    batch_size: int = 100,
+    dry_run: bool = False,
+) -> CompactionReport:
+    """
+    Compact all sessions in an agent storage table.
+
+    Sessions are read in batches ordered by session_id. A session that was written while it was being
+    compacted is skipped, so runs added by the agent are never lost. updated_at is left unchanged.
+
+    Args:
+        table_name (str): The agent storage table, e.g. "sage_sessions".
+        policy (Optional[CompactionPolicy]): How much history to keep, defaults to the agent settings.
+        batch_size (int): Number of sessions read per query.
+        dry_run (bool): Only report the sizes, do not write.
+
+    Returns:
+        CompactionReport: Sizes of the sessions before and after compaction.
+    """
+    from agents.storage import get_agent_storage
+    from db.session import SessionLocal
+
+    policy = policy or CompactionPolicy()
+    storage = get_agent_storage(table_name, compact_on_write=False, write_behind=False)
+    table = storage.table
+    report = CompactionReport(table=table_name)
+    if not storage.table_exists():
+        report.errors.append("table does not exist")
+        return report
+
+    relation = f"{storage.schema}.{table_name}"
+    with SessionLocal() as db:
+        report.table_bytes_before = db.execute(text("SELECT pg_total_relation_size(:t)"), {"t": relation}).scalar()
+
+    last_session_id: Optional[str] = None
+    while True:
+        stmt = select(table.c.session_id, table.c.memory, table.c.updated_at).order_by(table.c.session_id)
+        if last_session_id is not None:
+            stmt = stmt.where(table.c.session_id > last_session_id)
+        with SessionLocal() as db:
+            rows = db.execute(stmt.limit(batch_size)).fetchall()
+        if not rows:
+            break
+        last_session_id = rows[-1].session_id
+
+        for row in rows:
+            report.sessions += 1
+            memory = row.memory
+            size_before = len(json.dumps(memory, default=str)) if memory is not None else 0
+            report.bytes_before += size_before
+            if not compact_memory(memory, policy):
+                report.bytes_after += size_before
+                continue
+            size_after = len(json.dumps(memory, default=str))
+            if dry_run:
+                report.compacted += 1
+                report.bytes_after += size_after
+                continue
+            try:
+                with SessionLocal() as db, db.begin():
+                    result = db.execute(
+                        table.update()
+                        .where(
+                            table.c.session_id == row.session_id,
+                            table.c.updated_at.is_not_distinct_from(row.updated_at),
+                        )
+                        .values(memory=memory)
+                    )
+            except Exception as e:
+                logger.error(f"Could not compact session {row.session_id}: {e}")
+                report.errors.append(f"{row.session_id}: {e}")
+                report.bytes_after += size_before
+                continue
+            if result.rowcount == 0:
+                report.skipped += 1
+                report.bytes_after += size_before
+            else:
+                report.compacted += 1
+                report.bytes_after += size_after
+
+    with SessionLocal() as db:
+        report.table_bytes_after = db.execute(text("SELECT pg_total_relation_size(:t)"), {"t": relation}).scalar()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact agent sessions and report their size")
+    parser.add_argument("--table", action="append", choices=SESSION_TABLES, help="Tables to compact, default all")
+    parser.add_argument("--keep-runs", type=int, default=agent_settings.session_keep_runs)
+    parser.add_argument("--max-runs", type=int, default=agent_settings.session_max_runs)
+    parser.add_argument("--max-tool-output-chars", type=int, default=agent_settings.session_max_tool_output_chars)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--dry-run", action="store_true", help="Only report the sizes, do not write")
+    args = parser.parse_args()
+
+    compaction_policy = CompactionPolicy(
+        keep_runs=args.keep_runs, max_runs=args.max_runs, max_tool_output_chars=args.max_tool_output_chars
+    )
+    for session_table in args.table or SESSION_TABLES:
+        print(compact_sessions(session_table, compaction_policy, batch_size=args.batch_size, dry_run=args.dry_run))
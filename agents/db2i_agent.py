@@ -1,17 +1,22 @@
 from contextlib import asynccontextmanager
 from textwrap import dedent
-from typing import Any, AsyncGenerator, Dict
+from typing import Any, AsyncGenerator, Dict, Optional
 
 from agno.agent import Agent
 from agno.models.base import Model
 from agno.models.openai import OpenAIChat
-from agno.storage.agent.postgres import PostgresAgentStorage
 from agno.tools.mcp import MCPTools
 from dotenv import load_dotenv
 from mcp import StdioServerParameters
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from agents.mcp_pool import mcp_session_pool
 from agents.model import get_model
-from db.session import db_url
+from agents.storage import get_agent_storage
+from db.crud.systems import aget_system, alist_systems
+from db.session import AsyncSessionLocal
+from db.tables.systems import SystemsTable
+from utils.log import logger
 
 load_dotenv()
 server_path = "/app/agents/db2i-agents/examples/mcp/db2i-mcp-server"
@@ -54,8 +59,8 @@ def get_server_params(
 
 def create_db2i_agent(
     model: Model = OpenAIChat(),
-    user_id: str = None,
-    session_id: str = None,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
     tools=None,
     debug_mode: bool = True,
 ) -> Agent:
@@ -90,7 +95,7 @@ def create_db2i_agent(
         user_id=user_id,
         session_id=session_id,
         tools=tools,
-        storage=PostgresAgentStorage(table_name="db2i_sessions", db_url=db_url),
+        storage=get_agent_storage("db2i_sessions"),
         instructions=dedent(
             """\
                 You are a Db2i Database assistant. Help users answer questions about the database.
@@ -174,12 +179,104 @@ async def db2i_agent_session(
             pass
 
 
+async def aget_system_connection_details(
+    system_id: int, session_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal
+) -> Optional[Dict[str, Any]]:
+    """
+    Get the connection details of a system from the `systems` table.
+
+    Args:
+        system_id (int): The ID of the system.
+        session_factory (async_sessionmaker[AsyncSession]): Opens the database session, the ui passes
+            UnpooledAsyncSessionLocal.
+
+    Returns:
+        Optional[Dict[str, Any]]: Connection details for the Db2i database, None if the system does not exist.
+    """
+    async with session_factory() as db:
+        system = await aget_system(db, system_id)
+        if system is None:
+            return None
+        return get_connection_details(system)
+
+
+def get_connection_details(system: SystemsTable) -> Dict[str, Any]:
+    """Return the connection details of a row of the `systems` table."""
+    return {
+        "host": system.host,
+        "user": system.user,
+        "password": system.password,
+        "port": system.port,
+        "schema": system.schema,
+    }
+
+
+async def warm_db2i_sessions() -> None:
+    """Start `min_idle` pooled MCP sessions of every system, so the first run of a system does not start one."""
+    async with AsyncSessionLocal() as db:
+        systems = await alist_systems(db)
+    for system in systems:
+        server_params = get_server_params(server_path=server_path, connection_details=get_connection_details(system))
+        try:
+            await mcp_session_pool.warm(f"system-{system.id}", server_params)
+        except Exception as e:
+            logger.warning(f"Could not start an MCP session for system {system.id}: {e}")
+
+
+@asynccontextmanager
+async def pooled_db2i_agent_session(
+    model_id: str = "gpt-4o",
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    debug_mode: bool = True,
+    system_id: Optional[int] = None,
+    connection_details: Optional[Dict[str, Any]] = None,
+) -> AsyncGenerator[Agent, None]:
+    """
+    Context manager that yields a Db2i agent using a pooled MCP session.
+
+    Unlike db2i_agent_session, the MCP server is not started for every run. Sessions are leased
+    from `mcp_session_pool` and kept alive for the next run against the same system.
+
+    Usage:
+        async with pooled_db2i_agent_session(system_id=1, connection_details=details) as agent:
+            response = await agent.arun("What tables are available?")
+
+    Args:
+        model_id (str): The model ID to use for the agent.
+        user_id (Optional[str]): The user ID for the agent.
+        session_id (Optional[str]): The session ID for the agent.
+        debug_mode (bool): Whether to enable debug mode.
+        system_id (Optional[int]): The ID of the system, used as the pool key.
+        connection_details (Optional[Dict[str, Any]]): Connection details for the Db2i database.
+            If not provided, the connection details are read from environment variables.
+
+    Yields:
+        Agent: A configured Db2i agent with initialized MCP tools.
+    """
+    if connection_details is None:
+        server_params = get_server_params(server_path=server_path, use_env=True)
+        pool_key = "env"
+    else:
+        server_params = get_server_params(server_path=server_path, connection_details=connection_details)
+        pool_key = f"system-{system_id}"
+
+    async with mcp_session_pool.session(pool_key, server_params) as mcp_tools:
+        yield create_db2i_agent(
+            model=get_model(model_id=model_id),
+            user_id=user_id,
+            session_id=session_id,
+            tools=[mcp_tools],
+            debug_mode=debug_mode,
+        )
+
+
 def get_db2i_agent(
     model_id: str = "gpt-4o",
-    user_id: str = None,
-    session_id: str = None,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
     debug_mode: bool = True,
-    connection_details: Dict[str, Any] = None,
+    connection_details: Optional[Dict[str, Any]] = None,
     use_env: bool = False,
 ) -> Agent:
     """
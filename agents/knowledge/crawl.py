@@ -0,0 +1,354 @@
+"""Incremental crawls of websites added to a knowledge base.
+
+WebsiteReader downloads and re-indexes every page each time a website is added. The crawl registry,
+public.crawled_pages, keeps the validators (ETag, Last-Modified), the content hash and the links of every
+page crawled for a knowledge base. Crawling a website again:
+    - sends conditional requests, pages answered with 304 Not Modified are not downloaded again
+    - only re-indexes pages whose extracted text changed, and drops chunks a changed page no longer has
+    - removes the chunks of pages that are gone (404 or 410)
+
+Websites are added and refreshed with:
+    python -m agents.knowledge.crawl https://docs.agno.com
+    python -m agents.knowledge.crawl --refresh
+    python -m agents.knowledge.crawl --refresh --interval 3600
+"""
+
+import argparse
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from hashlib import md5
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urljoin, urlparse
+
+import httpx
+from agno.document.reader.website_reader import WebsiteReader
+from bs4 import BeautifulSoup, Tag
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql
+
+from agents.knowledge.documents import register_document
+from agents.knowledge.ingest import IngestionPipeline, IngestionReport
+from agents.settings import agent_settings
+from db.tables.crawled_pages import CrawledPageTable
+from utils.dttm import current_utc
+from utils.log import logger
+
+# Crawl limits of the knowledge widget
+DEFAULT_MAX_LINKS = 2
+DEFAULT_MAX_DEPTH = 1
+SKIPPED_EXTENSIONS = (".pdf", ".jpg", ".png")
+
+
+@dataclass
+class PageState:
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    links: List[str] = field(default_factory=list)
+
+
+@dataclass
+class IncrementalWebsiteReader(WebsiteReader):
+    """WebsiteReader that only returns the pages that changed since the last crawl of the website.
+
+    The registry is only updated by `commit()`, once the changed pages are indexed, so pages that could
+    not be indexed are crawled again next time.
+    """
+
+    table_name: str = "sage_knowledge"
+    timeout: float = 10
+    # Results of the last crawl
+    changed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    not_modified: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    _source: Optional[str] = None
+    _previous: Dict[str, PageState] = field(default_factory=dict)
+    _crawled: Dict[str, PageState] = field(default_factory=dict)
+
+    def _load(self, source: str) -> Dict[str, PageState]:
+        from db.session import SessionLocal
+
+        table = CrawledPageTable.__table__
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(table).where(table.c.table_name == self.table_name, table.c.source == source)
+            ).fetchall()
+        return {row.url: PageState(row.etag, row.last_modified, row.content_hash, row.links) for row in rows}
+
+    @staticmethod
+    def _conditional_headers(previous: Optional[PageState]) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if previous is not None:
+            if previous.etag:
+                headers["If-None-Match"] = previous.etag
+            if previous.last_modified:
+                headers["If-Modified-Since"] = previous.last_modified
+        return headers
+
+    def _links(self, soup: BeautifulSoup, url: str, primary_domain: str) -> List[str]:
+        links: List[str] = []
+        for link in soup.find_all("a", href=True):
+            if not isinstance(link, Tag):
+                continue
+            full_url = urljoin(url, str(link["href"]))
+            parsed_url = urlparse(full_url)
+            if parsed_url.netloc.endswith(primary_domain) and not parsed_url.path.endswith(SKIPPED_EXTENSIONS):
+                if full_url not in links:
+                    links.append(full_url)
+        return links
+
+    def crawl(self, url: str, starting_depth: int = 1) -> Dict[str, str]:
+        """Crawl a website like WebsiteReader and return the content of the pages that changed."""
+        self._source = url
+        self._previous = self._load(url)
+        self._crawled = {}
+        self.changed, self.unchanged, self.not_modified, self.removed = [], [], [], []
+
+        num_links = 0
+        crawler_result: Dict[str, str] = {}
+        primary_domain = self._get_primary_domain(url)
+        self._urls_to_crawl.append((url, starting_depth))
+        with httpx.Client(timeout=self.timeout, follow_redirects=True) as client:
+            while self._urls_to_crawl:
+                current_url, current_depth = self._urls_to_crawl.pop(0)
+                if (
+                    current_url in self._visited
+                    or not urlparse(current_url).netloc.endswith(primary_domain)
+                    or current_depth > self.max_depth
+                    or num_links >= self.max_links
+                ):
+                    continue
+                self._visited.add(current_url)
+                self.delay()
+
+                previous = self._previous.get(current_url)
+                content = ""
+                try:
+                    response = client.get(current_url, headers=self._conditional_headers(previous))
+                    if response.status_code in (404, 410):
+                        if previous is not None:
+                            self.removed.append(current_url)
+                        continue
+                    if response.status_code == 304 and previous is not None:
+                        state = previous
+                        self.not_modified.append(current_url)
+                    else:
+                        response.raise_for_status()
+                        soup = BeautifulSoup(response.content, "html.parser")
+                        content = self._extract_main_content(soup)
+                        state = PageState(
+                            etag=response.headers.get("etag"),
+                            last_modified=response.headers.get("last-modified"),
+                            content_hash=md5(content.encode()).hexdigest() if content else None,
+                            links=self._links(soup, current_url, primary_domain),
+                        )
+                except Exception as e:
+                    # The page is kept as it was, and crawled again next time
+                    logger.warning(f"Failed to crawl: {current_url}: {e}")
+                    continue
+
+                self._crawled[current_url] = state
+                if state.content_hash is not None:
+                    num_links += 1
+                    if previous is not None and previous.content_hash == state.content_hash:
+                        self.unchanged.append(current_url)
+                    else:
+                        self.changed.append(current_url)
+                        crawler_result[current_url] = content
+                for link in state.links:
+                    if link not in self._visited and (link, current_depth + 1) not in self._urls_to_crawl:
+                        self._urls_to_crawl.append((link, current_depth + 1))
+        return crawler_result
+
+    def commit(self, indexed: bool = True) -> None:
+        """Update the registry with the last crawl. If the changed pages were not indexed, they stay changed."""
+        from db.session import SessionLocal
+
+        if self._source is None:
+            return
+        table = CrawledPageTable.__table__
+        now = current_utc()
+        values = []
+        for url, state in self._crawled.items():
+            changed = url in self.changed
+            if changed and not indexed:
+                state = self._previous.get(url, PageState())
+            values.append(
+                dict(
+                    table_name=self.table_name,
+                    source=self._source,
+                    url=url,
+                    etag=state.etag,
+                    last_modified=state.last_modified,
+                    content_hash=state.content_hash,
+                    links=state.links,
+                    crawled_at=now,
+                    changed_at=now if (changed and indexed) or url not in self._previous else None,
+                )
+            )
+        with SessionLocal() as db, db.begin():
+            if values:
+                stmt = postgresql.insert(table).values(values)
+                db.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=["table_name", "source", "url"],
+                        set_=dict(
+                            etag=stmt.excluded.etag,
+                            last_modified=stmt.excluded.last_modified,
+                            content_hash=stmt.excluded.content_hash,
+                            links=stmt.excluded.links,
+                            crawled_at=stmt.excluded.crawled_at,
+                            # Only pages whose content changed get a new changed_at
+                            changed_at=func.coalesce(stmt.excluded.changed_at, table.c.changed_at),
+                        ),
+                    )
+                )
+            if self.removed:
+                db.execute(
+                    delete(table).where(
+                        table.c.table_name == self.table_name,
+                        table.c.source == self._source,
+                        table.c.url.in_(self.removed),
+                    )
+                )
+
+
+@dataclass
+class CrawlReport:
+    source: str
+    changed: int = 0
+    unchanged: int = 0
+    not_modified: int = 0
+    removed: int = 0
+    ingestion: Optional[IngestionReport] = None
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.source}: {self.changed} changed, {self.unchanged} unchanged ({self.not_modified} not modified)"
+            f" and {self.removed} removed pages"
+        ]
+        if self.ingestion is not None:
+            lines.append(str(self.ingestion))
+        return "\n".join(lines)
+
+
+def delete_page_chunks(pipeline: IngestionPipeline, urls: List[str], keep_ids: List[str]) -> int:
+    """Delete the chunks of pages, except the chunks in `keep_ids`. Returns the number of deleted chunks."""
+    table = pipeline.vector_db.table
+    with pipeline.vector_db.Session() as sess, sess.begin():
+        result = sess.execute(
+            delete(table).where(table.c.meta_data["url"].astext.in_(urls), table.c.id.not_in(keep_ids))
+        )
+    return result.rowcount
+
+
+def crawl_source(
+    pipeline: IngestionPipeline,
+    url: str,
+    max_links: int = DEFAULT_MAX_LINKS,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+    on_progress: Optional[Callable[[IngestionReport], None]] = None,
+) -> CrawlReport:
+    """
+    Crawl a website and index the pages that changed since the last crawl.
+
+    Args:
+        pipeline (IngestionPipeline): Pipeline of the knowledge base to index the pages in.
+        url (str): The url to start the crawl from, also identifies the website in the registry.
+        max_links (int): Pages with content to crawl at most.
+        max_depth (int): Links to follow from the url at most.
+        on_progress (Optional[Callable[[IngestionReport], None]]): Passed to the ingestion.
+
+    Returns:
+        CrawlReport: Pages by whether they changed, and the ingestion of the changed pages.
+    """
+    reader = IncrementalWebsiteReader(
+        table_name=pipeline.vector_db.table_name, max_links=max_links, max_depth=max_depth
+    )
+    documents = reader.read(url)
+    report = CrawlReport(
+        source=url,
+        changed=len(reader.changed),
+        unchanged=len(reader.unchanged),
+        not_modified=len(reader.not_modified),
+        removed=len(reader.removed),
+    )
+    # Chunks of changed pages are replaced, a page that got shorter leaves chunks with ids not written again
+    if reader.changed or reader.removed:
+        keep_ids = [document.id for document in documents if document.id is not None]
+        deleted = delete_page_chunks(pipeline, reader.changed + reader.removed, keep_ids)
+        logger.info(f"Deleted {deleted} chunks of changed and removed pages of {url}")
+    if documents:
+        report.ingestion = pipeline.ingest(documents, on_progress=on_progress, source=url)
+    indexed = report.ingestion is None or report.ingestion.failed == 0
+    reader.commit(indexed=indexed)
+    if indexed and (documents or reader.unchanged):
+        register_document(pipeline.vector_db, url, "website", changed=bool(reader.changed or reader.removed))
+    return report
+
+
+def refresh_sources(
+    pipeline: IngestionPipeline,
+    older_than: float = agent_settings.knowledge_recrawl_interval,
+    max_links: int = DEFAULT_MAX_LINKS,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+) -> List[CrawlReport]:
+    """Crawl the websites of the knowledge base that were not crawled for `older_than` seconds."""
+    from db.session import SessionLocal
+
+    table = CrawledPageTable.__table__
+    with SessionLocal() as db:
+        sources = list(
+            db.execute(
+                select(table.c.source)
+                .where(table.c.table_name == pipeline.vector_db.table_name)
+                .group_by(table.c.source)
+                .having(func.max(table.c.crawled_at) < current_utc() - timedelta(seconds=older_than))
+            ).scalars()
+        )
+    reports = []
+    for source in sources:
+        try:
+            reports.append(crawl_source(pipeline, source, max_links=max_links, max_depth=max_depth))
+        except Exception as e:
+            logger.error(f"Could not refresh {source}: {e}")
+    return reports
+
+
+def forget_sources(table_name: str) -> None:
+    """Remove the websites of a knowledge base from the registry, e.g. because the knowledge base was deleted."""
+    from db.session import SessionLocal
+
+    table = CrawledPageTable.__table__
+    with SessionLocal() as db, db.begin():
+        db.execute(delete(table).where(table.c.table_name == table_name))
+
+
+if __name__ == "__main__":
+    from agents.sage import get_sage_knowledge
+
+    parser = argparse.ArgumentParser(description="Add and refresh websites in the Sage knowledge base")
+    parser.add_argument("urls", nargs="*", help="Websites to crawl")
+    parser.add_argument("--refresh", action="store_true", help="Crawl the websites added before")
+    parser.add_argument(
+        "--older-than",
+        type=float,
+        default=agent_settings.knowledge_recrawl_interval,
+        help="Only refresh websites not crawled for this many seconds",
+    )
+    parser.add_argument("--interval", type=float, help="Keep refreshing, every this many seconds")
+    parser.add_argument("--max-links", type=int, default=DEFAULT_MAX_LINKS)
+    parser.add_argument("--max-depth", type=int, default=DEFAULT_MAX_DEPTH)
+    args = parser.parse_args()
+
+    sage_pipeline = IngestionPipeline(get_sage_knowledge().vector_db)  # type: ignore[arg-type]
+    for source_url in args.urls:
+        print(crawl_source(sage_pipeline, source_url, max_links=args.max_links, max_depth=args.max_depth))
+    while args.refresh:
+        for crawl_report in refresh_sources(sage_pipeline, args.older_than, args.max_links, args.max_depth):
+            print(crawl_report)
+        if args.interval is None:
+            break
+        time.sleep(args.interval)
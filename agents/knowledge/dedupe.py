@@ -0,0 +1,307 @@
+"""Near-duplicate chunks of knowledge bases.
+
+Crawled websites repeat their navigation and boilerplate on every page, and a document uploaded again under
+another name, or with small edits, repeats most of its text in chunks with other ids. The chunks are stored,
+embedded and indexed again, and a search returns several copies of the same text instead of other results.
+
+Ingestion drops new chunks that are near-duplicates of a chunk already in the knowledge table, or of a chunk
+read earlier in the same ingestion, before they are embedded:
+    - the content of a chunk is split into shingles of SHINGLE_WORDS words
+    - a MinHash signature of PERMUTATIONS hashes estimates the Jaccard similarity of the shingles of two
+      chunks, the share of hashes they have in common
+    - the signature is split into BANDS bands, chunks sharing a band are compared (locality sensitive
+      hashing), and a chunk is a duplicate when the similarity is at least KNOWLEDGE_DEDUPE_THRESHOLD
+Signatures of written chunks are kept in public.chunk_signatures, a signature is only used while its chunk
+is stored with the same content. The ingestion report counts the dropped chunks and the bytes they would have
+taken.
+
+Chunks are only compared with chunks of the same source. A dropped chunk is not stored, its source relies on
+the chunk it duplicates, and deleting another source (agents.knowledge.documents.delete_document) would
+remove content of this one. Chunks of a source that is being replaced are not compared either, the new version
+replaces them. Within a website, a chunk dropped as a duplicate of another page is only indexed again once
+its own page changes, if that other page is removed in the meantime.
+
+Chunks written before signatures were kept are compared with new chunks once they have a signature:
+    python -m agents.knowledge.dedupe backfill
+"""
+
+import argparse
+import zlib
+from hashlib import blake2b
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, cast
+
+import numpy as np
+from sqlalchemy import BigInteger, bindparam, delete, select
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from db.tables.chunk_signatures import ChunkSignatureTable
+from utils.log import logger
+
+if TYPE_CHECKING:
+    import psycopg
+    from agno.vectordb.pgvector import PgVector
+
+    from agents.knowledge.ingest import Chunk
+
+# Words per shingle, shorter chunks are one shingle
+SHINGLE_WORDS = 5
+# Hashes of a signature, in BANDS bands of PERMUTATIONS // BANDS hashes. With 32 bands of 4 hashes, chunks with
+# a similarity of 0.5 share a band with a probability of 87%, 0.8 with more than 99.9%.
+PERMUTATIONS = 128
+BANDS = 32
+# Largest 31 bit prime, the hashes of a permutation are (a * x + b) % MERSENNE_PRIME and fit in uint64
+MERSENNE_PRIME = (1 << 31) - 1
+# Seed of the permutations, stored signatures are not comparable with signatures of another seed
+SEED = 1
+# Chunks read per query by backfill
+BACKFILL_BATCH_SIZE = 1000
+
+SIGNATURE_COLUMNS = ("table_name", "chunk_id", "source", "content_hash", "signature", "bands")
+# Upserts the signatures of written chunks, with the cursor writing the chunks
+SIGNATURE_UPSERT = (
+    f"INSERT INTO {ChunkSignatureTable.__table__.fullname} ({', '.join(SIGNATURE_COLUMNS)})"
+    " VALUES (%s, %s, %s, %s, %s, %s::bigint[])"
+    " ON CONFLICT (table_name, chunk_id) DO UPDATE SET source = EXCLUDED.source,"
+    " content_hash = EXCLUDED.content_hash, signature = EXCLUDED.signature, bands = EXCLUDED.bands"
+)
+
+
+class MinHasher:
+    """Computes MinHash signatures of texts and the hashes of their bands. Signatures are equal across processes."""
+
+    def __init__(self, permutations: int = PERMUTATIONS, bands: int = BANDS, seed: int = SEED):
+        if permutations % bands:
+            raise ValueError(f"{permutations} permutations can not be split into {bands} bands")
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=permutations, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=permutations, dtype=np.uint64)
+        self.bands = bands
+        self.rows = permutations // bands
+
+    @staticmethod
+    def shingles(text: str) -> np.ndarray:
+        """Return the crc32 of the distinct shingles of a text, case and whitespace are ignored."""
+        words = text.lower().split()
+        grams = {" ".join(words[i : i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))}
+        return np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str) -> np.ndarray:
+        """Return the signature of a text, the smallest hash of its shingles for every permutation."""
+        shingles = self.shingles(text) % MERSENNE_PRIME
+        hashes = (np.outer(shingles, self.a) + self.b) % MERSENNE_PRIME
+        return hashes.min(axis=0).astype("<u4")
+
+    def band_hashes(self, signature: np.ndarray) -> List[int]:
+        """Return a signed 64 bit hash of every band of a signature, distinct for the same rows in another band."""
+        hashes = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows : (band + 1) * self.rows]
+            digest = blake2b(band.to_bytes(2, "little") + rows.tobytes(), digest_size=8).digest()
+            hashes.append(int.from_bytes(digest, "little", signed=True))
+        return hashes
+
+    @staticmethod
+    def similarity(signature: np.ndarray, other: np.ndarray) -> float:
+        """Estimate the Jaccard similarity of the shingles of two texts from their signatures."""
+        return float(np.count_nonzero(signature == other)) / len(signature)
+
+
+def sign(hasher: MinHasher, chunks: Iterable["Chunk"]) -> List[np.ndarray]:
+    """Set the signature and band hashes of chunks that do not have them. Returns the signatures of the chunks."""
+    signatures = []
+    for chunk in chunks:
+        signature = chunk.signature
+        if signature is None:
+            signature = chunk.signature = hasher.signature(chunk.content)
+            chunk.bands = hasher.band_hashes(signature)
+        signatures.append(signature)
+    return signatures
+
+
+def signature_rows(table_name: str, chunks: Iterable["Chunk"]) -> List[Tuple]:
+    """Return the parameters of SIGNATURE_UPSERT for the chunks with a signature."""
+    return [
+        (
+            table_name,
+            chunk.id,
+            chunk.meta_data.get("source"),
+            chunk.content_hash,
+            chunk.signature.tobytes(),
+            chunk.bands,
+        )
+        for chunk in chunks
+        if chunk.signature is not None
+    ]
+
+
+class Deduplicator:
+    """Finds near-duplicates among the chunks of one ingestion and the stored chunks of the same source.
+
+    Chunks that are not duplicates are remembered, the chunks of later windows are compared with them too.
+    If `replace` is set, the stored chunks of the source are about to be replaced and are not compared.
+    """
+
+    def __init__(
+        self,
+        vector_db: "PgVector",
+        threshold: float,
+        source: Optional[str] = None,
+        replace: bool = False,
+        hasher: Optional[MinHasher] = None,
+    ):
+        self.vector_db = vector_db
+        self.threshold = threshold
+        self.source = source
+        self.replace = replace
+        self.hasher = hasher or MinHasher()
+        # Band hash to the chunks of this ingestion with that band, by id
+        self._seen: Dict[int, List[Tuple[str, np.ndarray]]] = {}
+
+    def find(self, chunks: List["Chunk"]) -> Dict[str, str]:
+        """
+        Sign chunks and return the ids of the duplicates.
+
+        Args:
+            chunks (List[Chunk]): New and changed chunks, in the order they were read.
+
+        Returns:
+            Dict[str, str]: Id of every duplicate chunk to the id of the chunk it duplicates.
+        """
+        signatures = sign(self.hasher, chunks)
+        stored = self._stored(sorted({band for chunk in chunks for band in chunk.bands or ()}))
+        # Stored versions of the chunks are replaced by this ingestion
+        rewritten = {chunk.id for chunk in chunks}
+        stored = {
+            band: [(chunk_id, signature) for chunk_id, signature in candidates if chunk_id not in rewritten]
+            for band, candidates in stored.items()
+        }
+        duplicates: Dict[str, str] = {}
+        for chunk, signature in zip(chunks, signatures):
+            original = self._match(chunk, signature, stored)
+            if original is not None:
+                duplicates[chunk.id] = original
+                continue
+            for band in chunk.bands or ():
+                self._seen.setdefault(band, []).append((chunk.id, signature))
+        return duplicates
+
+    def _match(
+        self, chunk: "Chunk", signature: np.ndarray, stored: Dict[int, List[Tuple[str, np.ndarray]]]
+    ) -> Optional[str]:
+        compared = {chunk.id}
+        for band in chunk.bands or ():
+            for candidate_id, candidate in self._seen.get(band, []) + stored.get(band, []):
+                if candidate_id in compared:
+                    continue
+                compared.add(candidate_id)
+                if self.hasher.similarity(signature, candidate) >= self.threshold:
+                    return candidate_id
+        return None
+
+    def _stored(self, bands: List[int]) -> Dict[int, List[Tuple[str, np.ndarray]]]:
+        """Return the stored chunks of the source sharing a band with `bands`, by band."""
+        if not bands or self.replace:
+            return {}
+        signatures = ChunkSignatureTable.__table__
+        knowledge = self.vector_db.table
+        # Chunks that were deleted or changed since they were signed do not count
+        stmt = (
+            select(signatures.c.chunk_id, signatures.c.signature, signatures.c.bands)
+            .join(
+                knowledge,
+                (knowledge.c.id == signatures.c.chunk_id) & (knowledge.c.content_hash == signatures.c.content_hash),
+            )
+            .where(
+                signatures.c.table_name == self.vector_db.table_name,
+                signatures.c.source.is_not_distinct_from(self.source),
+                signatures.c.bands.overlap(bindparam("bands", bands, type_=ARRAY(BigInteger))),
+            )
+        )
+        wanted = set(bands)
+        stored: Dict[int, List[Tuple[str, np.ndarray]]] = {}
+        with self.vector_db.Session() as sess:
+            for row in sess.execute(stmt):
+                signature = np.frombuffer(row.signature, dtype="<u4")
+                for band in wanted.intersection(row.bands):
+                    stored.setdefault(band, []).append((row.chunk_id, signature))
+        return stored
+
+
+def forget_signatures(table_name: str) -> None:
+    """Delete the signatures of the chunks of a knowledge table."""
+    from db.session import SessionLocal
+
+    signatures = ChunkSignatureTable.__table__
+    with SessionLocal() as db, db.begin():
+        db.execute(delete(signatures).where(signatures.c.table_name == table_name))
+
+
+def backfill_signatures(vector_db: "PgVector", batch_size: int = BACKFILL_BATCH_SIZE) -> Tuple[int, int]:
+    """
+    Sign the chunks of a knowledge table without a current signature and delete signatures of deleted chunks.
+
+    Returns:
+        Tuple[int, int]: Signed chunks and deleted signatures.
+    """
+    from agents.knowledge.ingest import Chunk
+
+    signatures = ChunkSignatureTable.__table__
+    knowledge = vector_db.table
+    hasher = MinHasher()
+    current = (
+        select(signatures.c.chunk_id)
+        .where(
+            signatures.c.table_name == vector_db.table_name,
+            signatures.c.chunk_id == knowledge.c.id,
+            signatures.c.content_hash == knowledge.c.content_hash,
+        )
+        .exists()
+    )
+    signed = 0
+    last_id = ""
+    while True:
+        # Keyset pagination, chunks signed by a batch are written before the next one is read
+        with vector_db.Session() as sess:
+            rows = sess.execute(
+                select(knowledge.c.id, knowledge.c.meta_data, knowledge.c.content, knowledge.c.content_hash)
+                .where(knowledge.c.id > last_id, ~current)
+                .order_by(knowledge.c.id)
+                .limit(batch_size)
+            ).fetchall()
+        if not rows:
+            break
+        chunks = [Chunk(row.id, None, row.meta_data or {}, row.content, row.content_hash) for row in rows]
+        sign(hasher, chunks)
+        connection = vector_db.db_engine.raw_connection()
+        driver_connection = cast("psycopg.Connection", connection.driver_connection)
+        try:
+            with driver_connection.cursor() as cursor:
+                cursor.executemany(SIGNATURE_UPSERT, signature_rows(vector_db.table_name, chunks))
+            driver_connection.commit()
+        finally:
+            connection.close()
+        signed += len(chunks)
+        last_id = rows[-1].id
+        logger.info(f"Signed {signed} chunks of {vector_db.table_name}")
+
+    with vector_db.Session() as sess, sess.begin():
+        result = sess.execute(
+            delete(signatures).where(
+                signatures.c.table_name == vector_db.table_name,
+                ~select(knowledge.c.id).where(knowledge.c.id == signatures.c.chunk_id).exists(),
+            )
+        )
+    return signed, result.rowcount
+
+
+if __name__ == "__main__":
+    from agents.sage import get_sage_knowledge
+
+    parser = argparse.ArgumentParser(description="Keep MinHash signatures of the Sage knowledge base")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    sage_vector_db: "PgVector" = get_sage_knowledge().vector_db  # type: ignore[assignment]
+    signed_chunks, deleted_signatures = backfill_signatures(sage_vector_db, batch_size=args.batch_size)
+    print(f"Signed {signed_chunks} chunks, deleted {deleted_signatures} signatures of deleted chunks")
@@ -0,0 +1,210 @@
+"""Documents of a knowledge base, keyed by their source.
+
+AgentKnowledge.delete empties the whole knowledge table, so dropping or updating one document meant
+ingesting every other document again. Every chunk now records its source in meta_data["source"], the file
+name of an uploaded document or the url a website is crawled from, and public.knowledge_documents lists
+the sources of every knowledge table with their version and number of chunks:
+    - replace_document ingests a new version of a file, unchanged chunks are kept, changed chunks are
+      upserted and chunks the new version no longer has are deleted. A file with the same content is skipped.
+    - delete_document deletes the chunks of one source, and forgets the pages of a website
+Other documents and the vector index are not touched, searches keep using the warm index. Chunks ingested
+before sources were recorded get their source when the document is added again.
+
+Documents are listed and deleted with:
+    python -m agents.knowledge.documents list
+    python -m agents.knowledge.documents delete manual.pdf
+"""
+
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import md5
+from typing import TYPE_CHECKING, Callable, Iterable, List, Optional, Set
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.dialects import postgresql
+
+from db.tables.chunk_signatures import ChunkSignatureTable
+from db.tables.crawled_pages import CrawledPageTable
+from db.tables.knowledge_documents import KnowledgeDocumentTable
+from utils.log import logger
+
+if TYPE_CHECKING:
+    from agno.document import Document
+    from agno.vectordb.pgvector import PgVector
+
+    from agents.knowledge.ingest import IngestionPipeline, IngestionReport
+
+# Knowledge tables with an index on the source of their chunks, created once per process
+_source_indexes: Set[str] = set()
+
+
+def create_source_index(vector_db: "PgVector") -> None:
+    """Index the source of the chunks of a knowledge table, for listing and deleting documents."""
+    from agents.knowledge.index import _execute_autocommit
+
+    if vector_db.table.fullname in _source_indexes:
+        return
+    _execute_autocommit(
+        vector_db,
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{vector_db.table_name}_source_index"'
+        f" ON {vector_db.table.fullname} ((meta_data->>'source'))",
+    )
+    _source_indexes.add(vector_db.table.fullname)
+
+
+def file_hash(path: str) -> str:
+    """Return the md5 of a file, read in blocks."""
+    digest = md5()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class KnowledgeDocument:
+    source: str
+    kind: str
+    version: int
+    chunks: int
+    updated_at: datetime
+
+    def __str__(self) -> str:
+        updated = f"{self.updated_at:%Y-%m-%d %H:%M}"
+        return f"{self.source} ({self.kind}): version {self.version}, {self.chunks} chunks, updated {updated}"
+
+
+def list_documents(vector_db: "PgVector") -> List[KnowledgeDocument]:
+    """Return the documents of a knowledge base, most recently updated first."""
+    from db.session import SessionLocal
+
+    table = KnowledgeDocumentTable.__table__
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(table.c.source, table.c.kind, table.c.version, table.c.chunks, table.c.updated_at)
+            .where(table.c.table_name == vector_db.table_name)
+            .order_by(table.c.updated_at.desc())
+        ).fetchall()
+    return [KnowledgeDocument(row.source, row.kind, row.version, row.chunks, row.updated_at) for row in rows]
+
+
+def get_document_hash(vector_db: "PgVector", source: str) -> Optional[str]:
+    from db.session import SessionLocal
+
+    table = KnowledgeDocumentTable.__table__
+    with SessionLocal() as db:
+        return db.scalar(
+            select(table.c.content_hash).where(table.c.table_name == vector_db.table_name, table.c.source == source)
+        )
+
+
+def register_document(
+    vector_db: "PgVector", source: str, kind: str, content_hash: Optional[str] = None, changed: bool = True
+) -> None:
+    """Add a document to the registry, or count its chunks again and increment its version if it changed."""
+    from db.session import SessionLocal
+
+    table = KnowledgeDocumentTable.__table__
+    knowledge = vector_db.table
+    with vector_db.Session() as sess:
+        chunks = sess.scalar(
+            select(func.count()).select_from(knowledge).where(knowledge.c.meta_data["source"].astext == source)
+        )
+    stmt = postgresql.insert(table).values(
+        table_name=vector_db.table_name, source=source, kind=kind, content_hash=content_hash, chunks=chunks
+    )
+    updates = {"chunks": stmt.excluded.chunks, "content_hash": stmt.excluded.content_hash, "updated_at": func.now()}
+    if changed:
+        updates["version"] = table.c.version + 1
+    with SessionLocal() as db, db.begin():
+        db.execute(stmt.on_conflict_do_update(index_elements=[table.c.table_name, table.c.source], set_=updates))
+
+
+def replace_document(
+    pipeline: "IngestionPipeline",
+    source: str,
+    documents: Iterable["Document"],
+    content_hash: Optional[str] = None,
+    on_progress: Optional[Callable[["IngestionReport"], None]] = None,
+) -> Optional["IngestionReport"]:
+    """
+    Add a file to a knowledge base, or replace the previous version of the file.
+
+    Args:
+        pipeline (IngestionPipeline): Pipeline of the knowledge base.
+        source (str): The file name, identifies the document in the knowledge base.
+        documents (Iterable[Document]): All chunks of the file.
+        content_hash (Optional[str]): md5 of the file, the file is skipped if the current version has the same.
+        on_progress (Optional[Callable[[IngestionReport], None]]): Passed to the ingestion.
+
+    Returns:
+        Optional[IngestionReport]: The ingestion, None if the file did not change.
+    """
+    vector_db = pipeline.vector_db
+    if content_hash is not None and get_document_hash(vector_db, source) == content_hash:
+        logger.info(f"{source} did not change since it was added to {vector_db.table_name}")
+        return None
+    report = pipeline.ingest(documents, on_progress=on_progress, source=source, replace=True)
+    if report.chunks and not report.failed:
+        register_document(vector_db, source, "file", content_hash, changed=bool(report.written or report.deleted))
+    return report
+
+
+def delete_document(vector_db: "PgVector", source: str) -> int:
+    """Delete the chunks of a document, and forget the pages of a website. Returns the number of deleted chunks."""
+    from db.session import SessionLocal
+
+    knowledge = vector_db.table
+    pages = CrawledPageTable.__table__
+    registry = KnowledgeDocumentTable.__table__
+    signatures = ChunkSignatureTable.__table__
+    # Pages crawled before sources were recorded only have their url
+    page_urls = select(pages.c.url).where(pages.c.table_name == vector_db.table_name, pages.c.source == source)
+    with vector_db.Session() as sess, sess.begin():
+        result = sess.execute(
+            delete(knowledge).where(
+                or_(
+                    knowledge.c.meta_data["source"].astext == source,
+                    knowledge.c.meta_data["url"].astext.in_(page_urls),
+                )
+            )
+        )
+    with SessionLocal() as db, db.begin():
+        db.execute(delete(pages).where(pages.c.table_name == vector_db.table_name, pages.c.source == source))
+        db.execute(delete(registry).where(registry.c.table_name == vector_db.table_name, registry.c.source == source))
+        db.execute(
+            delete(signatures).where(signatures.c.table_name == vector_db.table_name, signatures.c.source == source)
+        )
+    logger.info(f"Deleted {result.rowcount} chunks of {source} from {vector_db.table_name}")
+    return result.rowcount
+
+
+def delete_all_documents(vector_db: "PgVector") -> None:
+    """Empty a knowledge base and its registries."""
+    from agents.knowledge.crawl import forget_sources
+    from agents.knowledge.dedupe import forget_signatures
+    from db.session import SessionLocal
+
+    registry = KnowledgeDocumentTable.__table__
+    vector_db.delete()
+    forget_sources(vector_db.table_name)
+    forget_signatures(vector_db.table_name)
+    with SessionLocal() as db, db.begin():
+        db.execute(delete(registry).where(registry.c.table_name == vector_db.table_name))
+
+
+if __name__ == "__main__":
+    from agents.sage import get_sage_knowledge
+
+    parser = argparse.ArgumentParser(description="List and delete documents of the Sage knowledge base")
+    parser.add_argument("command", choices=["list", "delete"])
+    parser.add_argument("sources", nargs="*", help="File names or website urls to delete")
+    args = parser.parse_args()
+
+    sage_vector_db: "PgVector" = get_sage_knowledge().vector_db  # type: ignore[assignment]
+    if args.command == "delete":
+        for document_source in args.sources:
+            print(f"Deleted {delete_document(sage_vector_db, document_source)} chunks of {document_source}")
+    for document in list_documents(sage_vector_db):
+        print(document)
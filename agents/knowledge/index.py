@@ -0,0 +1,219 @@
+"""Approximate nearest neighbour indexes of knowledge tables.
+
+PgVector only creates a vector index when `optimize()` is called, which the app never does, so every
+search scans the whole knowledge table. The index is created and tuned with:
+    python -m agents.knowledge.index status
+    python -m agents.knowledge.index create --type hnsw --m 16 --ef-construction 64
+    python -m agents.knowledge.index create --type ivfflat --lists 300 --replace
+    python -m agents.knowledge.index drop
+
+Indexes are built concurrently, so searches and ingestion continue. With --replace the new index is built
+next to the existing one and swapped in when it is ready. Search time parameters (hnsw.ef_search,
+ivfflat.probes) are set per query from the agent settings. benchmarks.knowledge_index measures recall and
+latency of index configurations.
+
+Only vector search uses the index. Hybrid search, the default of Sage, ranks every chunk by a combination
+of vector and text score and always scans the table, set KNOWLEDGE_SEARCH_TYPE=vector to use the index.
+"""
+
+import argparse
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Optional, Union
+
+from agno.vectordb.distance import Distance
+from agno.vectordb.pgvector.index import HNSW, Ivfflat
+from sqlalchemy import text
+
+from agents.knowledge.quantization import QUANTIZATIONS, QuantizedPgVector, get_quantized_index_expression
+from agents.settings import agent_settings
+from utils.log import logger
+
+if TYPE_CHECKING:
+    from agno.vectordb.pgvector import PgVector
+
+INDEX_TYPES = ("hnsw", "ivfflat")
+OPERATOR_CLASSES = {
+    Distance.cosine: "vector_cosine_ops",
+    Distance.l2: "vector_l2_ops",
+    Distance.max_inner_product: "vector_ip_ops",
+}
+
+
+def get_vector_index(index_type: str = agent_settings.knowledge_index_type) -> Union[HNSW, Ivfflat]:
+    """Return the index configuration of the knowledge tables, from the agent settings."""
+    if index_type == "ivfflat":
+        return Ivfflat(lists=agent_settings.knowledge_ivfflat_lists, probes=agent_settings.knowledge_ivfflat_probes)
+    if index_type == "hnsw":
+        return HNSW(
+            m=agent_settings.knowledge_hnsw_m,
+            ef_construction=agent_settings.knowledge_hnsw_ef_construction,
+            ef_search=agent_settings.knowledge_hnsw_ef_search,
+        )
+    raise ValueError(f"Unknown index type: {index_type}, expected one of {INDEX_TYPES}")
+
+
+def get_quantization(vector_db: "PgVector") -> Optional[str]:
+    # Set for a QuantizedPgVector, see agents.knowledge.quantization
+    return getattr(vector_db, "quantization", None)
+
+
+def get_index_name(vector_db: "PgVector", index_type: str) -> str:
+    # Same name as PgVector.optimize without quantization, so both see the index
+    quantization = get_quantization(vector_db)
+    if quantization is not None:
+        return f"{vector_db.table_name}_{index_type}_{quantization}_index"
+    return f"{vector_db.table_name}_{index_type}_index"
+
+
+def default_lists(rows: int) -> int:
+    """Number of IVFFlat lists recommended by pgvector for a number of rows."""
+    return max(rows // 1000 if rows < 1_000_000 else int(math.sqrt(rows)), 1)
+
+
+def get_index_sql(vector_db: "PgVector", index: Union[HNSW, Ivfflat], name: str, rows: int = 0) -> str:
+    """Return the CREATE INDEX statement of a vector index, on quantized embeddings for a QuantizedPgVector."""
+    quantization = get_quantization(vector_db)
+    if quantization is not None:
+        dimensions = int(vector_db.dimensions or 0)
+        key = get_quantized_index_expression(quantization, dimensions, vector_db.distance)
+    else:
+        key = f"embedding {OPERATOR_CLASSES.get(vector_db.distance, 'vector_cosine_ops')}"
+    if isinstance(index, HNSW):
+        method = "hnsw"
+        options = f"m = {int(index.m)}, ef_construction = {int(index.ef_construction)}"
+    else:
+        method = "ivfflat"
+        lists = index.lists if index.lists > 0 else default_lists(rows)
+        options = f"lists = {int(lists)}"
+    return (
+        f'CREATE INDEX CONCURRENTLY "{name}" ON {vector_db.table.fullname} '
+        f"USING {method} ({key}) WITH ({options})"
+    )
+
+
+@dataclass
+class IndexStatus:
+    name: str
+    definition: str
+    size_bytes: int
+    valid: bool
+
+    def __str__(self) -> str:
+        state = "" if self.valid else " (INVALID, being built or a build failed)"
+        return f"{self.name}: {self.size_bytes / 1e6:.1f} MB{state}\n  {self.definition}"
+
+
+def get_index_status(vector_db: "PgVector") -> List[IndexStatus]:
+    """Return the vector indexes of the knowledge table."""
+    with vector_db.Session() as sess:
+        rows = sess.execute(
+            text(
+                "SELECT c.relname AS name, pg_get_indexdef(i.indexrelid) AS definition,"
+                " pg_relation_size(i.indexrelid) AS size_bytes, i.indisvalid AS valid"
+                " FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid JOIN pg_am a ON a.oid = c.relam"
+                " WHERE i.indrelid = to_regclass(:table) AND a.amname IN ('hnsw', 'ivfflat')"
+                " ORDER BY c.relname"
+            ),
+            {"table": vector_db.table.fullname},
+        ).fetchall()
+    return [IndexStatus(row.name, row.definition, row.size_bytes, row.valid) for row in rows]
+
+
+def _execute_autocommit(vector_db: "PgVector", *statements: str, maintenance_work_mem: Optional[str] = None) -> None:
+    # CREATE INDEX CONCURRENTLY can't run in a transaction
+    with vector_db.db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if maintenance_work_mem:
+            connection.execute(
+                text("SELECT set_config('maintenance_work_mem', :value, false)"), {"value": maintenance_work_mem}
+            )
+        for statement in statements:
+            connection.execute(text(statement))
+
+
+def create_index(
+    vector_db: "PgVector",
+    index: Union[HNSW, Ivfflat],
+    replace: bool = False,
+    maintenance_work_mem: str = agent_settings.knowledge_index_maintenance_work_mem,
+) -> str:
+    """
+    Create the vector index of a knowledge table.
+
+    Args:
+        vector_db (PgVector): The knowledge base.
+        index (Union[HNSW, Ivfflat]): Index type and build parameters, IVFFlat lists <= 0 are set from the row count.
+        replace (bool): Replace existing vector indexes, the new index is built before they are dropped.
+        maintenance_work_mem (str): Memory for the build, builds are much faster when the index fits.
+
+    Returns:
+        str: The name of the index.
+    """
+    index_type = "hnsw" if isinstance(index, HNSW) else "ivfflat"
+    name = get_index_name(vector_db, index_type)
+    existing = get_index_status(vector_db)
+    if existing and not replace:
+        raise ValueError(f"{vector_db.table.fullname} already has a vector index, use replace to rebuild it")
+
+    rows = 0
+    if isinstance(index, Ivfflat) and index.lists <= 0:
+        rows = vector_db.get_count()
+    build_name = f"{name}_new" if any(status.name == name for status in existing) else name
+    logger.info(f"Building {index_type} index {build_name} on {vector_db.table.fullname}")
+    _execute_autocommit(
+        vector_db,
+        f'DROP INDEX CONCURRENTLY IF EXISTS "{vector_db.schema}"."{build_name}"',
+        get_index_sql(vector_db, index, build_name, rows),
+        maintenance_work_mem=maintenance_work_mem,
+    )
+    # Swap the new index in, searches use the old index until it is dropped
+    for status in existing:
+        if status.name != build_name:
+            _execute_autocommit(vector_db, f'DROP INDEX CONCURRENTLY IF EXISTS "{vector_db.schema}"."{status.name}"')
+    if build_name != name:
+        _execute_autocommit(vector_db, f'ALTER INDEX "{vector_db.schema}"."{build_name}" RENAME TO "{name}"')
+    _execute_autocommit(vector_db, f"ANALYZE {vector_db.table.fullname}")
+    return name
+
+
+def drop_index(vector_db: "PgVector") -> List[str]:
+    """Drop the vector indexes of a knowledge table. Returns their names."""
+    names = [status.name for status in get_index_status(vector_db)]
+    for name in names:
+        _execute_autocommit(vector_db, f'DROP INDEX CONCURRENTLY IF EXISTS "{vector_db.schema}"."{name}"')
+    return names
+
+
+if __name__ == "__main__":
+    from agents.sage import get_sage_knowledge
+
+    parser = argparse.ArgumentParser(description="Manage the vector index of the Sage knowledge base")
+    parser.add_argument("command", choices=["status", "create", "drop"])
+    parser.add_argument("--type", choices=INDEX_TYPES, default=agent_settings.knowledge_index_type)
+    parser.add_argument("--m", type=int, default=agent_settings.knowledge_hnsw_m, help="HNSW connections per node")
+    parser.add_argument("--ef-construction", type=int, default=agent_settings.knowledge_hnsw_ef_construction)
+    parser.add_argument(
+        "--lists", type=int, default=agent_settings.knowledge_ivfflat_lists, help="IVFFlat lists, 0 from the row count"
+    )
+    parser.add_argument(
+        "--quantization",
+        choices=["none", *QUANTIZATIONS],
+        default=agent_settings.knowledge_quantization or "none",
+        help="Index quantized embeddings, must match KNOWLEDGE_QUANTIZATION",
+    )
+    parser.add_argument("--replace", action="store_true", help="Rebuild an existing index")
+    parser.add_argument("--maintenance-work-mem", default=agent_settings.knowledge_index_maintenance_work_mem)
+    args = parser.parse_args()
+
+    sage_vector_db: QuantizedPgVector = get_sage_knowledge().vector_db  # type: ignore[assignment]
+    sage_vector_db.quantization = None if args.quantization == "none" else args.quantization
+    if args.command == "create":
+        vector_index: Union[HNSW, Ivfflat] = (
+            HNSW(m=args.m, ef_construction=args.ef_construction) if args.type == "hnsw" else Ivfflat(lists=args.lists)
+        )
+        print(f"Created {create_index(sage_vector_db, vector_index, args.replace, args.maintenance_work_mem)}")
+    elif args.command == "drop":
+        print(f"Dropped {', '.join(drop_index(sage_vector_db)) or 'nothing'}")
+    for index_status in get_index_status(sage_vector_db):
+        print(index_status)
+    print(f"{sage_vector_db.get_count()} chunks, search type {agent_settings.knowledge_search_type}")
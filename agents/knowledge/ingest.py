@@ -0,0 +1,561 @@
+"""Ingestion of documents into a knowledge base.
+
+`AgentKnowledge.load_documents` embeds chunks one request at a time and inserts them in small batches,
+so loading a long document into the Sage knowledge base takes minutes. The ingestion pipeline:
+    1. reads chunks `window_size` at a time, from a DocumentStream while the file is parsed, so memory
+       stays bounded for long documents, see agents.knowledge.streaming
+    2. skips chunks that are already in the knowledge table with the same content, and drops chunks that
+       are near-duplicates of other chunks of the source, see agents.knowledge.dedupe
+    3. embeds the remaining chunks `batch_size` per request, with `concurrency` requests in flight
+    4. writes embedded chunks with COPY into a staging table and upserts them from there
+
+Embeddings are also kept in public.embedding_cache by model and content hash. Chunks whose content was
+embedded before, e.g. because a document moved to another page or was deleted and added again, reuse the
+cached embedding, and chunks with the same content are embedded once.
+
+Every write is committed on its own. When an ingestion fails half way, running it again only embeds the
+chunks that were not written, so it resumes where it stopped. Chunks get the same ids and content hashes
+as with PgVector.upsert, both ways of loading documents can be mixed.
+
+Documents are ingested with the commands below, a file replaces the previous version of the file with the
+same name, see agents.knowledge.documents:
+    python -m agents.knowledge.ingest docs/manual.pdf https://docs.agno.com
+    python -m agents.knowledge.ingest notes.txt --batch-size 128 --concurrency 8
+"""
+
+import argparse
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from hashlib import md5
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, cast
+
+from sqlalchemy import String, bindparam, delete, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from agents.settings import agent_settings
+from db.tables.embedding_cache import EmbeddingCacheTable
+from utils.log import logger
+from utils.metrics import metrics_registry
+
+if TYPE_CHECKING:
+    import numpy as np
+    import psycopg
+    from agno.document import Document
+    from agno.document.reader import Reader
+    from agno.vectordb.pgvector import PgVector
+
+    from agents.knowledge.dedupe import Deduplicator
+    from agents.knowledge.streaming import DocumentStream
+
+knowledge_chunks_total = metrics_registry.counter(
+    "knowledge_chunks_total",
+    "Chunks handled by knowledge ingestion by result (written, skipped when unchanged, duplicate, failed).",
+    ["table", "result"],
+)
+knowledge_embedding_cache_total = metrics_registry.counter(
+    "knowledge_embedding_cache_total",
+    "Embedding cache lookups of changed chunks by result (hit or miss).",
+    ["table", "result"],
+)
+knowledge_embedding_duration = metrics_registry.histogram(
+    "knowledge_embedding_seconds",
+    "Time of an embedding request for a batch of chunks, including retries.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+knowledge_write_duration = metrics_registry.histogram(
+    "knowledge_write_seconds",
+    "Time to write a batch of embedded chunks to a knowledge table.",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+# Columns of the PgVector table written by the pipeline, created_at and updated_at are set by the database
+COPY_COLUMNS = ("id", "name", "meta_data", "filters", "content", "embedding", "usage", "content_hash")
+# Ids looked up per query when checking which chunks are already ingested
+LOOKUP_BATCH_SIZE = 1000
+
+
+def get_reader(source: str) -> Optional["Reader"]:
+    """Return the reader for a url or a file name, None if the file type is not supported."""
+    from agno.document.reader.csv_reader import CSVReader
+    from agno.document.reader.docx_reader import DocxReader
+    from agno.document.reader.pdf_reader import PDFReader
+    from agno.document.reader.text_reader import TextReader
+    from agno.document.reader.website_reader import WebsiteReader
+
+    if source.startswith(("http://", "https://")):
+        return WebsiteReader(max_links=2, max_depth=1)
+    file_type = source.rsplit(".", 1)[-1].lower()
+    readers: Dict[str, Callable[[], "Reader"]] = {
+        "pdf": PDFReader,
+        "csv": CSVReader,
+        "txt": TextReader,
+        "docx": DocxReader,
+    }
+    reader = readers.get(file_type)
+    return reader() if reader is not None else None
+
+
+@dataclass
+class Chunk:
+    id: str
+    name: Optional[str]
+    meta_data: Dict[str, Any]
+    content: str
+    content_hash: str
+    embedding: Optional[List[float]] = None
+    # MinHash signature and band hashes, set when near-duplicates are dropped
+    signature: Optional["np.ndarray"] = None
+    bands: Optional[List[int]] = None
+
+
+@dataclass
+class IngestionReport:
+    table: str
+    documents: int = 0
+    chunks: int = 0
+    # Chunks stored with the same content
+    skipped: int = 0
+    # Chunks with an embedding from the embedding cache
+    cached: int = 0
+    # Chunks sent to the embedding api
+    embedded: int = 0
+    # Near-duplicates of other chunks, not embedded or written, and the bytes of their content and embedding
+    duplicates: int = 0
+    duplicate_bytes: int = 0
+    written: int = 0
+    failed: int = 0
+    # Chunks of an earlier version of the source that the new version no longer has
+    deleted: int = 0
+    embedding_requests: int = 0
+    seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def chunks_per_second(self) -> float:
+        """Chunks embedded and written per second."""
+        return self.written / self.seconds if self.seconds else 0.0
+
+    @property
+    def skip_ratio(self) -> float:
+        """Share of the chunks that did not have to be embedded."""
+        return 1 - self.embedded / self.chunks if self.chunks else 0.0
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.table}: wrote {self.written} of {self.chunks} chunks from {self.documents} documents"
+            f" in {self.seconds:.1f}s ({self.chunks_per_second:.1f} chunks/s)",
+            f"  embedded {self.embedded} chunks in {self.embedding_requests} requests, {self.skip_ratio:.0%} skipped:"
+            f" {self.skipped} unchanged, {self.cached} from the embedding cache",
+        ]
+        if self.duplicates:
+            lines.append(
+                f"  dropped {self.duplicates} near-duplicate chunks, saved {self.duplicate_bytes / 1024:.1f} KB"
+            )
+        if self.deleted:
+            lines.append(f"  deleted {self.deleted} chunks of the previous version")
+        if self.failed:
+            lines.append(f"  failed {self.failed} chunks, ingest again to retry them")
+        lines.extend(f"  error: {error}" for error in self.errors)
+        return "\n".join(lines)
+
+
+class IngestionPipeline:
+    """Embeds and writes documents to the table of a PgVector knowledge base, in batches."""
+
+    def __init__(
+        self,
+        vector_db: "PgVector",
+        batch_size: int = agent_settings.knowledge_embedding_batch_size,
+        concurrency: int = agent_settings.knowledge_embedding_concurrency,
+        write_batch_size: int = agent_settings.knowledge_write_batch_size,
+        max_attempts: int = 3,
+        embedding_cache: bool = agent_settings.knowledge_embedding_cache,
+        window_size: int = agent_settings.knowledge_ingest_window,
+        dedupe_threshold: float = agent_settings.knowledge_dedupe_threshold,
+    ):
+        self.vector_db = vector_db
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.write_batch_size = write_batch_size
+        self.max_attempts = max_attempts
+        self.embedding_cache = embedding_cache
+        self.window_size = max(window_size, 1)
+        self.dedupe_threshold = dedupe_threshold
+
+    @property
+    def embedding_model(self) -> str:
+        """Key of the embedder in the embedding cache."""
+        embedder = self.vector_db.embedder
+        return f"{getattr(embedder, 'id', type(embedder).__name__)}:{embedder.dimensions}"
+
+    def read(self, source: Any, reader: Optional["Reader"] = None) -> "DocumentStream":
+        """Return the chunks of a file, an uploaded file or a url, parsed while they are ingested."""
+        from agents.knowledge.streaming import DocumentStream
+
+        return DocumentStream(source, reader)
+
+    def ingest(
+        self,
+        documents: Iterable["Document"],
+        filters: Optional[Dict[str, Any]] = None,
+        on_progress: Optional[Callable[[IngestionReport], None]] = None,
+        source: Optional[str] = None,
+        replace: bool = False,
+    ) -> IngestionReport:
+        """
+        Embed and write chunked documents to the knowledge table.
+
+        Args:
+            documents (Iterable[Document]): Chunked documents, from an agno reader or a DocumentStream.
+            filters (Optional[Dict[str, Any]]): Filters stored with every chunk.
+            on_progress (Optional[Callable[[IngestionReport], None]]): Called in the calling thread after every write
+                and window.
+            source (Optional[str]): Stored as meta_data["source"] of every chunk, see agents.knowledge.documents.
+            replace (bool): The documents are all chunks of the source, chunks of the source that are not among
+                them are deleted once every chunk was written.
+
+        Returns:
+            IngestionReport: Counts of the chunks and the throughput.
+        """
+        from agents.knowledge.dedupe import Deduplicator
+        from agents.knowledge.documents import create_source_index
+
+        started_at = perf_counter()
+        report = IngestionReport(table=self.vector_db.table_name)
+        self.vector_db.create()
+        if source is not None:
+            create_source_index(self.vector_db)
+
+        names: Set[Optional[str]] = set()
+        ids: Set[str] = set()
+        dedupe = (
+            Deduplicator(self.vector_db, self.dedupe_threshold, source=source, replace=replace)
+            if self.dedupe_threshold > 0
+            else None
+        )
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="knowledge-embed") as executor:
+            for chunks in self._windows(documents, names, source):
+                report.documents = len(names)
+                report.chunks += len(chunks)
+                if replace:
+                    ids.update(chunks)
+                self._ingest_window(chunks, executor, filters, report, started_at, on_progress, source, dedupe)
+        # A document that could not be read or written keeps its previous version
+        if replace and source is not None and report.chunks and not report.failed:
+            report.deleted = self._delete_stale(source, ids)
+
+        report.seconds = perf_counter() - started_at
+        logger.info(str(report))
+        return report
+
+    def _windows(
+        self, documents: Iterable["Document"], names: Set[Optional[str]], source: Optional[str]
+    ) -> Iterator[Dict[str, Chunk]]:
+        """Yield the chunks of the documents `window_size` at a time, as they are read."""
+        chunks: Dict[str, Chunk] = {}
+        for document in documents:
+            names.add(document.name)
+            content = self.vector_db._clean_content(document.content)
+            content_hash = md5(content.encode()).hexdigest()
+            chunk_id = document.id or content_hash
+            meta_data = {**document.meta_data, "source": source} if source is not None else document.meta_data
+            # The last chunk with an id wins, as with PgVector.upsert
+            chunks[chunk_id] = Chunk(chunk_id, document.name, meta_data, content, content_hash)
+            if len(chunks) >= self.window_size:
+                yield chunks
+                chunks = {}
+        if chunks:
+            yield chunks
+
+    def _ingest_window(
+        self,
+        chunks: Dict[str, Chunk],
+        executor: ThreadPoolExecutor,
+        filters: Optional[Dict[str, Any]],
+        report: IngestionReport,
+        started_at: float,
+        on_progress: Optional[Callable[[IngestionReport], None]],
+        source: Optional[str],
+        dedupe: Optional["Deduplicator"] = None,
+    ) -> None:
+        unchanged = self._unchanged(chunks.values())
+        report.skipped += len(unchanged)
+        knowledge_chunks_total.inc(len(unchanged), table=report.table, result="skipped")
+        if source is not None and unchanged:
+            self._set_source(unchanged, source)
+        changed = [chunk for chunk in chunks.values() if chunk.id not in unchanged]
+        if dedupe is not None and changed:
+            duplicates = dedupe.find(changed)
+            if duplicates:
+                self._drop_duplicates([chunk for chunk in changed if chunk.id in duplicates], report)
+                changed = [chunk for chunk in changed if chunk.id not in duplicates]
+        # Chunks with the same content are embedded once
+        pending: Dict[str, List[Chunk]] = {}
+        for chunk in changed:
+            pending.setdefault(chunk.content_hash, []).append(chunk)
+
+        embedded: List[Chunk] = []
+        if self.embedding_cache and pending:
+            for content_hash, embedding in self._cached_embeddings(list(pending)).items():
+                for chunk in pending.pop(content_hash):
+                    chunk.embedding = embedding
+                    embedded.append(chunk)
+            report.cached += len(embedded)
+            knowledge_embedding_cache_total.inc(len(embedded), table=report.table, result="hit")
+            knowledge_embedding_cache_total.inc(len(pending), table=report.table, result="miss")
+
+        to_embed = [same[0] for same in pending.values()]
+        batches = deque(to_embed[i : i + self.batch_size] for i in range(0, len(to_embed), self.batch_size))
+        in_flight: Dict[Future, List[Chunk]] = {}
+        reported = False
+        while batches or in_flight or embedded:
+            # Keep `concurrency` requests in flight, and write while the next batches are embedded
+            while batches and len(in_flight) < self.concurrency:
+                batch = batches.popleft()
+                in_flight[executor.submit(self._embed, batch)] = batch
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED) if in_flight else (set(), set())
+            for future in done:
+                batch = in_flight.pop(future)
+                report.embedding_requests += 1
+                try:
+                    future.result()
+                except Exception as e:
+                    failed = sum(len(pending[chunk.content_hash]) for chunk in batch)
+                    logger.error(f"Could not embed {failed} chunks for {report.table}: {e}")
+                    report.failed += failed
+                    report.errors.append(str(e))
+                    knowledge_chunks_total.inc(failed, table=report.table, result="failed")
+                    continue
+                report.embedded += len(batch)
+                for chunk in batch:
+                    for same in pending[chunk.content_hash]:
+                        same.embedding = chunk.embedding
+                        embedded.append(same)
+            # Cached chunks are written with the first batch, or on their own when nothing is embedded
+            if len(embedded) >= self.write_batch_size or (embedded and not batches and not in_flight):
+                self._write_embedded(embedded, filters, report)
+                embedded = []
+                report.seconds = perf_counter() - started_at
+                reported = True
+                if on_progress is not None:
+                    on_progress(report)
+        if not reported and on_progress is not None:
+            # Nothing was written, the progress still moves by the skipped and failed chunks
+            report.seconds = perf_counter() - started_at
+            on_progress(report)
+
+    def _unchanged(self, chunks: Iterable[Chunk]) -> Set[str]:
+        """Return the ids of chunks stored with the same content and an embedding."""
+        table = self.vector_db.table
+        hashes = {chunk.id: chunk.content_hash for chunk in chunks}
+        ids = list(hashes)
+        unchanged: Set[str] = set()
+        with self.vector_db.Session() as sess:
+            for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                rows = sess.execute(
+                    select(table.c.id, table.c.content_hash).where(
+                        table.c.id.in_(ids[i : i + LOOKUP_BATCH_SIZE]), table.c.embedding.is_not(None)
+                    )
+                )
+                unchanged.update(row.id for row in rows if hashes[row.id] == row.content_hash)
+        return unchanged
+
+    def _set_source(self, ids: Set[str], source: str) -> None:
+        """Set the source of unchanged chunks written without one, they are not written again."""
+        table = self.vector_db.table
+        batch = list(ids)
+        with self.vector_db.Session() as sess, sess.begin():
+            for i in range(0, len(batch), LOOKUP_BATCH_SIZE):
+                sess.execute(
+                    update(table)
+                    .where(
+                        table.c.id.in_(batch[i : i + LOOKUP_BATCH_SIZE]),
+                        table.c.meta_data["source"].astext.is_distinct_from(source),
+                    )
+                    .values(meta_data=table.c.meta_data.op("||")(func.jsonb_build_object("source", source)))
+                )
+
+    def _drop_duplicates(self, duplicates: List[Chunk], report: IngestionReport) -> None:
+        """Count near-duplicates, and delete the previous content of their ids, it was replaced by a duplicate."""
+        report.duplicates += len(duplicates)
+        report.duplicate_bytes += sum(
+            len(chunk.content.encode()) + 4 * (self.vector_db.dimensions or 0) for chunk in duplicates
+        )
+        knowledge_chunks_total.inc(len(duplicates), table=report.table, result="duplicate")
+        table = self.vector_db.table
+        ids = [chunk.id for chunk in duplicates]
+        with self.vector_db.Session() as sess, sess.begin():
+            for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                sess.execute(delete(table).where(table.c.id.in_(ids[i : i + LOOKUP_BATCH_SIZE])))
+
+    def _delete_stale(self, source: str, ids: Set[str]) -> int:
+        """Delete the chunks of a source that are not in `ids`. Returns the number of deleted chunks."""
+        table = self.vector_db.table
+        with self.vector_db.Session() as sess, sess.begin():
+            result = sess.execute(
+                delete(table).where(
+                    table.c.meta_data["source"].astext == source,
+                    table.c.id != func.all(bindparam("ids", list(ids), type_=ARRAY(String))),
+                )
+            )
+        if result.rowcount:
+            logger.info(f"Deleted {result.rowcount} chunks of the previous version of {source}")
+        return result.rowcount
+
+    def _cached_embeddings(self, content_hashes: List[str]) -> Dict[str, List[float]]:
+        """Return the cached embeddings of the embedder by content hash."""
+        cache = EmbeddingCacheTable.__table__
+        cached: Dict[str, List[float]] = {}
+        with self.vector_db.Session() as sess:
+            for i in range(0, len(content_hashes), LOOKUP_BATCH_SIZE):
+                rows = sess.execute(
+                    select(cache.c.content_hash, cache.c.embedding).where(
+                        cache.c.model == self.embedding_model,
+                        cache.c.content_hash.in_(content_hashes[i : i + LOOKUP_BATCH_SIZE]),
+                    )
+                )
+                cached.update((row.content_hash, row.embedding.tolist()) for row in rows)
+        return cached
+
+    def _embed(self, batch: List[Chunk]) -> None:
+        """Embed a batch of chunks with one request, retried with backoff."""
+        from agno.embedder.openai import OpenAIEmbedder
+
+        embedder = self.vector_db.embedder
+        texts = [chunk.content for chunk in batch]
+        started_at = perf_counter()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if isinstance(embedder, OpenAIEmbedder):
+                    response = embedder.response(texts)  # type: ignore[arg-type]
+                    embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+                else:
+                    embeddings = [embedder.get_embedding(text) for text in texts]
+                if len(embeddings) != len(batch) or not all(embeddings):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {sum(1 for e in embeddings if e)}")
+                break
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = 2**attempt
+                logger.warning(f"Embedding request failed, retrying in {delay}s: {e}")
+                time.sleep(delay)
+        for chunk, embedding in zip(batch, embeddings):
+            chunk.embedding = embedding
+        knowledge_embedding_duration.observe(perf_counter() - started_at)
+
+    def _write_embedded(self, chunks: List[Chunk], filters: Optional[Dict[str, Any]], report: IngestionReport) -> None:
+        try:
+            self.write(chunks, filters)
+        except Exception as e:
+            logger.error(f"Could not write {len(chunks)} chunks to {report.table}: {e}")
+            report.failed += len(chunks)
+            report.errors.append(str(e))
+            knowledge_chunks_total.inc(len(chunks), table=report.table, result="failed")
+            return
+        report.written += len(chunks)
+        knowledge_chunks_total.inc(len(chunks), table=report.table, result="written")
+
+    def write(self, chunks: List[Chunk], filters: Optional[Dict[str, Any]] = None) -> None:
+        """Upsert embedded chunks in one transaction, with COPY into a staging table."""
+        from psycopg.types.json import Jsonb
+
+        from agents.knowledge.dedupe import SIGNATURE_UPSERT, signature_rows
+
+        started_at = perf_counter()
+        table = self.vector_db.table.fullname
+        staging = f"{self.vector_db.table_name}_staging"
+        columns = ", ".join(COPY_COLUMNS)
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in COPY_COLUMNS if column != "id")
+        connection = self.vector_db.db_engine.raw_connection()
+        driver_connection = cast("psycopg.Connection", connection.driver_connection)
+        try:
+            with driver_connection.cursor() as cursor:
+                # Temporary tables belong to the connection, rows are removed when the transaction ends
+                cursor.execute(
+                    f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS)"
+                    " ON COMMIT DELETE ROWS"
+                )
+                with cursor.copy(f"COPY {staging} ({columns}) FROM STDIN") as copy:
+                    for chunk in chunks:
+                        copy.write_row(
+                            (
+                                chunk.id,
+                                chunk.name,
+                                Jsonb(chunk.meta_data),
+                                Jsonb(filters) if filters is not None else None,
+                                chunk.content,
+                                "[" + ",".join(map(str, chunk.embedding or [])) + "]",
+                                None,
+                                chunk.content_hash,
+                            )
+                        )
+                cursor.execute(
+                    f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging}"
+                    f" ON CONFLICT (id) DO UPDATE SET {updates}, updated_at = now()"
+                )
+                signatures = signature_rows(self.vector_db.table_name, chunks)
+                if signatures:
+                    cursor.executemany(SIGNATURE_UPSERT, signatures)
+                if self.embedding_cache:
+                    cursor.execute(
+                        f"INSERT INTO {EmbeddingCacheTable.__table__.fullname} (model, content_hash, embedding)"
+                        f" SELECT %s, content_hash, embedding FROM {staging} ON CONFLICT DO NOTHING",
+                        (self.embedding_model,),
+                    )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        knowledge_write_duration.observe(perf_counter() - started_at)
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    from agents.knowledge.documents import file_hash, replace_document
+    from agents.sage import get_sage_knowledge
+
+    parser = argparse.ArgumentParser(description="Ingest files and websites into the Sage knowledge base")
+    parser.add_argument("sources", nargs="+", help="Files (.pdf, .csv, .txt, .docx) or urls")
+    parser.add_argument("--batch-size", type=int, default=agent_settings.knowledge_embedding_batch_size)
+    parser.add_argument("--concurrency", type=int, default=agent_settings.knowledge_embedding_concurrency)
+    parser.add_argument("--write-batch-size", type=int, default=agent_settings.knowledge_write_batch_size)
+    parser.add_argument("--window", type=int, default=agent_settings.knowledge_ingest_window, help="Chunks in memory")
+    parser.add_argument(
+        "--dedupe-threshold",
+        type=float,
+        default=agent_settings.knowledge_dedupe_threshold,
+        help="Similarity of near-duplicate chunks, 0 keeps them",
+    )
+    args = parser.parse_args()
+
+    pipeline = IngestionPipeline(
+        get_sage_knowledge().vector_db,  # type: ignore[arg-type]
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        write_batch_size=args.write_batch_size,
+        window_size=args.window,
+        dedupe_threshold=args.dedupe_threshold,
+    )
+    for source in args.sources:
+        print(f"{source}:")
+        stream = pipeline.read(source)
+
+        def print_progress(report: IngestionReport) -> None:
+            pages = f", {stream.pages_read}/{stream.pages} pages parsed" if stream.pages else ""
+            print(f"  {report.written} chunks written{pages}")
+
+        if source.startswith(("http://", "https://")):
+            print(pipeline.ingest(stream, on_progress=print_progress, source=source))
+            continue
+        # Files are documents of the knowledge base, a new version replaces the previous one
+        ingestion = replace_document(
+            pipeline, Path(source).name, stream, content_hash=file_hash(source), on_progress=print_progress
+        )
+        print(ingestion if ingestion is not None else "  unchanged since it was added")
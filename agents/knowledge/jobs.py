@@ -0,0 +1,417 @@
+"""Background ingestion of knowledge.
+
+Documents and websites added in the ui were ingested in the streamlit script run, the page was blocked
+until the last chunk was written and closing the tab stopped the ingestion. They are now queued as jobs of
+kind "knowledge_ingest" in the jobs table and ingested by a KnowledgeIngestWorker:
+    - the ui runs KNOWLEDGE_INGEST_WORKERS worker threads in its process, they keep running when the tab
+      is closed
+    - workers also run on their own with `python -m agents.knowledge.jobs`, uploads are saved to
+      KNOWLEDGE_UPLOAD_DIR, which must then be shared with the ui
+
+Jobs are claimed with FOR UPDATE SKIP LOCKED and send heartbeats like the jobs of api.jobs. Jobs of a worker
+that died are claimed again after `stale_after` seconds, and only embed the chunks that were not written.
+Running jobs write their progress (pages parsed, chunks embedded and written) to jobs.progress. A cancelled
+job stops at its next progress update, the chunks written until then stay in the knowledge base.
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from dataclasses import asdict
+from datetime import timedelta
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Dict, List, Optional
+from uuid import uuid4
+
+from sqlalchemy import and_, or_, select, update
+
+from agents.knowledge.ingest import IngestionPipeline, IngestionReport
+from agents.settings import agent_settings
+from db.tables.jobs import FINISHED_STATUSES, JobsTable, JobStatus
+from utils.dttm import current_utc
+from utils.log import logger
+from utils.metrics import metrics_registry
+
+if TYPE_CHECKING:
+    from agno.vectordb.pgvector import PgVector
+
+    from agents.knowledge.streaming import DocumentStream
+
+KNOWLEDGE_INGEST = "knowledge_ingest"
+
+knowledge_ingest_jobs_total = metrics_registry.counter(
+    "knowledge_ingest_jobs_total",
+    "Knowledge ingestion jobs by how they ended (succeeded, failed, cancelled or requeued).",
+    ["status"],
+)
+
+
+class IngestionCancelled(Exception):
+    """Raised in a running ingestion when its job was cancelled or the worker is stopping."""
+
+
+def get_upload_dir() -> Path:
+    return Path(agent_settings.knowledge_upload_dir or os.path.join(tempfile.gettempdir(), "knowledge_uploads"))
+
+
+def get_knowledge_vector_db(agent_id: Optional[str]) -> "PgVector":
+    """Return the knowledge base of an agent."""
+    if agent_id == "sage":
+        from agents.sage import get_sage_knowledge
+
+        return get_sage_knowledge().vector_db  # type: ignore[return-value]
+    raise ValueError(f"Agent {agent_id} has no knowledge base")
+
+
+def submit_ingestion(
+    agent_id: str,
+    upload: Optional[IO[bytes]] = None,
+    url: Optional[str] = None,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+) -> str:
+    """
+    Queue the ingestion of an uploaded file or a website into the knowledge base of an agent.
+
+    Args:
+        agent_id (str): The agent, e.g. "sage".
+        upload (Optional[IO[bytes]]): An uploaded file, saved to the upload dir until it is ingested.
+        url (Optional[str]): A website, crawled incrementally by agents.knowledge.crawl.
+        user_id (Optional[str]): The user adding the knowledge.
+        session_id (Optional[str]): The session of the user.
+
+    Returns:
+        str: The id of the job.
+    """
+    from db.session import SessionLocal
+
+    job_id = str(uuid4())
+    if upload is not None:
+        # The file keeps its name, chunks get the same ids as when the upload is read directly
+        path = get_upload_dir() / job_id / Path(upload.name).name  # type: ignore[attr-defined]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        upload.seek(0)
+        with path.open("wb") as file:
+            shutil.copyfileobj(upload, file)
+        payload: Dict[str, Any] = {"path": str(path), "name": path.name}
+    elif url is not None:
+        payload = {"url": url, "name": url}
+    else:
+        raise ValueError("Either an upload or a url is required")
+
+    with SessionLocal() as db, db.begin():
+        db.add(
+            JobsTable(
+                id=job_id,
+                kind=KNOWLEDGE_INGEST,
+                status=JobStatus.queued.value,
+                agent_id=agent_id,
+                user_id=user_id,
+                session_id=session_id,
+                payload=payload,
+                created_at=current_utc(),
+            )
+        )
+    if _ingest_worker is not None:
+        _ingest_worker.wake()
+    return job_id
+
+
+def get_ingestion_jobs(agent_id: str, user_id: Optional[str] = None, limit: int = 10) -> List[JobsTable]:
+    """Return the latest ingestion jobs of an agent and user, newest first."""
+    from db.session import SessionLocal
+
+    user_filter = JobsTable.user_id == user_id if user_id is not None else JobsTable.user_id.is_(None)
+    with SessionLocal() as db:
+        return list(
+            db.scalars(
+                select(JobsTable)
+                .where(JobsTable.kind == KNOWLEDGE_INGEST, JobsTable.agent_id == agent_id, user_filter)
+                .order_by(JobsTable.created_at.desc())
+                .limit(limit)
+            )
+        )
+
+
+def cancel_ingestion(job_id: str) -> bool:
+    """Cancel an ingestion job. Returns False if it already finished."""
+    from db.session import SessionLocal
+
+    with SessionLocal() as db, db.begin():
+        job = db.get(JobsTable, job_id, with_for_update=True)
+        if job is None or job.status in FINISHED_STATUSES:
+            return False
+        queued = job.status == JobStatus.queued.value
+        job.status = JobStatus.cancelled.value
+        job.finished_at = current_utc()
+        path = job.payload.get("path")
+    # A running job removes its upload when it stops
+    if queued and path is not None:
+        shutil.rmtree(Path(path).parent, ignore_errors=True)
+    return True
+
+
+def get_progress(report: IngestionReport, stream: Optional["DocumentStream"] = None) -> Dict[str, Any]:
+    """Return the progress of an ingestion as stored in jobs.progress."""
+    progress: Dict[str, Any] = {
+        "chunks": report.chunks,
+        "chunks_skipped": report.skipped,
+        "chunks_cached": report.cached,
+        "chunks_embedded": report.embedded,
+        "chunks_duplicate": report.duplicates,
+        "chunks_written": report.written,
+        "chunks_failed": report.failed,
+    }
+    if stream is not None and stream.pages:
+        progress["pages"] = stream.pages
+        progress["pages_parsed"] = stream.pages_read
+    return progress
+
+
+class _RunningJob:
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+
+
+class KnowledgeIngestWorker:
+    """Ingests the knowledge_ingest jobs of the jobs table on a pool of threads."""
+
+    def __init__(
+        self,
+        num_workers: int = agent_settings.knowledge_ingest_workers,
+        heartbeat_interval: float = 10,
+        stale_after: float = 60,
+        poll_interval: float = 2.0,
+    ):
+        self.num_workers = num_workers
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stopping.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"knowledge-ingest-{i}", daemon=True)
+            for i in range(self.num_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Started {self.num_workers} knowledge ingestion workers: {self.worker_id}")
+
+    def wake(self) -> None:
+        """Claim a new job now instead of at the next poll."""
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the workers. Running jobs stop at their next progress update and are put back on the queue."""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = self._claim_job()
+            except Exception as e:
+                logger.error(f"Knowledge ingestion worker could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(timeout=self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _execute(self, job: JobsTable) -> None:
+        logger.info(f"Ingesting {job.payload.get('name')} into the knowledge of {job.agent_id} (job {job.id})")
+        running = _RunningJob(job.id)
+        heartbeat = threading.Thread(target=self._heartbeat, args=(running,), name=f"{job.id}-heartbeat", daemon=True)
+        heartbeat.start()
+        finished = True
+        try:
+            result = self._ingest(job, running)
+        except IngestionCancelled:
+            if self._stopping.is_set():
+                self._requeue_job(job.id)
+                finished = False
+                knowledge_ingest_jobs_total.inc(status="requeued")
+            else:
+                logger.info(f"Knowledge ingestion job {job.id} was cancelled")
+                knowledge_ingest_jobs_total.inc(status=JobStatus.cancelled.value)
+        except Exception as e:
+            logger.error(f"Knowledge ingestion job {job.id} failed: {e}")
+            self._finish_job(job.id, JobStatus.failed, None, str(e))
+            knowledge_ingest_jobs_total.inc(status=JobStatus.failed.value)
+        else:
+            self._finish_job(job.id, JobStatus.succeeded, result, None)
+            knowledge_ingest_jobs_total.inc(status=JobStatus.succeeded.value)
+        finally:
+            running.done.set()
+            if finished and "path" in job.payload:
+                shutil.rmtree(Path(job.payload["path"]).parent, ignore_errors=True)
+
+    def _ingest(self, job: JobsTable, running: _RunningJob) -> Dict[str, Any]:
+        from agents.knowledge.crawl import crawl_source
+        from agents.knowledge.documents import file_hash, replace_document
+        from agents.knowledge.streaming import DocumentStream
+
+        pipeline = IngestionPipeline(get_knowledge_vector_db(job.agent_id))
+        stream: Optional[DocumentStream] = None
+
+        def on_progress(report: IngestionReport) -> None:
+            # Raised in the ingestion, which stops before its next window or write
+            if running.cancelled.is_set() or self._stopping.is_set():
+                raise IngestionCancelled(job.id)
+            self._update_progress(job.id, get_progress(report, stream))
+
+        if "url" in job.payload:
+            crawl = crawl_source(pipeline, job.payload["url"], on_progress=on_progress)
+            result = asdict(crawl)
+        else:
+            path = job.payload["path"]
+            stream = DocumentStream(Path(path))
+            # A new version of a file replaces the chunks of the previous one
+            report = replace_document(
+                pipeline, job.payload["name"], stream, content_hash=file_hash(path), on_progress=on_progress
+            )
+            if report is not None and report.chunks == 0:
+                raise ValueError(f"Could not read {job.payload['name']}")
+            result = {"ingestion": asdict(report) if report is not None else None, "pages": stream.pages}
+        return result
+
+    def _heartbeat(self, running: _RunningJob) -> None:
+        while not running.done.wait(timeout=self.heartbeat_interval):
+            try:
+                status = self._touch_job(running.id)
+            except Exception as e:
+                logger.warning(f"Could not send heartbeat for knowledge ingestion job {running.id}: {e}")
+                continue
+            if status != JobStatus.running.value:
+                running.cancelled.set()
+                return
+
+    ######################################################
+    ## Database operations
+    ######################################################
+
+    def _claim_job(self) -> Optional[JobsTable]:
+        from db.session import SessionLocal
+
+        now = current_utc()
+        stale_before = now - timedelta(seconds=self.stale_after)
+        with SessionLocal(expire_on_commit=False) as db, db.begin():
+            job = db.scalars(
+                select(JobsTable)
+                .where(
+                    JobsTable.kind == KNOWLEDGE_INGEST,
+                    or_(
+                        JobsTable.status == JobStatus.queued.value,
+                        and_(JobsTable.status == JobStatus.running.value, JobsTable.heartbeat_at < stale_before),
+                    ),
+                )
+                .order_by(JobsTable.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).one_or_none()
+            if job is None:
+                return None
+            job.status = JobStatus.running.value
+            job.worker_id = self.worker_id
+            job.started_at = now
+            job.heartbeat_at = now
+        return job
+
+    def _touch_job(self, job_id: str) -> Optional[str]:
+        from db.session import SessionLocal
+
+        with SessionLocal() as db, db.begin():
+            db.execute(
+                update(JobsTable)
+                .where(JobsTable.id == job_id, JobsTable.status == JobStatus.running.value)
+                .values(heartbeat_at=current_utc())
+            )
+            return db.scalar(select(JobsTable.status).where(JobsTable.id == job_id))
+
+    def _update_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        from db.session import SessionLocal
+
+        with SessionLocal() as db, db.begin():
+            db.execute(
+                update(JobsTable)
+                .where(JobsTable.id == job_id, JobsTable.status == JobStatus.running.value)
+                .values(progress=progress, heartbeat_at=current_utc())
+            )
+
+    def _finish_job(
+        self, job_id: str, status: JobStatus, result: Optional[Dict[str, Any]], error: Optional[str]
+    ) -> None:
+        from db.session import SessionLocal
+
+        with SessionLocal() as db, db.begin():
+            db.execute(
+                update(JobsTable)
+                .where(
+                    JobsTable.id == job_id,
+                    JobsTable.status == JobStatus.running.value,
+                    JobsTable.worker_id == self.worker_id,
+                )
+                .values(status=status.value, result=result, error=error, finished_at=current_utc())
+            )
+
+    def _requeue_job(self, job_id: str) -> None:
+        from db.session import SessionLocal
+
+        with SessionLocal() as db, db.begin():
+            db.execute(
+                update(JobsTable)
+                .where(JobsTable.id == job_id, JobsTable.status == JobStatus.running.value)
+                .values(status=JobStatus.queued.value, worker_id=None, heartbeat_at=None)
+            )
+
+
+_ingest_worker: Optional[KnowledgeIngestWorker] = None
+_ingest_worker_lock = threading.Lock()
+
+
+def start_ingest_worker() -> Optional[KnowledgeIngestWorker]:
+    """Start the knowledge ingestion worker of the process, None if KNOWLEDGE_INGEST_WORKERS is 0."""
+    global _ingest_worker
+
+    if agent_settings.knowledge_ingest_workers <= 0:
+        return None
+    with _ingest_worker_lock:
+        if _ingest_worker is None:
+            _ingest_worker = KnowledgeIngestWorker()
+            _ingest_worker.start()
+    return _ingest_worker
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest queued documents and websites into knowledge bases")
+    parser.add_argument("--workers", type=int, default=agent_settings.knowledge_ingest_workers or 1)
+    args = parser.parse_args()
+
+    worker = KnowledgeIngestWorker(num_workers=args.workers)
+    worker.start()
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        print("Stopping, running jobs are put back on the queue...")
+        worker.stop()
@@ -0,0 +1,161 @@
+"""Quantized vector indexes of knowledge tables.
+
+Every chunk of a knowledge table stores a 1536 dimensional float32 embedding, 6 KB per chunk, and a
+vector index holds another copy of it. With quantization the index is built on a smaller copy of the
+embeddings instead, pgvector computes it from the embedding column:
+    - halfvec: float16, half the size of the index, almost no loss of recall
+    - binary: one bit per dimension, 1/32 of the size, a coarse first pass for normalized embeddings
+
+A search first takes `limit * rerank_factor` candidates from the quantized index, then orders them by
+the distance of their full precision embeddings, so the results are as good as the candidates. The full
+precision column is kept for this. benchmarks.knowledge_quantization compares size, latency and recall.
+With KNOWLEDGE_VECTOR_CACHE=true vector searches are answered from memory when they can, see
+agents.knowledge.vector_cache.
+
+Set KNOWLEDGE_QUANTIZATION=halfvec or binary and rebuild the index of the knowledge table with:
+    python -m agents.knowledge.index create --replace
+"""
+
+from typing import Any, Dict, List, Optional
+
+from agno.document import Document
+from agno.vectordb.distance import Distance
+from agno.vectordb.pgvector import PgVector
+from agno.vectordb.pgvector.index import HNSW, Ivfflat
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import ColumnElement, bindparam, cast, func, select, text
+
+from agents.knowledge.vector_cache import get_vector_cache
+from agents.settings import agent_settings
+from utils.log import logger
+
+QUANTIZATIONS = ("halfvec", "binary")
+HALFVEC_OPERATOR_CLASSES = {
+    Distance.cosine: "halfvec_cosine_ops",
+    Distance.l2: "halfvec_l2_ops",
+    Distance.max_inner_product: "halfvec_ip_ops",
+}
+
+
+def get_quantized_index_expression(quantization: str, dimensions: int, distance: Distance) -> str:
+    """Return the expression and operator class of a quantized index, as used in CREATE INDEX."""
+    if quantization == "halfvec":
+        return f"(embedding::halfvec({dimensions})) {HALFVEC_OPERATOR_CLASSES.get(distance, 'halfvec_cosine_ops')}"
+    if quantization == "binary":
+        return f"(binary_quantize(embedding)::bit({dimensions})) bit_hamming_ops"
+    raise ValueError(f"Unknown quantization: {quantization}, expected one of {QUANTIZATIONS}")
+
+
+class QuantizedPgVector(PgVector):
+    """PgVector searching a quantized index and re-ranking the candidates with the full precision embeddings.
+
+    Without quantization it searches like PgVector. Only vector search changes, hybrid search does not use
+    a vector index. With `vector_cache`, searches without filters are answered from the in-memory vector cache
+    of the table when they can.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        quantization: Optional[str] = agent_settings.knowledge_quantization or None,
+        rerank_factor: int = agent_settings.knowledge_rerank_factor,
+        vector_cache: bool = agent_settings.knowledge_vector_cache,
+        **kwargs: Any,
+    ):
+        if quantization is not None and quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}, expected one of {QUANTIZATIONS}")
+        super().__init__(*args, **kwargs)
+        self.quantization = quantization
+        self.rerank_factor = max(rerank_factor, 1)
+        self.vector_cache = vector_cache
+
+    def _distance(self, column: ColumnElement, embedding: ColumnElement) -> ColumnElement:
+        if self.distance == Distance.l2:
+            return column.l2_distance(embedding)  # type: ignore[attr-defined]
+        if self.distance == Distance.max_inner_product:
+            return column.max_inner_product(embedding)  # type: ignore[attr-defined]
+        return column.cosine_distance(embedding)  # type: ignore[attr-defined]
+
+    def _quantized_distance(self, embedding: ColumnElement) -> ColumnElement:
+        # Must match the index expression of get_quantized_index_expression, or the index is not used
+        column = self.table.c.embedding
+        # Typed, binary_quantize is defined for vector and halfvec
+        embedding = cast(embedding, Vector(self.dimensions))
+        if self.quantization == "halfvec":
+            return self._distance(cast(column, HALFVEC(self.dimensions)), cast(embedding, HALFVEC(self.dimensions)))
+        bits = BIT(self.dimensions)
+        return cast(func.binary_quantize(column), bits).op("<~>")(cast(func.binary_quantize(embedding), bits))
+
+    def search_by_embedding(
+        self, embedding: List[float], limit: int = 5, filters: Optional[Dict[str, Any]] = None
+    ) -> List[Document]:
+        """Return the chunks closest to an embedding."""
+        cache = get_vector_cache(self) if self.vector_cache and filters is None else None
+        if cache is not None:
+            cached = cache.search([embedding], limit=limit)[0]
+            if cached is not None:
+                return cached
+
+        table = self.table
+        columns = [
+            table.c.id,
+            table.c.name,
+            table.c.meta_data,
+            table.c.content,
+            table.c.embedding,
+            table.c.usage,
+        ]
+        query_embedding = bindparam("query_embedding", embedding, type_=Vector(self.dimensions))
+        candidates = limit
+        if self.quantization is None:
+            stmt = select(*columns).order_by(self._distance(table.c.embedding, query_embedding))
+            if filters is not None:
+                stmt = stmt.where(table.c.filters.contains(filters))
+            stmt = stmt.limit(limit)
+        else:
+            candidates = limit * self.rerank_factor
+            candidate_stmt = select(*columns).order_by(self._quantized_distance(query_embedding))
+            if filters is not None:
+                candidate_stmt = candidate_stmt.where(table.c.filters.contains(filters))
+            subquery = candidate_stmt.limit(candidates).subquery("candidates")
+            stmt = (
+                select(subquery).order_by(self._distance(subquery.c.embedding, query_embedding)).limit(limit)
+            )
+
+        with self.Session() as sess, sess.begin():
+            if isinstance(self.vector_index, Ivfflat):
+                sess.execute(text(f"SET LOCAL ivfflat.probes = {int(self.vector_index.probes)}"))
+            elif isinstance(self.vector_index, HNSW):
+                # The index returns at most ef_search rows, at least all candidates are needed
+                ef_search = max(self.vector_index.ef_search, candidates)
+                sess.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+            rows = sess.execute(stmt).fetchall()
+        results = [
+            Document(
+                id=row.id,
+                name=row.name,
+                meta_data=row.meta_data,
+                content=row.content,
+                embedder=self.embedder,
+                embedding=row.embedding,
+                usage=row.usage,
+            )
+            for row in rows
+        ]
+        if cache is not None:
+            cache.remember(embedding, results, limit)
+        return results
+
+    def vector_search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        query_embedding = self.embedder.get_embedding(query)
+        if not query_embedding:
+            logger.error(f"Error getting embedding for Query: {query}")
+            return []
+        try:
+            results = self.search_by_embedding(query_embedding, limit=limit, filters=filters)
+        except Exception as e:
+            logger.error(f"Error performing vector search: {e}")
+            return []
+        if self.reranker:
+            results = self.reranker.rerank(query=query, documents=results)
+        return results
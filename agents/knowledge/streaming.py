@@ -0,0 +1,243 @@
+"""Streaming readers of PDF and DOCX files.
+
+PDFReader and DocxReader parse a whole file and return all of its chunks at once, so a 500 page PDF is held
+in memory and parsed before the first chunk is embedded. A DocumentStream yields the chunks of a file while
+it is parsed instead, and IngestionPipeline.ingest embeds and writes them in windows as they arrive:
+    - PDF pages are parsed `pages_per_task` at a time in a process pool shared by the process, with at
+      most `prefetch` tasks of a file ahead of the ingestion. Text extraction of pypdf is pure Python, the
+      pool parses uploads in parallel and keeps the ui responsive.
+    - DOCX files are read paragraph by paragraph from the zip, without building the document tree, and
+      yielded in sections of about SECTION_CHARACTERS.
+
+Chunks get the same ids as with the agno readers: `{name}_{page}_{chunk}` for PDFs and `{name}_{chunk}`
+for the first section of a DOCX file, so documents that fit in one section keep their chunk ids.
+Other file types and websites are read with the agno readers.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Deque, Iterator, List, Optional, Tuple, Union
+
+from agno.document import Document
+from agno.document.chunking.strategy import ChunkingStrategy
+
+from agents.settings import agent_settings
+
+if TYPE_CHECKING:
+    from agno.document.reader import Reader
+
+# Characters of a DOCX section, chunked and yielded at once
+SECTION_CHARACTERS = 100_000
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the process pool parsing PDF pages, None when files are parsed in the calling thread."""
+    global _parse_pool
+
+    if agent_settings.knowledge_parse_processes <= 0:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # Forking a process with running threads (uvicorn, streamlit) can deadlock the child
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=agent_settings.knowledge_parse_processes, mp_context=multiprocessing.get_context("spawn")
+            )
+    return _parse_pool
+
+
+def _reset_parse_pool(pool: ProcessPoolExecutor) -> None:
+    # A worker died, e.g. out of memory on a broken file, the next file gets a new pool
+    global _parse_pool
+
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_document_name(source: Union[str, Path, IO[Any]]) -> str:
+    """Return the document name the agno readers give a file path or an uploaded file."""
+    if isinstance(source, str):
+        return source.split("/")[-1].split(".")[0].replace(" ", "_")
+    return str(getattr(source, "name", "document")).split("/")[-1].split(".")[0]
+
+
+def read_pdf_pages(
+    path: str, name: str, start: int, stop: int, chunking_strategy: Optional[ChunkingStrategy]
+) -> List[Document]:
+    """Parse and chunk pages [start, stop) of a PDF file. Runs in the parse pool."""
+    from pypdf import PdfReader
+
+    pdf = PdfReader(path)
+    documents: List[Document] = []
+    for page_number in range(start + 1, stop + 1):
+        document = Document(
+            name=name,
+            id=f"{name}_{page_number}",
+            meta_data={"page": page_number},
+            content=pdf.pages[page_number - 1].extract_text(),
+        )
+        documents.extend(chunking_strategy.chunk(document) if chunking_strategy is not None else [document])
+    return documents
+
+
+def iter_docx_paragraphs(path: str) -> Iterator[str]:
+    """Yield the text of the paragraphs of the body of a DOCX file, like python-docx Document.paragraphs."""
+    from lxml import etree
+
+    body_tag = f"{WORD_NAMESPACE}body"
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        for _, element in etree.iterparse(xml, events=("end",)):
+            parent = element.getparent()
+            if parent is None or parent.tag != body_tag:
+                continue
+            if element.tag == f"{WORD_NAMESPACE}p":
+                yield _paragraph_text(element)
+            # Drop parsed elements, only the current one is kept in memory
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def _paragraph_text(paragraph: Any) -> str:
+    parts = []
+    for element in paragraph.iter(f"{WORD_NAMESPACE}t", f"{WORD_NAMESPACE}tab", f"{WORD_NAMESPACE}br"):
+        if element.tag == f"{WORD_NAMESPACE}t":
+            parts.append(element.text or "")
+        elif element.tag == f"{WORD_NAMESPACE}tab":
+            parts.append("\t")
+        else:
+            parts.append("\n")
+    return "".join(parts)
+
+
+class DocumentStream:
+    """Chunks of a file, yielded while the file is parsed. Iterate it once.
+
+    `pages` is the number of pages of a PDF file, None for other files, and `pages_read` the pages
+    yielded so far, for progress reports.
+    """
+
+    def __init__(
+        self,
+        source: Union[str, Path, IO[Any]],
+        reader: Optional["Reader"] = None,
+        pages_per_task: int = agent_settings.knowledge_parse_pages_per_task,
+        prefetch: int = agent_settings.knowledge_parse_prefetch,
+    ):
+        from agents.knowledge.ingest import get_reader
+
+        self.source = source
+        self.name = get_document_name(source)
+        file_name = source if isinstance(source, str) else str(getattr(source, "name", ""))
+        self.file_type = file_name.rsplit(".", 1)[-1].lower() if "." in file_name else ""
+        reader = reader or get_reader(file_name)
+        if reader is None:
+            raise ValueError(f"Unsupported file type: {file_name}")
+        self.reader: "Reader" = reader
+        self.pages_per_task = max(pages_per_task, 1)
+        self.prefetch = max(prefetch, 1)
+        self.pages: Optional[int] = None
+        self.pages_read = 0
+
+    @property
+    def chunking_strategy(self) -> Optional[ChunkingStrategy]:
+        return self.reader.chunking_strategy if self.reader.chunk else None
+
+    def __iter__(self) -> Iterator[Document]:
+        if isinstance(self.source, str) and self.source.startswith(("http://", "https://")):
+            yield from self.reader.read(self.source)
+            return
+        if self.file_type not in ("pdf", "docx"):
+            yield from self.reader.read(Path(self.source) if isinstance(self.source, str) else self.source)
+            return
+        path, temporary = self._local_path()
+        try:
+            if self.file_type == "pdf":
+                yield from self._read_pdf(path)
+            else:
+                yield from self._read_docx(path)
+        finally:
+            if temporary:
+                os.unlink(path)
+
+    def _local_path(self) -> Tuple[str, bool]:
+        # Parse workers open the file themselves, uploads are copied to a temporary file first
+        if isinstance(self.source, (str, Path)):
+            return str(self.source), False
+        with tempfile.NamedTemporaryFile(suffix=f".{self.file_type}", delete=False) as file:
+            self.source.seek(0)
+            shutil.copyfileobj(self.source, file)
+        return file.name, True
+
+    def _read_pdf(self, path: str) -> Iterator[Document]:
+        from pypdf import PdfReader
+
+        # Reading the page tree is cheap, the text of the pages is extracted in the pool
+        self.pages = len(PdfReader(path).pages)
+        ranges = deque(
+            (start, min(start + self.pages_per_task, self.pages)) for start in range(0, self.pages, self.pages_per_task)
+        )
+        pool = get_parse_pool()
+        if pool is None:
+            for start, stop in ranges:
+                yield from read_pdf_pages(path, self.name, start, stop, self.chunking_strategy)
+                self.pages_read = stop
+            return
+
+        in_flight: Deque[Tuple[Future, int]] = deque()
+        try:
+            while ranges or in_flight:
+                # At most `prefetch` parsed page ranges wait for the ingestion
+                while ranges and len(in_flight) < self.prefetch:
+                    start, stop = ranges.popleft()
+                    future = pool.submit(read_pdf_pages, path, self.name, start, stop, self.chunking_strategy)
+                    in_flight.append((future, stop))
+                future, stop = in_flight.popleft()
+                try:
+                    documents = future.result()
+                except BrokenProcessPool:
+                    _reset_parse_pool(pool)
+                    raise
+                yield from documents
+                self.pages_read = stop
+        finally:
+            # The ingestion stopped or failed, pages not parsed yet are not needed
+            for future, _ in in_flight:
+                future.cancel()
+
+    def _read_docx(self, path: str) -> Iterator[Document]:
+        section: List[str] = []
+        characters = 0
+        number = 1
+        for paragraph in iter_docx_paragraphs(path):
+            section.append(paragraph)
+            characters += len(paragraph) + 2
+            if characters >= SECTION_CHARACTERS:
+                yield from self._docx_section(section, number)
+                section, characters, number = [], 0, number + 1
+        if section:
+            yield from self._docx_section(section, number)
+
+    def _docx_section(self, paragraphs: List[str], number: int) -> List[Document]:
+        document = Document(
+            name=self.name,
+            # The first section has the id of the document, as with DocxReader
+            id=self.name if number == 1 else f"{self.name}_section_{number}",
+            content="\n\n".join(paragraphs),
+        )
+        if number > 1:
+            document.meta_data = {"section": number}
+        return self.chunking_strategy.chunk(document) if self.chunking_strategy is not None else [document]
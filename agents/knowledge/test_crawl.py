@@ -0,0 +1,252 @@
+"""Tests of the incremental crawl, against websites served by a local http.server.
+
+The crawl registry is kept in memory by FakeRegistry, which stands in for db.session.SessionLocal and
+applies the select, upsert and delete statements of IncrementalWebsiteReader to a dict of rows.
+"""
+
+import re
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import Delete, Select
+from sqlalchemy.dialects import postgresql
+
+from agents.knowledge import crawl
+from agents.knowledge.crawl import IncrementalWebsiteReader, crawl_source
+from agents.knowledge.ingest import IngestionReport
+
+
+@dataclass
+class Page:
+    body: str
+    status: int = 200
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class Website:
+    """Pages served by path. Answers 304 when a request carries the validators of the page."""
+
+    def __init__(self) -> None:
+        self.url = ""
+        self.pages: Dict[str, Page] = {}
+        self.requests: List[Dict[str, str]] = []
+
+    def handler(self) -> type:
+        website = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                website.requests.append({"path": self.path, **self.headers})
+                page = website.pages.get(self.path, Page("", status=404))
+                not_modified = (page.etag is not None and self.headers.get("If-None-Match") == page.etag) or (
+                    page.last_modified is not None and self.headers.get("If-Modified-Since") == page.last_modified
+                )
+                self.send_response(304 if not_modified and page.status == 200 else page.status)
+                if page.etag:
+                    self.send_header("ETag", page.etag)
+                if page.last_modified:
+                    self.send_header("Last-Modified", page.last_modified)
+                body = b"" if not_modified else page.body.encode()
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+
+class FakeRegistry:
+    """In-memory public.crawled_pages, rows by url."""
+
+    def __init__(self) -> None:
+        self.rows: Dict[str, SimpleNamespace] = {}
+
+    def __call__(self) -> "FakeRegistry":
+        return self
+
+    def __enter__(self) -> "FakeRegistry":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+    def begin(self) -> nullcontext:
+        return nullcontext()
+
+    def execute(self, stmt: Any) -> Any:
+        params = stmt.compile(dialect=postgresql.dialect()).params
+        if isinstance(stmt, Select):
+            return SimpleNamespace(fetchall=lambda: list(self.rows.values()))
+        if isinstance(stmt, postgresql.Insert):
+            values: Dict[int, Dict[str, Any]] = {}
+            for key, value in params.items():
+                match = re.fullmatch(r"(\w+)_m(\d+)", key)
+                assert match is not None
+                values.setdefault(int(match.group(2)), {})[match.group(1)] = value
+            for row in values.values():
+                previous = self.rows.get(row["url"])
+                if row["changed_at"] is None and previous is not None:
+                    row["changed_at"] = previous.changed_at
+                self.rows[row["url"]] = SimpleNamespace(**row)
+            return None
+        if isinstance(stmt, Delete):
+            for url in params["url_1"]:
+                self.rows.pop(url, None)
+            return None
+        raise AssertionError(f"Unexpected statement: {stmt}")
+
+
+@pytest.fixture
+def website() -> Iterator[Website]:
+    website = Website()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), website.handler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    website.url = f"http://127.0.0.1:{server.server_port}"
+    website.pages = {
+        "/": Page('<main>Home <a href="/a">A</a> <a href="/b">B</a></main>', etag='"home-1"'),
+        "/a": Page("<main>Page A</main>", last_modified="Mon, 19 Oct 2026 06:00:00 GMT"),
+        "/b": Page("<main>Page B</main>"),
+    }
+    yield website
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def registry(monkeypatch: pytest.MonkeyPatch) -> FakeRegistry:
+    registry = FakeRegistry()
+    monkeypatch.setattr("db.session.SessionLocal", registry)
+    monkeypatch.setattr(IncrementalWebsiteReader, "delay", lambda self: None)
+    return registry
+
+
+def crawl_website(website: Website, indexed: bool = True) -> IncrementalWebsiteReader:
+    reader = IncrementalWebsiteReader(max_links=10, max_depth=2)
+    reader.crawl(website.url + "/")
+    reader.commit(indexed=indexed)
+    return reader
+
+
+def urls(website: Website, *paths: str) -> List[str]:
+    return [website.url + path for path in paths]
+
+
+def test_first_crawl_returns_every_page(website: Website, registry: FakeRegistry) -> None:
+    reader = IncrementalWebsiteReader(max_links=10, max_depth=2)
+    result = reader.crawl(website.url + "/")
+    assert result == dict(zip(urls(website, "/", "/a", "/b"), ["Home A B", "Page A", "Page B"]))
+    assert reader.changed == urls(website, "/", "/a", "/b")
+    assert reader.unchanged == reader.not_modified == reader.removed == []
+    # Nothing is registered before commit
+    assert registry.rows == {}
+
+    reader.commit()
+    home, page_a, page_b = (registry.rows[url] for url in urls(website, "/", "/a", "/b"))
+    assert (home.table_name, home.source) == ("sage_knowledge", website.url + "/")
+    assert (home.etag, home.last_modified) == ('"home-1"', None)
+    assert home.links == urls(website, "/a", "/b")
+    assert page_a.last_modified == "Mon, 19 Oct 2026 06:00:00 GMT"
+    assert page_b.etag is None and page_b.content_hash is not None
+    assert all(row.changed_at is not None for row in registry.rows.values())
+
+
+def test_recrawl_sends_validators_and_skips_unchanged_pages(website: Website, registry: FakeRegistry) -> None:
+    first = crawl_website(website)
+    changed_at = {url: row.changed_at for url, row in registry.rows.items()}
+    website.requests.clear()
+
+    reader = IncrementalWebsiteReader(max_links=10, max_depth=2)
+    assert reader.crawl(website.url + "/") == {}
+    # "/" matches its ETag and "/a" its Last-Modified, "/b" has no validators and is downloaded with the same text
+    assert reader.not_modified == urls(website, "/", "/a")
+    assert reader.unchanged == urls(website, "/", "/a", "/b")
+    assert reader.changed == reader.removed == []
+    requests = {request["path"]: request for request in website.requests}
+    assert requests["/"]["If-None-Match"] == '"home-1"'
+    assert requests["/a"]["If-Modified-Since"] == "Mon, 19 Oct 2026 06:00:00 GMT"
+    assert "If-None-Match" not in requests["/b"] and "If-Modified-Since" not in requests["/b"]
+
+    reader.commit()
+    assert {url: row.content_hash for url, row in registry.rows.items()} == {
+        url: state.content_hash for url, state in first._crawled.items()
+    }
+    assert {url: row.changed_at for url, row in registry.rows.items()} == changed_at
+
+
+def test_recrawl_returns_modified_pages(website: Website, registry: FakeRegistry) -> None:
+    crawl_website(website)
+    previous = registry.rows[website.url + "/b"]
+    website.pages["/b"] = Page("<main>Page B, edited</main>")
+
+    reader = IncrementalWebsiteReader(max_links=10, max_depth=2)
+    assert reader.crawl(website.url + "/") == {website.url + "/b": "Page B, edited"}
+    assert reader.changed == urls(website, "/b")
+    assert reader.unchanged == urls(website, "/", "/a")
+
+    reader.commit()
+    row = registry.rows[website.url + "/b"]
+    assert row.content_hash != previous.content_hash
+    assert row.changed_at > previous.changed_at
+
+
+def test_changed_pages_that_were_not_indexed_stay_changed(website: Website, registry: FakeRegistry) -> None:
+    crawl_website(website)
+    previous = registry.rows[website.url + "/b"]
+    website.pages["/b"] = Page("<main>Page B, edited</main>")
+
+    crawl_website(website, indexed=False)
+    assert registry.rows[website.url + "/b"].content_hash == previous.content_hash
+    assert crawl_website(website).changed == urls(website, "/b")
+
+
+@pytest.mark.parametrize("status", [404, 410])
+def test_recrawl_removes_pages_that_are_gone(website: Website, registry: FakeRegistry, status: int) -> None:
+    crawl_website(website)
+    website.pages["/a"] = Page("", status=status)
+
+    reader = crawl_website(website)
+    assert reader.removed == urls(website, "/a")
+    assert sorted(registry.rows) == urls(website, "/", "/b")
+
+
+def test_crawl_source_indexes_changed_pages(
+    website: Website, registry: FakeRegistry, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    delete_page_chunks = MagicMock(return_value=0)
+    register_document = MagicMock()
+    monkeypatch.setattr(crawl, "delete_page_chunks", delete_page_chunks)
+    monkeypatch.setattr(crawl, "register_document", register_document)
+    pipeline = MagicMock()
+    pipeline.vector_db.table_name = "sage_knowledge"
+    pipeline.ingest.return_value = IngestionReport(table="sage_knowledge")
+    source = website.url + "/"
+
+    report = crawl_source(pipeline, source, max_links=10, max_depth=2)
+    assert (report.changed, report.unchanged, report.not_modified, report.removed) == (3, 0, 0, 0)
+    delete_page_chunks.assert_called_once()
+    register_document.assert_called_once_with(pipeline.vector_db, source, "website", changed=True)
+
+    website.pages["/a"] = Page("", status=404)
+    website.pages["/b"] = Page("<main>Page B, edited</main>")
+    pipeline.ingest.reset_mock()
+    delete_page_chunks.reset_mock()
+    report = crawl_source(pipeline, source, max_links=10, max_depth=2)
+    assert (report.changed, report.unchanged, report.not_modified, report.removed) == (1, 1, 1, 1)
+    documents = pipeline.ingest.call_args.args[0]
+    assert [document.meta_data["url"] for document in documents] == urls(website, "/b")
+    # Chunks of the changed and removed pages are deleted, except the chunks written again
+    delete_page_chunks.assert_called_once_with(
+        pipeline, urls(website, "/b", "/a"), [document.id for document in documents]
+    )
+    assert sorted(registry.rows) == urls(website, "/", "/b")
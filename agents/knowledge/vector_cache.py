@@ -0,0 +1,405 @@
+"""In-memory vector cache of knowledge tables.
+
+Every search of a knowledge base sends the query embedding to Postgres, even when the knowledge table is small
+and the same chunks are found again and again. With KNOWLEDGE_VECTOR_CACHE=true, QuantizedPgVector searches a
+copy of the embeddings in the memory of the process first:
+    - a table with at most KNOWLEDGE_VECTOR_CACHE_MAX_CHUNKS chunks is copied whole, searches are exact and
+      are always answered from memory
+    - of a larger table, the chunks found by the latest searches in Postgres are kept, up to the same number,
+      with the last KNOWLEDGE_VECTOR_CACHE_SEARCHES of these searches. A chunk that a search for q0 did not
+      return is at most as similar to q0 as its least similar result, at an angle of at least a to q0, so it
+      is at an angle of at least a - angle(q, q0) to a new query q. A search is answered from memory when the
+      results in memory are at least as similar to q as this bound allows, for a remembered search with all
+      of its results still in memory, and then returns what Postgres would. Otherwise it goes to Postgres, and
+      its results and bound are remembered.
+Embeddings are normalized float32 rows of one matrix, a batch of queries is searched with one matrix product.
+
+Of a larger table, only repeated queries and queries very close to an earlier one are answered from memory.
+The cache gives up hit rate for recall: answers are as good as the Postgres search they are derived from, with
+a vector index as good as its recall. Searches with another distance than cosine go to Postgres, and the
+remembered searches are forgotten when a refresh finds chunks created or updated since the previous one.
+
+The copy is refreshed in a background thread every KNOWLEDGE_VECTOR_CACHE_REFRESH_INTERVAL seconds, with the
+chunks created or updated since the previous refresh, and chunks deleted from the table are dropped. Searches go to
+Postgres until the first refresh is done, and so do searches with filters. Hybrid search ranks chunks by their text
+in Postgres and does not use the cache. Every process keeps its own copy, about 6 KB per chunk of 1536 dimensions
+and 12 KB per remembered search.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from agno.document import Document
+from agno.vectordb.distance import Distance
+from sqlalchemy import func, select
+
+from agents.settings import agent_settings
+from utils.log import logger
+from utils.metrics import metrics_registry
+
+if TYPE_CHECKING:
+    from agno.vectordb.pgvector import PgVector
+
+knowledge_vector_cache_total = metrics_registry.counter(
+    "knowledge_vector_cache_total",
+    "Knowledge searches by whether the in-memory vector cache answered them (hit) or Postgres (miss).",
+    ["table", "result"],
+)
+knowledge_vector_cache_chunks = metrics_registry.gauge(
+    "knowledge_vector_cache_chunks",
+    "Chunks of a knowledge table in the in-memory vector cache.",
+    ["table"],
+)
+
+# Chunks written by transactions that started before a refresh are committed with an earlier updated_at,
+# a refresh reads the chunks changed since this long before the previous one
+REFRESH_OVERLAP = timedelta(seconds=60)
+# Ids looked up per query when refreshing the chunks of a partially cached table
+LOOKUP_BATCH_SIZE = 1000
+# Rounding error of float32 similarities, results within it of the bound of a search are answered from memory
+SIMILARITY_TOLERANCE = 1e-5
+
+
+class VectorCache:
+    """Copy of the embeddings of a knowledge table, searched in memory. Thread safe."""
+
+    def __init__(
+        self,
+        vector_db: "PgVector",
+        max_chunks: int = agent_settings.knowledge_vector_cache_max_chunks,
+        max_searches: int = agent_settings.knowledge_vector_cache_searches,
+        refresh_interval: float = agent_settings.knowledge_vector_cache_refresh_interval,
+    ):
+        self.vector_db = vector_db
+        self.max_chunks = max(max_chunks, 1)
+        self.max_searches = max(max_searches, 1)
+        self.refresh_interval = refresh_interval
+        # The whole table is in memory, False when only the chunks found by searches are
+        self.full = False
+        # The first refresh is done
+        self.ready = False
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshed_at: Optional[float] = None
+        # Database time of the previous refresh
+        self._since: Optional[datetime] = None
+        # Rows [0, _size) of the arrays are chunks, the rest is free
+        self._size = 0
+        self._ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        # name, meta_data, content and usage of every chunk
+        self._documents: List[Tuple[Optional[str], Dict[str, Any], str, Optional[Dict[str, Any]]]] = []
+        self._matrix = np.zeros((0, vector_db.dimensions or 0), dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        # Search count when the chunk was last found, the least recently found chunks are evicted first
+        self._used = np.zeros(0, dtype=np.int64)
+        self._searches = 0
+        # Remembered Postgres searches of a partially cached table, in a ring of max_searches rows allocated by
+        # the first one: the normalized query, the angle of its least similar result, the ids of its results and
+        # whether they are all in memory. Queries are float64, arccos of float32 similarities near 1 is too coarse
+        self._queries = np.zeros((0, vector_db.dimensions or 0), dtype=np.float64)
+        self._angles = np.zeros(0, dtype=np.float64)
+        self._result_ids: List[Set[str]] = []
+        self._valid = np.zeros(0, dtype=bool)
+        self._next_search = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def search(self, embeddings: Sequence[Sequence[float]], limit: int = 5) -> List[Optional[List[Document]]]:
+        """
+        Return the chunks closest to every embedding, ordered like PgVector with its distance.
+
+        Args:
+            embeddings (Sequence[Sequence[float]]): Query embeddings, searched with one matrix product.
+            limit (int): Chunks per query.
+
+        Returns:
+            List[Optional[List[Document]]]: The chunks of every query, None when the query must be searched in Postgres.
+        """
+        self._schedule_refresh()
+        table = self.vector_db.table_name
+        if not self.ready or not embeddings:
+            knowledge_vector_cache_total.inc(len(embeddings), table=table, result="miss")
+            return [None] * len(embeddings)
+
+        queries = np.asarray(embeddings, dtype=np.float32)
+        query_norms = np.linalg.norm(queries, axis=1)
+        normalized = queries / np.where(query_norms > 0, query_norms, 1)[:, None]
+        results: List[Optional[List[Document]]] = []
+        with self._lock:
+            size = self._size
+            if size == 0 or (not self.full and size < limit):
+                knowledge_vector_cache_total.inc(len(embeddings), table=table, result="miss")
+                return [None] * len(embeddings)
+            if not self.full and self.vector_db.distance != Distance.cosine:
+                knowledge_vector_cache_total.inc(len(embeddings), table=table, result="miss")
+                return [None] * len(embeddings)
+            similarity = normalized @ self._matrix[:size].T
+            scores = self._scores(similarity, query_norms)
+            k = min(limit, size)
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            bounds = None if self.full else self._uncached_bounds(queries.astype(np.float64))
+            self._searches += 1
+            for query, candidate in enumerate(candidates):
+                rows = candidate[np.argsort(-scores[query, candidate], kind="stable")]
+                # Chunks that are not in memory may be closer to the query
+                if bounds is not None and similarity[query, rows].min() < bounds[query] - SIMILARITY_TOLERANCE:
+                    results.append(None)
+                    continue
+                self._used[rows] = self._searches
+                results.append([self._document(row) for row in rows])
+        hits = sum(1 for result in results if result is not None)
+        knowledge_vector_cache_total.inc(hits, table=table, result="hit")
+        knowledge_vector_cache_total.inc(len(results) - hits, table=table, result="miss")
+        return results
+
+    def _uncached_bounds(self, queries: np.ndarray) -> np.ndarray:
+        """Return the highest cosine similarity a chunk that is not in memory can have to every query, or inf."""
+        # Called with self._lock held
+        if not self._valid.any():
+            return np.full(len(queries), np.inf)
+        normalized = _normalize(queries)
+        angles = np.arccos(np.clip(normalized @ self._queries.T, -1, 1))
+        # A chunk not returned by a remembered search is at an angle of at least `_angles - angles` to the query
+        margins = self._angles[None, :] - angles
+        bounds = np.where(self._valid[None, :] & (margins > 0), np.cos(np.maximum(margins, 0)), np.inf)
+        return bounds.min(axis=1)
+
+    def _scores(self, similarity: np.ndarray, query_norms: np.ndarray) -> np.ndarray:
+        # Higher is closer, in the order of the distance of the vector db
+        if self.vector_db.distance == Distance.cosine:
+            return similarity
+        dot = similarity * self._norms[: self._size] * query_norms[:, None]
+        if self.vector_db.distance == Distance.max_inner_product:
+            return dot
+        return 2 * dot - self._norms[: self._size] ** 2 - (query_norms**2)[:, None]
+
+    def _document(self, row: int) -> Document:
+        name, meta_data, content, usage = self._documents[row]
+        return Document(
+            id=self._ids[row],
+            name=name,
+            meta_data=meta_data,
+            content=content,
+            embedder=self.vector_db.embedder,
+            embedding=(self._matrix[row] * self._norms[row]).tolist(),
+            usage=usage,
+        )
+
+    def remember(self, embedding: Sequence[float], documents: List[Document], limit: int) -> None:
+        """
+        Add a search answered by Postgres to a partially cached table, evicting the least recently found chunks.
+
+        Args:
+            embedding (Sequence[float]): The query embedding.
+            documents (List[Document]): The chunks Postgres returned, with their embeddings.
+            limit (int): Chunks the search asked for, fewer chunks mean the table has no other chunks.
+        """
+        if self.full or not self.ready:
+            return
+        with self._lock:
+            self._searches += 1
+            rows = []
+            for document in documents:
+                if document.id is not None and document.embedding is not None:
+                    row = self._put(
+                        document.id,
+                        (document.name, document.meta_data, document.content, document.usage),
+                        document.embedding,
+                    )
+                    self._used[row] = self._searches
+                    rows.append(row)
+            if rows and len(rows) == len(documents) and self.vector_db.distance == Distance.cosine:
+                self._remember_search(embedding, rows, complete=len(documents) < limit)
+            self._evict()
+        knowledge_vector_cache_chunks.set(self._size, table=self.vector_db.table_name)
+
+    def _remember_search(self, embedding: Sequence[float], rows: List[int], complete: bool) -> None:
+        # Called with self._lock held, replaces the oldest remembered search once there are max_searches
+        query = _normalize(np.asarray([embedding], dtype=np.float64))[0]
+        if not query.any():
+            return
+        if len(self._valid) == 0:
+            self._queries = np.zeros((self.max_searches, len(query)), dtype=np.float64)
+            self._angles = np.zeros(self.max_searches, dtype=np.float64)
+            self._result_ids = [set() for _ in range(self.max_searches)]
+            self._valid = np.zeros(self.max_searches, dtype=bool)
+        search = self._next_search
+        self._next_search = (search + 1) % self.max_searches
+        similarity = float((self._matrix[rows] @ query.astype(np.float32)).min())
+        self._queries[search] = query
+        # Without other chunks in the table, any chunk that is not in memory was created later
+        self._angles[search] = np.pi if complete else np.arccos(np.clip(similarity, -1, 1))
+        self._result_ids[search] = {self._ids[row] for row in rows}
+        self._valid[search] = True
+
+    def _schedule_refresh(self) -> None:
+        if self._refreshed_at is not None and monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        # Set before the refresh, a failing refresh is retried after the interval
+        self._refreshed_at = monotonic()
+        threading.Thread(target=self._refresh_in_background, name="knowledge-vector-cache", daemon=True).start()
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Could not refresh the vector cache of {self.vector_db.table_name}: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def refresh(self) -> None:
+        """Read the chunks created, updated and deleted since the previous refresh."""
+        table = self.vector_db.table
+        columns = [table.c.id, table.c.name, table.c.meta_data, table.c.content, table.c.usage, table.c.embedding]
+        changed_at = func.coalesce(table.c.updated_at, table.c.created_at)
+        with self.vector_db.Session() as sess:
+            now = sess.scalar(select(func.now()))
+            count = sess.scalar(select(func.count()).select_from(table).where(table.c.embedding.is_not(None)))
+            full = count <= self.max_chunks
+            # A table that shrank below max_chunks is read whole
+            since = self._since - REFRESH_OVERLAP if self._since is not None and (self.full or not full) else None
+            if full:
+                stmt = select(*columns).where(table.c.embedding.is_not(None))
+                if since is not None:
+                    stmt = stmt.where(changed_at > since)
+                rows = sess.execute(stmt).fetchall()
+                self._apply(rows, full=True)
+                # Chunks deleted since the previous refresh, or committed with an older updated_at
+                if self._size != count:
+                    ids = set(sess.scalars(select(table.c.id).where(table.c.embedding.is_not(None))))
+                    with self._lock:
+                        self._remove(set(self._ids[: self._size]) - ids)
+                        missing = list(ids - set(self._ids[: self._size]))
+                    self._apply(self._read(sess, columns, missing), full=True)
+            else:
+                # Remembered searches do not bound chunks created or updated after them
+                changed = (
+                    sess.scalar(select(func.count()).select_from(table).where(changed_at > since))
+                    if since is not None
+                    else None
+                )
+                with self._lock:
+                    if changed != 0:
+                        self._valid[:] = False
+                    cached = list(self._ids[: self._size])
+                stmt = select(*columns).where(table.c.embedding.is_not(None))
+                if since is not None:
+                    stmt = stmt.where(changed_at > since)
+                rows = self._read(sess, columns, cached, stmt)
+                existing: Set[str] = set()
+                for i in range(0, len(cached), LOOKUP_BATCH_SIZE):
+                    existing.update(
+                        sess.scalars(
+                            select(table.c.id).where(
+                                table.c.id.in_(cached[i : i + LOOKUP_BATCH_SIZE]), table.c.embedding.is_not(None)
+                            )
+                        )
+                    )
+                self._apply(rows, full=False)
+                with self._lock:
+                    self._remove(set(cached) - existing)
+        self._since = now
+        self.ready = True
+        knowledge_vector_cache_chunks.set(self._size, table=self.vector_db.table_name)
+        logger.debug(f"Refreshed the vector cache of {self.vector_db.table_name}: {self._size} of {count} chunks")
+
+    def _read(self, sess: Any, columns: List[Any], ids: List[str], stmt: Any = None) -> List[Any]:
+        table = self.vector_db.table
+        stmt = stmt if stmt is not None else select(*columns).where(table.c.embedding.is_not(None))
+        rows: List[Any] = []
+        for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+            rows.extend(sess.execute(stmt.where(table.c.id.in_(ids[i : i + LOOKUP_BATCH_SIZE]))).fetchall())
+        return rows
+
+    def _apply(self, rows: List[Any], full: bool) -> None:
+        with self._lock:
+            self.full = full
+            for row in rows:
+                self._put(row.id, (row.name, row.meta_data or {}, row.content, row.usage), row.embedding)
+            self._evict()
+
+    def _put(self, chunk_id: str, document: Tuple, embedding: Any) -> int:
+        # Called with self._lock held, returns the row of the chunk
+        vector = np.asarray(embedding, dtype=np.float32)
+        row = self._index.get(chunk_id)
+        if row is None:
+            row = self._size
+            if row == len(self._ids):
+                self._grow()
+            self._ids[row] = chunk_id
+            self._index[chunk_id] = row
+            self._size += 1
+        norm = float(np.linalg.norm(vector))
+        self._matrix[row] = vector / norm if norm > 0 else vector
+        self._norms[row] = norm
+        self._documents[row] = document
+        return row
+
+    def _grow(self) -> None:
+        # Called with self._lock held, doubles the capacity of the arrays
+        capacity = max(len(self._ids) * 2, 1024)
+        matrix = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+        matrix[: self._size] = self._matrix[: self._size]
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[: self._size] = self._norms[: self._size]
+        used = np.zeros(capacity, dtype=np.int64)
+        used[: self._size] = self._used[: self._size]
+        self._matrix, self._norms, self._used = matrix, norms, used
+        self._ids.extend([""] * (capacity - len(self._ids)))
+        self._documents.extend([(None, {}, "", None)] * (capacity - len(self._documents)))
+
+    def _remove(self, ids: Set[str]) -> None:
+        # Called with self._lock held, the last chunk moves to the row of a removed chunk
+        if not ids:
+            return
+        # Searches with a result that is no longer in memory do not bound the chunks that are not
+        for search, result_ids in enumerate(self._result_ids):
+            if self._valid[search] and not result_ids.isdisjoint(ids):
+                self._valid[search] = False
+        for chunk_id in ids:
+            row = self._index.pop(chunk_id, None)
+            if row is None:
+                continue
+            last = self._size - 1
+            if row != last:
+                self._ids[row] = self._ids[last]
+                self._index[self._ids[row]] = row
+                self._matrix[row] = self._matrix[last]
+                self._norms[row] = self._norms[last]
+                self._used[row] = self._used[last]
+                self._documents[row] = self._documents[last]
+            self._documents[last] = (None, {}, "", None)
+            self._size = last
+
+    def _evict(self) -> None:
+        # Called with self._lock held
+        if self.full or self._size <= self.max_chunks:
+            return
+        oldest = np.argsort(self._used[: self._size], kind="stable")[: self._size - self.max_chunks]
+        self._remove({self._ids[row] for row in oldest})
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1)
+    return vectors / np.where(norms > 0, norms, 1)[:, None]
+
+
+_vector_caches: Dict[str, VectorCache] = {}
+_vector_caches_lock = threading.Lock()
+
+
+def get_vector_cache(vector_db: "PgVector") -> VectorCache:
+    """Return the vector cache of a knowledge table, shared by the vector dbs of the table in the process."""
+    with _vector_caches_lock:
+        cache = _vector_caches.get(vector_db.table.fullname)
+        if cache is None:
+            cache = _vector_caches[vector_db.table.fullname] = VectorCache(vector_db)
+    return cache
@@ -0,0 +1,184 @@
+import asyncio
+from contextlib import asynccontextmanager
+from time import monotonic
+from typing import AsyncIterator, Dict, List, Optional
+
+from agno.tools.mcp import MCPTools
+from mcp import StdioServerParameters
+
+from agents.settings import agent_settings
+from utils.log import logger
+from utils.metrics import metrics_registry
+
+mcp_sessions = metrics_registry.gauge(
+    "mcp_pool_sessions",
+    "MCP server sessions held by the pool by state.",
+    ["state"],
+)
+mcp_session_starts_total = metrics_registry.counter(
+    "mcp_pool_session_starts_total",
+    "Number of MCP server processes started by the pool.",
+)
+
+
+class PooledMCPSession:
+    """An initialized MCPTools session owned by a dedicated task.
+
+    The stdio client behind MCPTools uses anyio task groups, which must be exited by the task that entered
+    them. The owner task enters the context, waits until the session is closed and exits it again.
+    """
+
+    def __init__(self, key: str, server_params: StdioServerParameters):
+        self.key = key
+        self.server_params = server_params
+        self.tools: Optional[MCPTools] = None
+        self.last_used: float = monotonic()
+        self._ready = asyncio.Event()
+        self._closed = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, timeout: float) -> None:
+        self._task = asyncio.create_task(self._run(), name=f"mcp-session-{self.key}")
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise
+        if self._error is not None:
+            raise self._error
+        mcp_session_starts_total.inc()
+
+    async def _run(self) -> None:
+        try:
+            async with MCPTools(server_params=self.server_params) as tools:
+                self.tools = tools
+                self._ready.set()
+                await self._closed.wait()
+        except Exception as e:
+            logger.error(f"MCP session for {self.key} failed: {e}")
+            self._error = e
+        finally:
+            self.tools = None
+            self._ready.set()
+
+    @property
+    def is_alive(self) -> bool:
+        return self.tools is not None and self._task is not None and not self._task.done()
+
+    async def close(self) -> None:
+        self._closed.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=10)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._task.cancel()
+
+
+class MCPSessionPool:
+    """Keeps pre-initialized MCP server sessions per system so agent runs do not spawn a process each time.
+
+    A session is leased to one agent run at a time. Idle sessions are kept for `idle_timeout` seconds.
+    `warm` starts `min_idle` sessions of a system ahead of its first run, and the last `min_idle` idle
+    sessions of a system are not closed when they expire.
+
+    Usage:
+        async with mcp_session_pool.session("system-1", server_params) as mcp_tools:
+            agent = create_db2i_agent(tools=[mcp_tools])
+    """
+
+    def __init__(self, max_size: int = 4, min_idle: int = 1, idle_timeout: int = 600, start_timeout: float = 60):
+        self.max_size = max_size
+        self.min_idle = min_idle
+        self.idle_timeout = idle_timeout
+        self.start_timeout = start_timeout
+
+        self._idle: Dict[str, List[PooledMCPSession]] = {}
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._leased = 0
+
+    @asynccontextmanager
+    async def session(self, key: str, server_params: StdioServerParameters) -> AsyncIterator[MCPTools]:
+        """Lease an initialized session for `key`, starting one if none is idle."""
+        limit = self._limits.setdefault(key, asyncio.Semaphore(self.max_size))
+        async with limit:
+            pooled = await self._get(key, server_params)
+            self._leased += 1
+            self._update_gauges()
+            # Only a run that ended normally returns the session to the pool. After a failure, a cancellation
+            # or a closed stream the server may still be in a tool call, and its late response would go to the
+            # next run
+            healthy = False
+            try:
+                if pooled.tools is None:
+                    raise RuntimeError(f"MCP session for {key} is not available")
+                yield pooled.tools
+                healthy = True
+            finally:
+                self._leased -= 1
+                if healthy and pooled.is_alive:
+                    pooled.last_used = monotonic()
+                    self._idle.setdefault(key, []).append(pooled)
+                else:
+                    await pooled.close()
+                await self._reap()
+
+    async def warm(self, key: str, server_params: StdioServerParameters, count: Optional[int] = None) -> None:
+        """Start idle sessions for `key` ahead of the first run, up to `count` or `min_idle`."""
+        idle = self._idle.setdefault(key, [])
+        while len(idle) < min(count or self.min_idle, self.max_size):
+            logger.info(f"Starting MCP session for {key}")
+            pooled = PooledMCPSession(key, server_params)
+            try:
+                await pooled.start(self.start_timeout)
+            except asyncio.CancelledError:
+                # The api is shutting down, stop the server process that was starting
+                await pooled.close()
+                raise
+            pooled.last_used = monotonic()
+            idle.append(pooled)
+        self._update_gauges()
+
+    async def close(self) -> None:
+        """Close all idle sessions. Leased sessions are closed when they are returned."""
+        sessions = [pooled for idle in self._idle.values() for pooled in idle]
+        self._idle = {}
+        await asyncio.gather(*(pooled.close() for pooled in sessions), return_exceptions=True)
+        self._update_gauges()
+
+    async def _get(self, key: str, server_params: StdioServerParameters) -> PooledMCPSession:
+        await self._reap()
+        idle = self._idle.get(key, [])
+        while idle:
+            # Use the most recently returned session, so older ones expire when load drops
+            pooled = idle.pop()
+            if pooled.is_alive and pooled.server_params == server_params:
+                return pooled
+            await pooled.close()
+
+        logger.info(f"Starting MCP session for {key}")
+        pooled = PooledMCPSession(key, server_params)
+        await pooled.start(self.start_timeout)
+        return pooled
+
+    async def _reap(self) -> None:
+        now = monotonic()
+        expired: List[PooledMCPSession] = []
+        for key, idle in self._idle.items():
+            # idle is ordered by return time, oldest first
+            while len(idle) > self.min_idle and now - idle[0].last_used > self.idle_timeout:
+                expired.append(idle.pop(0))
+        await asyncio.gather(*(pooled.close() for pooled in expired), return_exceptions=True)
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        mcp_sessions.set(sum(len(idle) for idle in self._idle.values()), state="idle")
+        mcp_sessions.set(self._leased, state="leased")
+
+
+# Create MCPSessionPool object
+mcp_session_pool = MCPSessionPool(
+    max_size=agent_settings.mcp_pool_max_size,
+    min_idle=agent_settings.mcp_pool_min_idle,
+    idle_timeout=agent_settings.mcp_pool_idle_timeout,
+)
@@ -1,13 +1,11 @@
 from enum import Enum
 from typing import List, Optional
 
-from agents.sage import get_sage
-from agents.scholar import get_scholar
-
 
 class AgentType(Enum):
     SAGE = "sage"
     SCHOLAR = "scholar"
+    DB2I = "db2i"
 
 
 def get_available_agents() -> List[str]:
@@ -22,7 +20,17 @@ def get_agent(
     session_id: Optional[str] = None,
     debug_mode: bool = True,
 ):
+    # Agent modules import agno, pgvector and the model clients, they are only loaded when an agent is built
     if agent_id == AgentType.SAGE:
+        from agents.sage import get_sage
+
         return get_sage(model_id=model_id, user_id=user_id, session_id=session_id, debug_mode=debug_mode)
+    elif agent_id == AgentType.DB2I:
+        from agents.db2i_agent import get_db2i_agent
+
+        # Without MCP tools, use pooled_db2i_agent_session to run the Db2i agent
+        return get_db2i_agent(model_id=model_id, user_id=user_id, session_id=session_id, debug_mode=debug_mode)
     else:
+        from agents.scholar import get_scholar
+
         return get_scholar(model_id=model_id, user_id=user_id, session_id=session_id, debug_mode=debug_mode)
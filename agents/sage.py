@@ -3,11 +3,26 @@ from typing import Optional
 
 from agno.agent import Agent, AgentKnowledge
 from agno.models.openai import OpenAIChat
-from agno.storage.agent.postgres import PostgresAgentStorage
-from agno.tools.duckduckgo import DuckDuckGoTools
-from agno.vectordb.pgvector import PgVector, SearchType
+from agno.vectordb.pgvector import SearchType
 
-from db.session import db_url
+from agents.knowledge.index import get_vector_index
+from agents.knowledge.quantization import QuantizedPgVector
+from agents.settings import agent_settings
+from agents.storage import get_agent_storage
+from agents.tools.search import CachedDuckDuckGoTools
+from db.session import db_engine
+
+
+def get_sage_knowledge() -> AgentKnowledge:
+    """Return the knowledge base of Sage, documents are added with agents.knowledge.ingest."""
+    return AgentKnowledge(
+        vector_db=QuantizedPgVector(
+            table_name="sage_knowledge",
+            db_engine=db_engine,
+            search_type=SearchType(agent_settings.knowledge_search_type),
+            vector_index=get_vector_index(),
+        )
+    )
 
 
 def get_sage(
@@ -29,13 +44,11 @@ def get_sage(
         session_id=session_id,
         model=OpenAIChat(id=model_id),
         # Tools available to the agent
-        tools=[DuckDuckGoTools()],
+        tools=[CachedDuckDuckGoTools()],
         # Storage for the agent
-        storage=PostgresAgentStorage(table_name="sage_sessions", db_url=db_url),
+        storage=get_agent_storage("sage_sessions"),
         # Knowledge base for the agent
-        knowledge=AgentKnowledge(
-            vector_db=PgVector(table_name="sage_knowledge", db_url=db_url, search_type=SearchType.hybrid)
-        ),
+        knowledge=get_sage_knowledge(),
         # Description of the agent
         description=dedent("""\
             You are Sage, an advanced Knowledge Agent designed to deliver accurate, context-rich, engaging responses.
@@ -3,10 +3,9 @@ from typing import Optional
 
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
-from agno.storage.agent.postgres import PostgresAgentStorage
-from agno.tools.duckduckgo import DuckDuckGoTools
 
-from db.session import db_url
+from agents.storage import get_agent_storage
+from agents.tools.search import CachedDuckDuckGoTools
 
 
 def get_scholar(
@@ -28,9 +27,9 @@ def get_scholar(
         session_id=session_id,
         model=OpenAIChat(id=model_id),
         # Tools available to the agent
-        tools=[DuckDuckGoTools()],
+        tools=[CachedDuckDuckGoTools()],
         # Storage for the agent
-        storage=PostgresAgentStorage(table_name="scholar_sessions", db_url=db_url),
+        storage=get_agent_storage("scholar_sessions"),
         # Description of the agent
         description=dedent("""\
             You are Scholar, a cutting-edge Answer Engine built to deliver precise, context-rich, and engaging responses.
@@ -0,0 +1,147 @@
+from dataclasses import dataclass
+from datetime import timedelta
+from time import monotonic
+from typing import TYPE_CHECKING, List, Optional
+
+from sqlalchemy import delete, select
+
+from agents.settings import agent_settings
+from db.session import SessionLocal
+from db.tables.response_cache import ResponseCacheTable
+from utils.dttm import current_utc
+from utils.log import logger
+from utils.metrics import metrics_registry
+
+if TYPE_CHECKING:
+    from agno.embedder.openai import OpenAIEmbedder
+
+semantic_cache_requests_total = metrics_registry.counter(
+    "semantic_cache_requests_total",
+    "Semantic cache lookups by result (hit or miss).",
+    ["agent_id", "result"],
+)
+
+
+@dataclass
+class CacheLookup:
+    """Result of a semantic cache lookup. The prompt embedding is kept so a miss can be stored without re-embedding."""
+
+    embedding: List[float]
+    response: Optional[str] = None
+    similarity: Optional[float] = None
+
+    @property
+    def hit(self) -> bool:
+        return self.response is not None
+
+
+class SemanticCache:
+    """Caches agent answers by prompt similarity using pgvector.
+
+    A prompt is a hit when a previous prompt for the same agent and model has a cosine similarity of at
+    least `threshold` and the cached answer is younger than the agent's TTL. Expired answers are deleted by
+    `store`, at most once every `purge_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        threshold: float = agent_settings.semantic_cache_threshold,
+        ttl: Optional[dict] = None,
+        embedder: Optional["OpenAIEmbedder"] = None,
+        purge_interval: float = agent_settings.semantic_cache_purge_interval,
+    ):
+        # Imported here, the openai client is slow to import and the cache is disabled by default
+        from agno.embedder.openai import OpenAIEmbedder
+
+        self.threshold = threshold
+        self.ttl = ttl if ttl is not None else agent_settings.semantic_cache_ttl
+        self.purge_interval = purge_interval
+        self._purged_at: Optional[float] = None
+        self.embedder = embedder or OpenAIEmbedder(
+            id=agent_settings.semantic_cache_embedder, dimensions=agent_settings.semantic_cache_dimensions
+        )
+
+    def is_cacheable(self, agent_id: str) -> bool:
+        return self.ttl.get(agent_id, 0) > 0
+
+    def lookup(self, agent_id: str, model_id: str, prompt: str) -> Optional[CacheLookup]:
+        """Return the cached answer for a similar prompt, or a miss carrying the prompt embedding."""
+        if not self.is_cacheable(agent_id):
+            return None
+
+        embedding = self.embedder.get_embedding(prompt)
+        if not embedding:
+            return None
+
+        distance = ResponseCacheTable.embedding.cosine_distance(embedding)
+        fresh_after = current_utc() - timedelta(seconds=self.ttl[agent_id])
+        with SessionLocal() as db:
+            row = db.execute(
+                select(ResponseCacheTable.response, distance.label("distance"))
+                .where(
+                    ResponseCacheTable.agent_id == agent_id,
+                    ResponseCacheTable.model_id == model_id,
+                    ResponseCacheTable.created_at >= fresh_after,
+                )
+                .order_by(distance)
+                .limit(1)
+            ).first()
+
+        if row is not None and 1 - row.distance >= self.threshold:
+            semantic_cache_requests_total.inc(agent_id=agent_id, result="hit")
+            logger.debug(f"Semantic cache hit for {agent_id} (similarity: {1 - row.distance:.3f})")
+            return CacheLookup(embedding=embedding, response=row.response, similarity=1 - row.distance)
+
+        semantic_cache_requests_total.inc(agent_id=agent_id, result="miss")
+        return CacheLookup(embedding=embedding)
+
+    def store(self, agent_id: str, model_id: str, prompt: str, embedding: List[float], response: str) -> None:
+        if not response or not self.is_cacheable(agent_id):
+            return
+        with SessionLocal() as db, db.begin():
+            db.add(
+                ResponseCacheTable(
+                    agent_id=agent_id,
+                    model_id=model_id,
+                    prompt=prompt,
+                    embedding=embedding,
+                    response=response,
+                    created_at=current_utc(),
+                )
+            )
+        # Expired answers are never returned, without a purge they would fill the table and its index
+        if self._purged_at is None or monotonic() - self._purged_at >= self.purge_interval:
+            self._purged_at = monotonic()
+            try:
+                deleted = self.purge_expired()
+            except Exception as e:
+                logger.warning(f"Could not purge expired answers from the semantic cache: {e}")
+            else:
+                logger.debug(f"Purged {deleted} expired answers from the semantic cache")
+
+    def purge_expired(self) -> int:
+        """Delete answers older than their agent's TTL. Returns the number of deleted rows."""
+        deleted = 0
+        with SessionLocal() as db, db.begin():
+            for agent_id, ttl in self.ttl.items():
+                result = db.execute(
+                    delete(ResponseCacheTable).where(
+                        ResponseCacheTable.agent_id == agent_id,
+                        ResponseCacheTable.created_at < current_utc() - timedelta(seconds=ttl),
+                    )
+                )
+                deleted += result.rowcount or 0
+        return deleted
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the semantic cache if it is enabled."""
+    global _semantic_cache
+    if not agent_settings.semantic_cache_enabled:
+        return None
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache()
+    return _semantic_cache
+
+
+_semantic_cache: Optional[SemanticCache] = None
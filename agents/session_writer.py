@@ -0,0 +1,206 @@
+import atexit
+import threading
+from collections import OrderedDict
+from time import perf_counter
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from agents.settings import agent_settings
+from utils.log import logger
+from utils.metrics import metrics_registry
+
+if TYPE_CHECKING:
+    from agno.storage.session import Session
+
+    from agents.storage import AgentStorage
+
+session_writer_pending = metrics_registry.gauge(
+    "session_writer_pending",
+    "Agent sessions waiting to be written to the database.",
+)
+session_writer_flush_duration = metrics_registry.histogram(
+    "session_writer_flush_seconds",
+    "Time to write a batch of agent sessions.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+session_writer_written_total = metrics_registry.counter(
+    "session_writer_written_total",
+    "Agent sessions written in batches, coalesced updates of a session are written once.",
+)
+session_writer_submitted_total = metrics_registry.counter(
+    "session_writer_submitted_total",
+    "Agent session updates by how they were handled (queued or write_through when the queue was full).",
+    ["result"],
+)
+session_writer_errors_total = metrics_registry.counter(
+    "session_writer_errors_total",
+    "Failed batch writes, the sessions are retried with the next flush.",
+)
+
+# (table, session_id)
+SessionKey = Tuple[str, str]
+
+
+class SessionWriter:
+    """Writes agent sessions in the background, in coalesced batches.
+
+    An agent writes its whole session at the end of every run. With the writer the run returns right away
+    and the session is queued. A background thread writes queued sessions every `flush_interval` seconds,
+    or as soon as `batch_size` are queued, with one statement per table. Several updates of a session
+    before a flush are written once.
+
+    At most `max_unflushed` sessions are queued. When the queue is full, sessions are written by the caller
+    as before, so a slow database never causes more than `max_unflushed` sessions to be at risk.
+    Queued sessions are written on `close()`, which runs on shutdown of the api and at interpreter exit.
+    """
+
+    def __init__(self, flush_interval: float = 1.0, batch_size: int = 100, max_unflushed: int = 1000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_unflushed = max_unflushed
+
+        self._pending: "OrderedDict[SessionKey, Tuple[AgentStorage, Session]]" = OrderedDict()
+        # Sessions taken from the queue that are being written, so reads still see them
+        self._in_flight: Dict[SessionKey, "Session"] = {}
+        self._lock = threading.Lock()
+        # Only one batch is written at a time, so updates of a session are written in order
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    @staticmethod
+    def _key(storage: "AgentStorage", session_id: str) -> SessionKey:
+        return storage.table.fullname, session_id
+
+    def submit(self, storage: "AgentStorage", session: "Session") -> bool:
+        """Queue a session to be written. Returns False if the queue is full and the caller has to write it."""
+        key = self._key(storage, session.session_id)
+        with self._lock:
+            if self._closed or (key not in self._pending and len(self._pending) >= self.max_unflushed):
+                session_writer_submitted_total.inc(result="write_through")
+                self._wakeup.set()
+                return False
+            # Replace an earlier update of the session and move it to the end of the queue
+            self._pending.pop(key, None)
+            self._pending[key] = (storage, session)
+            pending = len(self._pending)
+            self._start()
+        session_writer_submitted_total.inc(result="queued")
+        session_writer_pending.set(pending)
+        if pending >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def get(self, storage: "AgentStorage", session_id: str) -> Optional["Session"]:
+        """Return the latest unwritten version of a session, None if it is not queued."""
+        key = self._key(storage, session_id)
+        with self._lock:
+            queued = self._pending.get(key)
+            if queued is not None:
+                return queued[1]
+            return self._in_flight.get(key)
+
+    def discard(self, storage: "AgentStorage", session_id: str) -> None:
+        """Drop a queued session, e.g. because it is deleted."""
+        with self._lock:
+            self._pending.pop(self._key(storage, session_id), None)
+            session_writer_pending.set(len(self._pending))
+
+    def flush(self) -> bool:
+        """Write all queued sessions. Returns False if a batch could not be written, it stays queued."""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch: List[Tuple[SessionKey, "AgentStorage", "Session"]] = []
+                    while self._pending and len(batch) < self.batch_size:
+                        key, (storage, session) = self._pending.popitem(last=False)
+                        batch.append((key, storage, session))
+                        self._in_flight[key] = session
+                    session_writer_pending.set(len(self._pending))
+                if not batch:
+                    return True
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    session_writer_errors_total.inc()
+                    logger.error(f"Could not write {len(batch)} agent sessions, retrying: {e}")
+                    self._requeue(batch)
+                    return False
+                finally:
+                    with self._lock:
+                        for key, _, _ in batch:
+                            self._in_flight.pop(key, None)
+
+    def _write(self, batch: List[Tuple[SessionKey, "AgentStorage", "Session"]]) -> None:
+        started_at = perf_counter()
+        by_table: Dict[str, Tuple["AgentStorage", List["Session"]]] = {}
+        for (table, _), storage, session in batch:
+            by_table.setdefault(table, (storage, []))[1].append(session)
+        for storage, sessions in by_table.values():
+            storage.upsert_many(sessions)
+        session_writer_flush_duration.observe(perf_counter() - started_at)
+        session_writer_written_total.inc(len(batch))
+
+    def _requeue(self, batch: List[Tuple[SessionKey, "AgentStorage", "Session"]]) -> None:
+        with self._lock:
+            for key, storage, session in reversed(batch):
+                # A newer update queued during the write replaces this one
+                if key not in self._pending:
+                    self._pending[key] = (storage, session)
+                    self._pending.move_to_end(key, last=False)
+            session_writer_pending.set(len(self._pending))
+
+    def _start(self) -> None:
+        # Called with self._lock held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Session writer failed: {e}")
+
+    def close(self, timeout: float = 30) -> None:
+        """Stop the background thread and write the queued sessions."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None:
+            thread.join(timeout=timeout)
+        if not self.flush():
+            with self._lock:
+                lost = [session_id for _, session_id in self._pending]
+            logger.error(f"Could not write {len(lost)} agent sessions on shutdown: {lost}")
+
+
+_session_writer: Optional[SessionWriter] = None
+_session_writer_lock = threading.Lock()
+
+
+def get_session_writer() -> SessionWriter:
+    """Return the SessionWriter shared by all agent storages of the process."""
+    global _session_writer
+
+    with _session_writer_lock:
+        if _session_writer is None:
+            _session_writer = SessionWriter(
+                flush_interval=agent_settings.session_flush_interval,
+                batch_size=agent_settings.session_flush_batch_size,
+                max_unflushed=agent_settings.session_max_unflushed,
+            )
+    return _session_writer
+
+
+def close_session_writer() -> None:
+    """Write the queued sessions, if write-behind was used."""
+    if _session_writer is not None:
+        _session_writer.close()
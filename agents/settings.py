@@ -0,0 +1,119 @@
+from typing import Dict
+
+from pydantic_settings import BaseSettings
+
+
+class AgentSettings(BaseSettings):
+    """Agent settings that can be set using environment variables.
+
+    Reference: https://docs.pydantic.dev/latest/usage/pydantic_settings/
+    """
+
+    # Semantic response cache, disabled by default
+    semantic_cache_enabled: bool = False
+    # Minimum cosine similarity between prompts for a cache hit
+    semantic_cache_threshold: float = 0.95
+    # Seconds a cached answer stays fresh, per agent. Agents not listed are never cached.
+    # Set as json, e.g. SEMANTIC_CACHE_TTL='{"scholar": 3600}'
+    semantic_cache_ttl: Dict[str, int] = {"scholar": 3600, "sage": 86400}
+    # Embedding model used to embed prompts
+    semantic_cache_embedder: str = "text-embedding-3-small"
+    semantic_cache_dimensions: int = 1536
+    # Seconds between deletes of expired answers, run by the process storing an answer
+    semantic_cache_purge_interval: float = 3600
+
+    # Pool of MCP server sessions for the Db2i agent, per system
+    mcp_pool_max_size: int = 4
+    # Idle sessions kept per system even after idle_timeout
+    mcp_pool_min_idle: int = 1
+    # Seconds an idle session is kept before its server process is stopped
+    mcp_pool_idle_timeout: int = 600
+    # Start min_idle sessions of every system when the api starts
+    mcp_pool_warm_on_startup: bool = True
+
+    # Compaction of agent sessions, applied when a session is written and by agents.compaction
+    session_compact_on_write: bool = True
+    # Most recent runs kept verbatim, older runs only keep the question, the answer and truncated tool results.
+    # Keep this above num_history_responses of the agents, those runs are sent to the model.
+    session_keep_runs: int = 10
+    # Runs beyond this many are dropped, 0 keeps all runs
+    session_max_runs: int = 100
+    # Characters kept of each tool result in compacted runs
+    session_max_tool_output_chars: int = 1000
+
+    # Write sessions in the background instead of at the end of every run, see agents.session_writer.
+    # Sessions queued when the process is killed without a shutdown are lost.
+    session_write_behind: bool = False
+    # Seconds between writes of queued sessions
+    session_flush_interval: float = 1.0
+    # Sessions written per statement, a write starts early once this many are queued
+    session_flush_batch_size: int = 100
+    # Queued sessions beyond this many are written by the agent run, as without write-behind
+    session_max_unflushed: int = 1000
+
+    # Sessions without a run for this many days are moved to the archive by agents.archive
+    session_archive_after_days: float = 90
+    # Restore archived sessions when they are read and list them with the active sessions
+    session_archive_enabled: bool = True
+
+    # Seconds web search results are shared between agents and processes, see utils.cache
+    search_cache_ttl: float = 3600
+    # Seconds table lists and definitions of Db2i schemas are cached
+    db2i_schema_cache_ttl: float = 600
+
+    # Ingestion of documents into knowledge bases, see agents.knowledge.ingest
+    # Chunks embedded per request to the embedding api
+    knowledge_embedding_batch_size: int = 64
+    # Embedding requests in flight at once, per ingestion
+    knowledge_embedding_concurrency: int = 4
+    # Embedded chunks written to the knowledge table per COPY
+    knowledge_write_batch_size: int = 500
+    # Chunks read from a document before they are embedded and written, bounds the memory of an ingestion
+    knowledge_ingest_window: int = 1000
+    # Processes parsing PDF pages for all ingestions of the process, 0 parses in the ingesting thread
+    knowledge_parse_processes: int = 2
+    # PDF pages parsed per task, and tasks of a file parsed ahead of the ingestion
+    knowledge_parse_pages_per_task: int = 8
+    knowledge_parse_prefetch: int = 4
+    # Threads of the ui process ingesting queued documents, 0 when `python -m agents.knowledge.jobs` runs them
+    knowledge_ingest_workers: int = 1
+    # Uploads waiting to be ingested, shared with separate workers, empty for a directory in the temp dir
+    knowledge_upload_dir: str = ""
+    # Chunks with at least this estimated Jaccard similarity to another chunk of their source are dropped as
+    # near-duplicates, see agents.knowledge.dedupe. 0 keeps every chunk.
+    knowledge_dedupe_threshold: float = 0.9
+    # Reuse embeddings of chunks with the same content from public.embedding_cache
+    knowledge_embedding_cache: bool = True
+    # Websites not crawled for this many seconds are crawled again by `python -m agents.knowledge.crawl --refresh`
+    knowledge_recrawl_interval: float = 86400
+    # How knowledge is searched: "hybrid" ranks every chunk by vector and text score, "vector" uses the vector index
+    knowledge_search_type: str = "hybrid"
+    # Vector index of the knowledge tables, "hnsw" or "ivfflat", created by agents.knowledge.index
+    knowledge_index_type: str = "hnsw"
+    # HNSW connections per node and candidates while building, higher is better recall, a larger and slower build
+    knowledge_hnsw_m: int = 16
+    knowledge_hnsw_ef_construction: int = 64
+    # HNSW candidates per search, at least the number of results, higher is better recall and slower
+    knowledge_hnsw_ef_search: int = 40
+    # IVFFlat lists, 0 sets them from the number of chunks when the index is built
+    knowledge_ivfflat_lists: int = 0
+    # IVFFlat lists searched per query, higher is better recall and slower
+    knowledge_ivfflat_probes: int = 10
+    # Memory for index builds, builds are much faster when the index fits
+    knowledge_index_maintenance_work_mem: str = "1GB"
+    # Build the vector index on "halfvec" or "binary" quantized embeddings, see agents.knowledge.quantization
+    knowledge_quantization: str = ""
+    # Candidates taken from a quantized index per result, re-ranked with the full precision embeddings
+    knowledge_rerank_factor: int = 4
+    # Answer vector searches from a copy of the embeddings in memory, see agents.knowledge.vector_cache
+    knowledge_vector_cache: bool = False
+    # Tables with at most this many chunks are copied whole, of larger tables the most recently found chunks are kept
+    knowledge_vector_cache_max_chunks: int = 20000
+    # Of a table that is not copied whole, Postgres searches remembered to answer the same or very close queries
+    knowledge_vector_cache_searches: int = 1000
+    # Seconds between refreshes of the copy from the knowledge table
+    knowledge_vector_cache_refresh_interval: float = 30
+
+
+# Create AgentSettings object
+agent_settings = AgentSettings()
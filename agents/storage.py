@@ -0,0 +1,305 @@
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from agno.storage.agent.postgres import PostgresAgentStorage
+from agno.storage.session import Session
+from sqlalchemy import ColumnElement, Index, Subquery, Table, func, literal, select, tuple_, union_all
+from sqlalchemy.dialects import postgresql
+
+from agents.compaction import CompactionPolicy, compact_memory
+from agents.session_writer import SessionWriter, get_session_writer
+from agents.settings import agent_settings
+from db.session import db_engine
+from db.tables.session_archive import SessionArchiveTable
+from utils.log import logger
+
+# Position in the session index: (last activity as epoch seconds, session_id) of the last entry of a page
+SessionCursor = Tuple[int, str]
+
+# Columns replaced when an existing agent session is written again
+SESSION_UPSERT_COLUMNS = (
+    "agent_id",
+    "team_session_id",
+    "user_id",
+    "memory",
+    "agent_data",
+    "session_data",
+    "extra_data",
+)
+
+
+def get_activity_index_name(table: Table) -> str:
+    """Name of the index used to list the sessions of a user and agent by last activity."""
+    return f"ix_{table.schema}_{table.name}_user_agent_activity"
+
+
+class AgentStorage(PostgresAgentStorage):
+    """PostgresAgentStorage that compacts sessions and can write them in the background.
+
+    Old runs are reduced to their question, answer and truncated tool results, so writing and loading a
+    session does not get slower as the conversation grows. See agents.compaction.
+
+    With a session_writer, `upsert` queues the session and returns it without waiting for the database,
+    see agents.session_writer. Reads return the queued version of a session until it is written.
+
+    With archive enabled, reading an archived session moves it back to the session table, see agents.archive.
+    """
+
+    def __init__(
+        self,
+        *args,
+        compaction_policy: Optional[CompactionPolicy] = None,
+        session_writer: Optional[SessionWriter] = None,
+        archive: bool = False,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.compaction_policy: Optional[CompactionPolicy] = compaction_policy
+        self.session_writer: Optional[SessionWriter] = session_writer
+        self.archive: bool = archive
+
+    def get_table(self) -> Table:
+        table = super().get_table()
+        # Index for get_session_index, agno only indexes user_id and agent_id separately.
+        # Existing tables get it from the migration 6a1f3e9c2b74.
+        index_name = get_activity_index_name(table)
+        if not any(index.name == index_name for index in table.indexes):
+            Index(
+                index_name,
+                table.c.user_id,
+                table.c.agent_id,
+                func.coalesce(table.c.updated_at, table.c.created_at).desc(),
+                table.c.session_id.desc(),
+            )
+        return table
+
+    def read(self, session_id: str, user_id: Optional[str] = None) -> Optional[Session]:
+        if self.session_writer is not None:
+            session = self.session_writer.get(self, session_id)
+            if session is not None:
+                return session if user_id is None or session.user_id == user_id else None
+        session = super().read(session_id, user_id=user_id)
+        if session is None and self.archive:
+            self._rehydrate(session_id)
+            # Read again even if this read restored nothing, a concurrent read may have restored the session
+            session = super().read(session_id, user_id=user_id)
+        return session
+
+    def _rehydrate(self, session_id: str) -> None:
+        from agents.archive import rehydrate_session
+
+        try:
+            rehydrate_session(self, session_id)
+        except Exception as e:
+            logger.warning(f"Could not restore archived session {session_id}: {e}")
+
+    def upsert(self, session: Session, create_and_retry: bool = True) -> Optional[Session]:
+        if self.compaction_policy is not None:
+            compact_memory(session.memory, self.compaction_policy)
+        if self.session_writer is not None and self.session_writer.submit(self, session):
+            return session
+        return super().upsert(session, create_and_retry=create_and_retry)
+
+    def upsert_many(self, sessions: List[Session], create_and_retry: bool = True) -> None:
+        """
+        Insert or update sessions with one statement, in one transaction.
+
+        Args:
+            sessions (List[Session]): Agent sessions with distinct session_ids.
+            create_and_retry (bool): Create the table and retry if it does not exist.
+
+        Raises:
+            Exception: If the sessions could not be written.
+        """
+        stmt = postgresql.insert(self.table).values(
+            [
+                dict(
+                    session_id=session.session_id,
+                    agent_id=session.agent_id,  # type: ignore[union-attr]
+                    team_session_id=session.team_session_id,  # type: ignore[union-attr]
+                    user_id=session.user_id,
+                    memory=session.memory,
+                    agent_data=session.agent_data,  # type: ignore[union-attr]
+                    session_data=session.session_data,
+                    extra_data=session.extra_data,
+                )
+                for session in sessions
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["session_id"],
+            set_={
+                **{column: stmt.excluded[column] for column in SESSION_UPSERT_COLUMNS},
+                "updated_at": int(time.time()),
+            },
+        )
+        try:
+            with self.Session() as sess, sess.begin():
+                sess.execute(stmt)
+        except Exception:
+            if create_and_retry and not self.table_exists():
+                self.create()
+                return self.upsert_many(sessions, create_and_retry=False)
+            raise
+
+    def delete_session(self, session_id: Optional[str] = None):
+        if self.session_writer is not None and session_id is not None:
+            self.session_writer.discard(self, session_id)
+        super().delete_session(session_id)
+        if self.archive and session_id is not None:
+            from agents.archive import delete_archived_session
+
+            try:
+                delete_archived_session(self, session_id)
+            except Exception as e:
+                logger.warning(f"Could not delete archived session {session_id}: {e}")
+
+
+def get_agent_storage(
+    table_name: str,
+    compact_on_write: bool = agent_settings.session_compact_on_write,
+    write_behind: bool = agent_settings.session_write_behind,
+    archive: bool = agent_settings.session_archive_enabled,
+) -> PostgresAgentStorage:
+    """
+    Get the storage for the sessions of an agent.
+
+    Storages use the shared db_engine of the app instead of creating an engine, and a connection pool,
+    for every agent.
+
+    Args:
+        table_name (str): The table to store the sessions in, e.g. "sage_sessions".
+        compact_on_write (bool): Compact the session memory when a session is written.
+        write_behind (bool): Write sessions in the background instead of at the end of every run.
+        archive (bool): Restore archived sessions when they are read.
+
+    Returns:
+        PostgresAgentStorage: The storage for the agent.
+    """
+    return AgentStorage(
+        table_name=table_name,
+        db_engine=db_engine,
+        compaction_policy=CompactionPolicy() if compact_on_write else None,
+        session_writer=get_session_writer() if write_behind else None,
+        archive=archive,
+    )
+
+
+@dataclass
+class SessionIndexEntry:
+    """A session without its memory, enough to list it."""
+
+    session_id: str
+    name: Optional[str]
+    # Epoch seconds of the last write, or of the creation if the session was written once
+    updated_at: Optional[int]
+    # Moved to the archive, it is restored when it is read
+    archived: bool = False
+
+    @property
+    def display_name(self) -> str:
+        return self.name or self.session_id
+
+
+def _session_index_page(
+    session_id: ColumnElement,
+    session_name: ColumnElement,
+    last_activity: ColumnElement,
+    conditions: List[ColumnElement],
+    after: Optional[SessionCursor],
+    limit: int,
+    archived: bool,
+) -> Subquery:
+    stmt = select(
+        session_id.label("session_id"),
+        session_name.label("session_name"),
+        last_activity.label("last_activity"),
+        literal(archived).label("archived"),
+    ).where(*conditions)
+    if after is not None:
+        stmt = stmt.where(tuple_(last_activity, session_id) < tuple_(literal(after[0]), literal(after[1])))
+    return stmt.order_by(last_activity.desc(), session_id.desc()).limit(limit).subquery()
+
+
+def get_session_index(
+    storage: PostgresAgentStorage,
+    user_id: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    limit: int = 20,
+    after: Optional[SessionCursor] = None,
+) -> Tuple[List[SessionIndexEntry], Optional[SessionCursor]]:
+    """
+    List sessions by last activity, newest first, without loading their memory.
+
+    Unlike `storage.get_all_sessions()`, only the id, name and timestamp of `limit` sessions are read,
+    so the cost does not grow with the number or size of stored sessions. Archived sessions of an
+    AgentStorage with archive enabled are listed with the others.
+
+    Args:
+        storage (PostgresAgentStorage): The storage of the agent.
+        user_id (Optional[str]): Only list sessions of this user.
+        agent_id (Optional[str]): Only list sessions of this agent.
+        limit (int): Number of sessions per page.
+        after (Optional[SessionCursor]): Cursor returned with the previous page.
+
+    Returns:
+        Tuple[List[SessionIndexEntry], Optional[SessionCursor]]: The sessions and the cursor of the
+            next page, None if this is the last page.
+    """
+    table = storage.table
+    conditions = []
+    if user_id is not None:
+        conditions.append(table.c.user_id == user_id)
+    if agent_id is not None:
+        conditions.append(table.c.agent_id == agent_id)
+    # Fetch one more row to know if there is a next page
+    page = _session_index_page(
+        table.c.session_id,
+        table.c.session_data["session_name"].astext,
+        # updated_at is only set when a session is written again
+        func.coalesce(table.c.updated_at, table.c.created_at),
+        conditions,
+        after,
+        limit + 1,
+        archived=False,
+    )
+
+    if getattr(storage, "archive", False):
+        archive = SessionArchiveTable.__table__
+        archive_conditions = [archive.c.table_name == storage.table_name]
+        if user_id is not None:
+            archive_conditions.append(archive.c.user_id == user_id)
+        if agent_id is not None:
+            archive_conditions.append(archive.c.agent_id == agent_id)
+        archived_page = _session_index_page(
+            archive.c.session_id,
+            archive.c.session_name,
+            archive.c.last_activity,
+            archive_conditions,
+            after,
+            limit + 1,
+            archived=True,
+        )
+        # Each side reads at most limit + 1 rows from its index
+        page = union_all(select(page), select(archived_page)).subquery()
+
+    stmt = select(page).order_by(page.c.last_activity.desc(), page.c.session_id.desc()).limit(limit + 1)
+    try:
+        with storage.Session() as sess:
+            rows = sess.execute(stmt).fetchall()
+    except Exception as e:
+        # The table is created by the storage on the first write
+        logger.debug(f"Could not read session index from {storage.table_name}: {e}")
+        return [], None
+
+    entries = [
+        SessionIndexEntry(
+            session_id=row.session_id, name=row.session_name, updated_at=row.last_activity, archived=row.archived
+        )
+        for row in rows[:limit]
+    ]
+    next_cursor: Optional[SessionCursor] = None
+    if len(rows) > limit:
+        next_cursor = (entries[-1].updated_at, entries[-1].session_id)  # type: ignore[assignment]
+    return entries, next_cursor
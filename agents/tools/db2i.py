@@ -4,6 +4,9 @@ from typing import Any, Dict, Iterator, Literal, Optional, Union
 from agno.tools.toolkit import Toolkit
 from mapepire_python import Connection, DaemonServer, connect
 from pep249 import QueryParameters, ResultRow, ResultSet
+
+from agents.settings import agent_settings
+from utils.cache import Cache, get_cache
 from utils.log import logger
 
 def truncate_word(content: Any, *, length: int, suffix: str = "...") -> str:
@@ -45,6 +48,10 @@ class SQLTools(Toolkit):
         # Tables this toolkit can access
         self.tables: Optional[Dict[str, Any]] = tables
 
+        # Table lists and definitions are shared by all agents connected to the same system and schema
+        self.schema_cache: Cache = get_cache("db2i_schema")
+        self.schema_cache_ttl = agent_settings.db2i_schema_cache_ttl
+
         # Register functions in the toolkit
         if list_tables:
             self.register(self.list_tables)
@@ -130,6 +137,19 @@ class SQLTools(Toolkit):
         result = self._execute(sql, options=[table, self.schema])
         return "\n".join(res["SRCDTA"] for res in result)
 
+    def _schema_cache_key(self, *parts: str) -> str:
+        return ":".join([str(self.host), str(self.port), str(self.schema), *parts])
+
+    def _get_table_names(self) -> list:
+        sql = """
+            SELECT TABLE_NAME as name, TABLE_TYPE
+            FROM QSYS2.SYSTABLES
+            WHERE TABLE_SCHEMA = ? AND TABLE_TYPE = 'T'
+            ORDER BY TABLE_NAME
+        """
+        result = self._execute(sql, options=[self.schema], fetch="all")
+        return [row["NAME"] for row in result]
+
     def list_tables(self) -> str:
         """Use this function to get a list of table names in the database.
 
@@ -140,17 +160,10 @@ class SQLTools(Toolkit):
             return json.dumps(self.tables)
         
         try:
-            sql = f"""
-                SELECT TABLE_NAME as name, TABLE_TYPE
-                FROM QSYS2.SYSTABLES
-                WHERE TABLE_SCHEMA = ? AND TABLE_TYPE = 'T'
-                ORDER BY TABLE_NAME        
-            """
-
-            options = [self.schema]
-            result = self._execute(sql, options=options, fetch="all")
-            names = [row["NAME"] for row in result]
-
+            # Failed queries return no rows, so empty results are not cached
+            names = self.schema_cache.get_or_set(
+                self._schema_cache_key("tables"), self._get_table_names, ttl=self.schema_cache_ttl, cache_if=bool
+            )
             return json.dumps(names)
         except Exception as e:
             logger.error(f"Error getting tables: {e}")
@@ -167,7 +180,12 @@ class SQLTools(Toolkit):
         """
         try:
             logger.debug(f"Describing table: {table_name}")
-            definition = self._get_table_definition(table_name)
+            definition = self.schema_cache.get_or_set(
+                self._schema_cache_key("table", table_name),
+                lambda: self._get_table_definition(table_name),
+                ttl=self.schema_cache_ttl,
+                cache_if=bool,
+            )
             return definition
         except Exception as e:
             logger.error(f"Error getting table schema: {e}")
@@ -0,0 +1,53 @@
+from agno.tools.duckduckgo import DuckDuckGoTools
+
+from agents.settings import agent_settings
+from utils.cache import Cache, get_cache
+
+
+class CachedDuckDuckGoTools(DuckDuckGoTools):
+    """DuckDuckGoTools that share results through the app cache.
+
+    Sage and Scholar often search for the same things, and searches are slow and rate limited. Results are
+    kept for `ttl` seconds and shared by all agents, api workers and ui processes using the same cache.
+    """
+
+    def __init__(self, ttl: float = agent_settings.search_cache_ttl, **kwargs):
+        super().__init__(**kwargs)
+        self.search_cache: Cache = get_cache("web_search")
+        self.search_cache_ttl = ttl
+
+    def _cache_key(self, kind: str, query: str, max_results: int) -> str:
+        return f"{kind}:{self.fixed_max_results or max_results}:{self.modifier or ''}:{query}"
+
+    def duckduckgo_search(self, query: str, max_results: int = 5) -> str:
+        """Use this function to search DuckDuckGo for a query.
+
+        Args:
+            query(str): The query to search for.
+            max_results (optional, default=5): The maximum number of results to return.
+
+        Returns:
+            The result from DuckDuckGo.
+        """
+        return self.search_cache.get_or_set(
+            self._cache_key("text", query, max_results),
+            lambda: super(CachedDuckDuckGoTools, self).duckduckgo_search(query, max_results=max_results),
+            ttl=self.search_cache_ttl,
+        )
+
+    def duckduckgo_news(self, query: str, max_results: int = 5) -> str:
+        """Use this function to get the latest news from DuckDuckGo.
+
+        Args:
+            query(str): The query to search for.
+            max_results (optional, default=5): The maximum number of results to return.
+
+        Returns:
+            The latest news from DuckDuckGo.
+        """
+        # News get stale faster than search results
+        return self.search_cache.get_or_set(
+            self._cache_key("news", query, max_results),
+            lambda: super(CachedDuckDuckGoTools, self).duckduckgo_news(query, max_results=max_results),
+            ttl=min(self.search_cache_ttl, 600),
+        )
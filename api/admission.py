@@ -0,0 +1,225 @@
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from time import monotonic
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from api.settings import api_settings
+from utils.metrics import metrics_registry
+
+######################################################
+## Admission control for agent runs
+######################################################
+
+admission_queue_depth = metrics_registry.gauge(
+    "agent_admission_queue_depth",
+    "Number of agent runs waiting for admission.",
+)
+admission_users_waiting = metrics_registry.gauge(
+    "agent_admission_users_waiting",
+    "Number of users with at least one agent run waiting for admission.",
+)
+admission_running = metrics_registry.gauge(
+    "agent_admission_running",
+    "Number of admitted agent runs holding a concurrency slot.",
+)
+admission_wait = metrics_registry.histogram(
+    "agent_admission_wait_seconds",
+    "Time agent runs waited in the admission queue.",
+    buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+admission_rejected_total = metrics_registry.counter(
+    "agent_admission_rejected_total",
+    "Number of agent runs rejected because the admission queue was full.",
+)
+
+ANONYMOUS_USER = "anonymous"
+
+
+class AdmissionRejected(Exception):
+    """Raised when the admission queue is full."""
+
+
+class TokenBucket:
+    """Token bucket that refills `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = monotonic()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available. Returns 0 on success, otherwise the seconds until the next token."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.rate
+
+    @property
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """Limits agent runs with a per-user token bucket and a global concurrency cap.
+
+    Runs that cannot start right away wait instead of being rejected. Each user has a FIFO queue, and
+    slots are handed out round-robin across users, so a burst from one user cannot starve the others.
+    Runs are only rejected when `max_queued` runs are already waiting.
+
+    Usage:
+        async with admission_controller.admit(user_id):
+            response = await agent.arun(message)
+    """
+
+    def __init__(self, max_concurrent: int, rate_per_minute: float, burst: int, max_queued: int):
+        self.max_concurrent = max_concurrent
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_queued = max_queued
+
+        self._running = 0
+        self._queued = 0
+        # user_id -> FIFO of waiting futures, ordered by the round-robin turn of each user
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def is_full(self) -> bool:
+        return self.max_queued > 0 and self._queued >= self.max_queued
+
+    @asynccontextmanager
+    async def admit(self, user_id: Optional[str], reject_when_full: bool = True) -> AsyncIterator[None]:
+        """Wait until the run is admitted and hold a concurrency slot while the block runs.
+
+        Args:
+            user_id: The user the run belongs to.
+            reject_when_full: Raise AdmissionRejected if `max_queued` runs are waiting. Background jobs
+                pass False, they are already bounded by the number of job workers.
+        """
+        await self._acquire(user_id or ANONYMOUS_USER, reject_when_full)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, user_id: str, reject_when_full: bool) -> None:
+        if reject_when_full and self.is_full:
+            admission_rejected_total.inc()
+            raise AdmissionRejected(f"Too many queued agent runs ({self._queued})")
+
+        waiter: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user_id, deque()).append(waiter)
+        self._queued += 1
+        self._update_gauges()
+        started_at = monotonic()
+
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted right before the caller went away, give the slot back
+                self._release()
+            else:
+                self._remove_waiter(user_id, waiter)
+            raise
+        finally:
+            admission_wait.observe(monotonic() - started_at)
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._update_gauges()
+        self._dispatch()
+
+    def _remove_waiter(self, user_id: str, waiter: asyncio.Future) -> None:
+        queue = self._waiters.get(user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._waiters[user_id]
+        self._update_gauges()
+
+    def _bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(rate=self.rate, capacity=self.burst)
+        return bucket
+
+    def _dispatch(self) -> None:
+        """Admit waiting runs round-robin across users while slots and tokens are available."""
+        next_token_in = float("inf")
+        skipped = 0
+        while self._running < self.max_concurrent and self._waiters and skipped < len(self._waiters):
+            user_id, queue = next(iter(self._waiters.items()))
+            # Drop waiters whose caller went away, they are removed from the counts here
+            while queue and queue[0].done():
+                queue.popleft()
+                self._queued -= 1
+            if not queue:
+                del self._waiters[user_id]
+                continue
+            # Move the user to the back of the round-robin order
+            self._waiters.move_to_end(user_id)
+
+            wait = self._bucket(user_id).try_acquire()
+            if wait > 0:
+                next_token_in = min(next_token_in, wait)
+                skipped += 1
+                continue
+
+            skipped = 0
+            waiter = queue.popleft()
+            if not queue:
+                del self._waiters[user_id]
+            self._queued -= 1
+            self._running += 1
+            waiter.set_result(None)
+
+        # All waiting users are rate limited, retry when the next token is available
+        if self._waiters and self._running < self.max_concurrent and next_token_in != float("inf"):
+            self._schedule_dispatch(next_token_in)
+
+        self._forget_idle_buckets()
+        self._update_gauges()
+
+    def _schedule_dispatch(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _forget_idle_buckets(self) -> None:
+        # Full buckets without waiters behave exactly like new ones, drop them to bound memory
+        if len(self._buckets) > 1000:
+            for user_id in [u for u, b in self._buckets.items() if u not in self._waiters and b.is_full]:
+                del self._buckets[user_id]
+
+    def _update_gauges(self) -> None:
+        admission_queue_depth.set(self._queued)
+        admission_users_waiting.set(len(self._waiters))
+        admission_running.set(self._running)
+
+
+# Create AdmissionController object
+admission_controller = AdmissionController(
+    max_concurrent=api_settings.max_concurrent_runs,
+    rate_per_minute=api_settings.user_runs_per_minute,
+    burst=api_settings.user_run_burst,
+    max_queued=api_settings.max_queued_runs,
+)
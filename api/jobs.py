@@ -0,0 +1,325 @@
+import asyncio
+import os
+import socket
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+from uuid import uuid4
+
+from sqlalchemy import and_, or_, select, update
+
+from agents.operator import AgentType, get_agent
+from api.admission import admission_controller
+from api.metrics import AgentRunTracker
+from api.settings import api_settings
+from db.session import AsyncSessionLocal
+from db.tables.jobs import FINISHED_STATUSES, JobsTable, JobStatus
+from utils.dttm import current_utc
+from utils.log import logger
+
+if TYPE_CHECKING:
+    from agno.agent import Agent
+    from agno.run.response import RunResponse
+
+######################################################
+## In-process worker pool for background jobs
+######################################################
+
+
+JobHandler = Callable[[JobsTable], Awaitable[Dict[str, Any]]]
+
+
+class JobManager:
+    """Runs jobs persisted in the `jobs` table on a pool of asyncio workers.
+
+    Jobs are claimed from Postgres using `FOR UPDATE SKIP LOCKED`, so several api processes can share the
+    same table. Running jobs send a heartbeat, and jobs whose heartbeat is older than `stale_after` seconds
+    are claimed again, which recovers jobs from workers that were restarted or crashed.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 4,
+        heartbeat_interval: int = 10,
+        stale_after: int = 60,
+        poll_interval: float = 2.0,
+    ):
+        self.num_workers = num_workers
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """Register the coroutine that executes jobs of the given kind."""
+        self._handlers[kind] = handler
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.num_workers)]
+        logger.info(f"Started {self.num_workers} job workers: {self.worker_id}")
+
+    async def stop(self) -> None:
+        """Stop the workers. Jobs that are still running are put back on the queue."""
+        self._stopping = True
+        for task in self._running.values():
+            task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._running = {}
+
+    async def submit(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        agent_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ) -> JobsTable:
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+        job = await self._insert_job(kind, payload, agent_id, user_id, session_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[JobsTable]:
+        return await self._read_job(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[JobsTable]:
+        """Cancel a job. Queued jobs are never started, running jobs are interrupted at their next heartbeat."""
+        job = await self._cancel_job(job_id)
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        return job
+
+    ######################################################
+    ## Workers
+    ######################################################
+
+    async def _worker(self, index: int) -> None:
+        while not self._stopping:
+            try:
+                job = await self._claim_job()
+            except Exception as e:
+                logger.error(f"Job worker {index} could not claim a job: {e}")
+                job = None
+
+            if job is None:
+                await self._wait_for_work()
+                continue
+
+            task = asyncio.create_task(self._execute(job))
+            self._running[job.id] = task
+            try:
+                await task
+            except asyncio.CancelledError:
+                # Either the job was cancelled or the worker is stopping
+                if self._stopping:
+                    raise
+            finally:
+                self._running.pop(job.id, None)
+
+    async def _wait_for_work(self) -> None:
+        if self._wakeup is None:
+            return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _execute(self, job: JobsTable) -> None:
+        handler = self._handlers.get(job.kind)
+        if handler is None:
+            await self._finish_job(job.id, JobStatus.failed, None, f"Unknown job kind: {job.kind}")
+            return
+
+        logger.debug(f"Running job {job.id} ({job.kind})")
+        heartbeat = asyncio.create_task(self._heartbeat(job.id, asyncio.current_task()))
+        try:
+            result = await handler(job)
+        except asyncio.CancelledError:
+            if self._stopping:
+                await self._requeue_job(job.id)
+            raise
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            await self._finish_job(job.id, JobStatus.failed, None, str(e))
+        else:
+            await self._finish_job(job.id, JobStatus.succeeded, result, None)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str, task: Optional[asyncio.Task]) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                status = await self._touch_job(job_id)
+            except Exception as e:
+                logger.warning(f"Could not send heartbeat for job {job_id}: {e}")
+                continue
+            if status != JobStatus.running.value and task is not None:
+                logger.info(f"Job {job_id} is {status}, stopping it")
+                task.cancel()
+                return
+
+    ######################################################
+    ## Database operations
+    ######################################################
+
+    async def _insert_job(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        agent_id: Optional[str],
+        user_id: Optional[str],
+        session_id: Optional[str],
+    ) -> JobsTable:
+        async with AsyncSessionLocal() as db, db.begin():
+            job = JobsTable(
+                id=str(uuid4()),
+                kind=kind,
+                status=JobStatus.queued.value,
+                agent_id=agent_id,
+                user_id=user_id,
+                session_id=session_id,
+                payload=payload,
+                created_at=current_utc(),
+            )
+            db.add(job)
+        return job
+
+    async def _read_job(self, job_id: str) -> Optional[JobsTable]:
+        async with AsyncSessionLocal() as db:
+            return await db.get(JobsTable, job_id)
+
+    async def _claim_job(self) -> Optional[JobsTable]:
+        now = current_utc()
+        stale_before = now - timedelta(seconds=self.stale_after)
+        async with AsyncSessionLocal() as db, db.begin():
+            result = await db.execute(
+                select(JobsTable)
+                .where(
+                    JobsTable.kind.in_(list(self._handlers)),
+                    or_(
+                        JobsTable.status == JobStatus.queued.value,
+                        and_(JobsTable.status == JobStatus.running.value, JobsTable.heartbeat_at < stale_before),
+                    ),
+                )
+                .order_by(JobsTable.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            job = result.scalar_one_or_none()
+            if job is None:
+                return None
+            job.status = JobStatus.running.value
+            job.worker_id = self.worker_id
+            job.started_at = now
+            job.heartbeat_at = now
+        return job
+
+    async def _touch_job(self, job_id: str) -> Optional[str]:
+        async with AsyncSessionLocal() as db, db.begin():
+            await db.execute(
+                update(JobsTable)
+                .where(JobsTable.id == job_id, JobsTable.status == JobStatus.running.value)
+                .values(heartbeat_at=current_utc())
+            )
+            result = await db.execute(select(JobsTable.status).where(JobsTable.id == job_id))
+            return result.scalar_one_or_none()
+
+    async def _finish_job(
+        self, job_id: str, status: JobStatus, result: Optional[Dict[str, Any]], error: Optional[str]
+    ) -> None:
+        async with AsyncSessionLocal() as db, db.begin():
+            await db.execute(
+                update(JobsTable)
+                .where(
+                    JobsTable.id == job_id,
+                    JobsTable.status == JobStatus.running.value,
+                    JobsTable.worker_id == self.worker_id,
+                )
+                .values(status=status.value, result=result, error=error, finished_at=current_utc())
+            )
+
+    async def _requeue_job(self, job_id: str) -> None:
+        async with AsyncSessionLocal() as db, db.begin():
+            await db.execute(
+                update(JobsTable)
+                .where(JobsTable.id == job_id, JobsTable.status == JobStatus.running.value)
+                .values(status=JobStatus.queued.value, worker_id=None, heartbeat_at=None)
+            )
+
+    async def _cancel_job(self, job_id: str) -> Optional[JobsTable]:
+        async with AsyncSessionLocal() as db, db.begin():
+            job = await db.get(JobsTable, job_id, with_for_update=True)
+            if job is None:
+                return None
+            if job.status not in FINISHED_STATUSES:
+                job.status = JobStatus.cancelled.value
+                job.finished_at = current_utc()
+        return job
+
+
+async def run_agent_job(job: JobsTable) -> Dict[str, Any]:
+    """Run an agent to completion and return its response."""
+    payload = job.payload
+    agent_id = AgentType(job.agent_id)
+    model_id = payload.get("model", "gpt-4o")
+
+    async with admission_controller.admit(job.user_id, reject_when_full=False):
+        if agent_id == AgentType.DB2I:
+            from agents.db2i_agent import aget_system_connection_details, pooled_db2i_agent_session
+
+            system_id = payload.get("system_id")
+            connection_details = None
+            if system_id is not None:
+                connection_details = await aget_system_connection_details(system_id)
+                if connection_details is None:
+                    raise ValueError(f"System not found: {system_id}")
+            async with pooled_db2i_agent_session(
+                model_id=model_id,
+                user_id=job.user_id,
+                session_id=job.session_id,
+                system_id=system_id,
+                connection_details=connection_details,
+            ) as agent:
+                response = await _run_agent(agent, payload["message"])
+        else:
+            agent = get_agent(model_id=model_id, agent_id=agent_id, user_id=job.user_id, session_id=job.session_id)
+            response = await _run_agent(agent, payload["message"])
+
+    return {
+        "content": response.content,
+        "run_id": response.run_id,
+        "session_id": agent.session_id,
+    }
+
+
+async def _run_agent(agent: "Agent", message: str) -> "RunResponse":
+    with AgentRunTracker(agent.agent_id) as run:
+        response = await agent.arun(message, stream=False)
+        run.record_tool_calls(response)
+    return response
+
+
+# Create JobManager object
+job_manager = JobManager(
+    num_workers=api_settings.job_workers,
+    heartbeat_interval=api_settings.job_heartbeat_interval,
+    stale_after=api_settings.job_stale_after,
+)
+job_manager.register("agent_run", run_agent_job)
@@ -1,8 +1,51 @@
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
+from agents.session_writer import close_session_writer
+from agents.settings import agent_settings
+from api.jobs import job_manager
+from api.middleware import MetricsMiddleware
+from api.routes.playground import playground_app
 from api.routes.v1_router import v1_router
 from api.settings import api_settings
+from db.session import async_db_engine
+from utils.log import logger
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    """Start background workers with the app and stop them on shutdown"""
+
+    await job_manager.start()
+    warm_task = asyncio.create_task(warm_mcp_sessions()) if agent_settings.mcp_pool_warm_on_startup else None
+    yield
+    if warm_task is not None:
+        warm_task.cancel()
+    await job_manager.stop()
+    # The MCP session pool is only imported once a Db2i agent has run
+    mcp_pool = sys.modules.get("agents.mcp_pool")
+    if mcp_pool is not None:
+        await mcp_pool.mcp_session_pool.close()
+    # Write the agent sessions queued by write-behind before the engine is disposed
+    await asyncio.to_thread(close_session_writer)
+    await async_db_engine.dispose()
+
+
+async def warm_mcp_sessions() -> None:
+    """Start pooled MCP sessions of the systems in the background, the api serves requests meanwhile"""
+
+    # Imported here, the Db2i agent pulls in agno and the mcp client
+    from agents.db2i_agent import warm_db2i_sessions
+
+    try:
+        await warm_db2i_sessions()
+    except Exception as e:
+        logger.warning(f"Could not warm MCP sessions: {e}")
 
 
 def create_app() -> FastAPI:
@@ -15,11 +58,15 @@ def create_app() -> FastAPI:
         docs_url="/docs" if api_settings.docs_enabled else None,
         redoc_url="/redoc" if api_settings.docs_enabled else None,
         openapi_url="/openapi.json" if api_settings.docs_enabled else None,
+        lifespan=lifespan,
     )
 
     # Add v1 router
     app.include_router(v1_router)
 
+    # Add the playground, its agents are built on the first request
+    app.mount("/v1/playground", playground_app)
+
     # Add Middlewares
     app.add_middleware(
         CORSMiddleware,
@@ -28,6 +75,7 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    app.add_middleware(MetricsMiddleware)
 
     return app
 
@@ -0,0 +1,101 @@
+from time import perf_counter
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Type
+
+from utils.metrics import metrics_registry
+
+######################################################
+## Metrics for the Api
+######################################################
+
+http_request_duration = metrics_registry.histogram(
+    "http_request_duration_seconds",
+    "Time spent handling http requests, including streamed response bodies.",
+    ["method", "route", "agent_id", "status"],
+)
+agent_run_duration = metrics_registry.histogram(
+    "agent_run_duration_seconds",
+    "Total time of an agent run.",
+    ["agent_id", "stream"],
+)
+agent_run_time_to_first_token = metrics_registry.histogram(
+    "agent_run_time_to_first_token_seconds",
+    "Time until the first content chunk of a streaming agent run.",
+    ["agent_id"],
+)
+agent_runs_total = metrics_registry.counter(
+    "agent_runs_total",
+    "Number of finished agent runs by outcome.",
+    ["agent_id", "status"],
+)
+agent_runs_in_flight = metrics_registry.gauge(
+    "agent_runs_in_flight",
+    "Number of agent runs currently in progress.",
+    ["agent_id"],
+)
+agent_tool_calls_total = metrics_registry.counter(
+    "agent_tool_calls_total",
+    "Number of tool calls made by agents.",
+    ["agent_id", "tool_name", "status"],
+)
+agent_tool_call_duration = metrics_registry.histogram(
+    "agent_tool_call_duration_seconds",
+    "Time spent executing a tool call.",
+    ["agent_id", "tool_name"],
+)
+
+class AgentRunTracker:
+    """Context manager that records metrics for a single agent run.
+
+    Usage:
+        with AgentRunTracker("sage", stream=True) as run:
+            async for chunk in run_response:
+                run.first_token()
+            run.record_tool_calls(agent.run_response)
+    """
+
+    def __init__(self, agent_id: Optional[str], stream: bool = False):
+        self.agent_id: str = agent_id or "unknown"
+        self.stream: bool = stream
+        self._started_at: float = 0.0
+        self._first_token_seen: bool = False
+
+    def __enter__(self) -> "AgentRunTracker":
+        self._started_at = perf_counter()
+        agent_runs_in_flight.inc(agent_id=self.agent_id)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        agent_runs_in_flight.dec(agent_id=self.agent_id)
+        agent_run_duration.observe(
+            perf_counter() - self._started_at, agent_id=self.agent_id, stream=str(self.stream).lower()
+        )
+        if exc_type is None:
+            status = "success"
+        elif issubclass(exc_type, Exception):
+            status = "error"
+        else:
+            # GeneratorExit or CancelledError when the client disconnects
+            status = "cancelled"
+        agent_runs_total.inc(agent_id=self.agent_id, status=status)
+
+    def first_token(self) -> None:
+        if not self._first_token_seen:
+            self._first_token_seen = True
+            agent_run_time_to_first_token.observe(perf_counter() - self._started_at, agent_id=self.agent_id)
+
+    def record_tool_calls(self, run_response: Any) -> None:
+        tools: List[Dict[str, Any]] = getattr(run_response, "tools", None) or []
+        for tool_call in tools:
+            tool_name = tool_call.get("tool_name") or "unknown"
+            status = "error" if tool_call.get("tool_call_error") else "success"
+            agent_tool_calls_total.inc(agent_id=self.agent_id, tool_name=tool_name, status=status)
+            metrics = tool_call.get("metrics")
+            execution_time = getattr(metrics, "time", None)
+            if execution_time is not None:
+                agent_tool_call_duration.observe(execution_time, agent_id=self.agent_id, tool_name=tool_name)
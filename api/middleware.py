@@ -0,0 +1,43 @@
+from time import perf_counter
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.metrics import http_request_duration
+
+
+class MetricsMiddleware:
+    """Records the latency of every http request by route template and agent.
+
+    Implemented as a pure ASGI middleware so streaming responses are timed until the last chunk is sent.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router adds the matched route to the scope, use its template to keep label cardinality low
+            route = scope.get("route")
+            path_params = scope.get("path_params") or {}
+            http_request_duration.observe(
+                perf_counter() - started_at,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                agent_id=str(path_params.get("agent_id", "")),
+                status=str(status_code),
+            )
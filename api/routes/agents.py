@@ -1,14 +1,23 @@
+import asyncio
+from contextlib import aclosing
+from datetime import datetime
 from enum import Enum
-from typing import AsyncGenerator, List, Optional
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional
 
-from agno.agent import Agent
 from fastapi import APIRouter, HTTPException, status
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from agents.operator import AgentType, get_agent, get_available_agents
+from agents.semantic_cache import CacheLookup, get_semantic_cache
+from api.admission import AdmissionRejected, admission_controller
+from api.jobs import JobStatus, job_manager
+from api.metrics import AgentRunTracker
 from utils.log import logger
 
+if TYPE_CHECKING:
+    from agno.agent import Agent
+
 ######################################################
 ## Router for the Agent Interface
 ######################################################
@@ -32,23 +41,66 @@ async def list_agents():
     return get_available_agents()
 
 
-async def chat_response_streamer(agent: Agent, message: str) -> AsyncGenerator:
+async def chat_response_streamer(
+    agent: "Agent", message: str, on_complete: Optional[Callable[[str], Awaitable[None]]] = None
+) -> AsyncGenerator:
     """
     Stream agent responses chunk by chunk.
 
     Args:
         agent: The agent instance to interact with
         message: User message to process
+        on_complete: Optional callback awaited with the full response once the run is complete
 
     Yields:
         Text chunks from the agent response
     """
-    run_response = await agent.arun(message, stream=True)
-    async for chunk in run_response:
-        # chunk.content only contains the text response from the Agent.
-        # For advanced use cases, we should yield the entire chunk
-        # that contains the tool calls and intermediate steps.
-        yield chunk.content
+    content = ""
+    with AgentRunTracker(agent.agent_id, stream=True) as run:
+        run_response = await agent.arun(message, stream=True)
+        async for chunk in run_response:
+            if chunk.content:
+                run.first_token()
+                content += str(chunk.content)
+            # chunk.content only contains the text response from the Agent.
+            # For advanced use cases, we should yield the entire chunk
+            # that contains the tool calls and intermediate steps.
+            yield chunk.content
+        run.record_tool_calls(agent.run_response)
+    if on_complete is not None:
+        await on_complete(content)
+
+
+async def cached_response_streamer(content: str, chunk_size: int = 64) -> AsyncGenerator:
+    """
+    Stream a cached response in chunks, so clients handle it like a live run.
+
+    Args:
+        content: The cached response
+        chunk_size: Number of characters per chunk
+
+    Yields:
+        Text chunks from the cached response
+    """
+    for i in range(0, len(content), chunk_size):
+        yield content[i : i + chunk_size]
+
+
+async def admitted_streamer(user_id: Optional[str], streamer: AsyncGenerator) -> AsyncGenerator:
+    """
+    Wait for admission before starting a streaming run and hold the slot until the stream ends.
+
+    Args:
+        user_id: The user the run is admitted for
+        streamer: The response streamer, it only starts the run when it is first iterated
+
+    Yields:
+        Text chunks from the streamer
+    """
+    async with aclosing(streamer):
+        async with admission_controller.admit(user_id):
+            async for chunk in streamer:
+                yield chunk
 
 
 class RunRequest(BaseModel):
@@ -61,6 +113,88 @@ class RunRequest(BaseModel):
     session_id: Optional[str] = None
 
 
+class Db2iRunRequest(RunRequest):
+    """Request model for running the Db2i agent against a system"""
+
+    # ID of a system in the `systems` table, the MCP server uses environment variables if not set
+    system_id: Optional[int] = None
+
+
+async def db2i_response_streamer(body: Db2iRunRequest, connection_details: Optional[Dict[str, Any]]) -> AsyncGenerator:
+    """
+    Stream Db2i agent responses using a pooled MCP session, the session is leased until the stream ends.
+
+    Args:
+        body: Request parameters including the message
+        connection_details: Connection details of the selected system
+
+    Yields:
+        Text chunks from the agent response
+    """
+    from agents.db2i_agent import pooled_db2i_agent_session
+
+    async with pooled_db2i_agent_session(
+        model_id=body.model.value,
+        user_id=body.user_id,
+        session_id=body.session_id,
+        system_id=body.system_id,
+        connection_details=connection_details,
+    ) as agent:
+        async with aclosing(chat_response_streamer(agent, body.message)) as streamer:
+            async for chunk in streamer:
+                yield chunk
+
+
+@agents_router.post("/db2i/runs", status_code=status.HTTP_200_OK)
+async def run_db2i_agent(body: Db2iRunRequest):
+    """
+    Sends a message to the Db2i agent and returns the response.
+
+    The agent runs on a pooled, already initialized MCP server session for the selected system.
+
+    Args:
+        body: Request parameters including the message and the system
+
+    Returns:
+        Either a streaming response or the complete agent response
+    """
+    logger.debug(f"Db2iRunRequest: {body}")
+
+    # The Db2i agent pulls in agno and the mcp client, only import it when it is used
+    from agents.db2i_agent import aget_system_connection_details, pooled_db2i_agent_session
+
+    connection_details: Optional[Dict[str, Any]] = None
+    if body.system_id is not None:
+        connection_details = await aget_system_connection_details(body.system_id)
+        if connection_details is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"System not found: {body.system_id}")
+
+    if admission_controller.is_full:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many queued agent runs")
+
+    if body.stream:
+        return StreamingResponse(
+            admitted_streamer(body.user_id, db2i_response_streamer(body, connection_details)),
+            media_type="text/event-stream",
+        )
+    else:
+        try:
+            async with admission_controller.admit(body.user_id):
+                async with pooled_db2i_agent_session(
+                    model_id=body.model.value,
+                    user_id=body.user_id,
+                    session_id=body.session_id,
+                    system_id=body.system_id,
+                    connection_details=connection_details,
+                ) as agent:
+                    with AgentRunTracker(agent.agent_id) as run:
+                        response = await agent.arun(body.message, stream=False)
+                        run.record_tool_calls(response)
+        except AdmissionRejected as e:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+        return response.content
+
+
 @agents_router.post("/{agent_id}/runs", status_code=status.HTTP_200_OK)
 async def run_agent(agent_id: AgentType, body: RunRequest):
     """
@@ -75,8 +209,37 @@ async def run_agent(agent_id: AgentType, body: RunRequest):
     """
     logger.debug(f"RunRequest: {body}")
 
+    # Only stateless runs use the semantic cache, follow-up messages depend on the session history
+    cache = get_semantic_cache() if body.session_id is None else None
+    cache_lookup: Optional[CacheLookup] = None
+    if cache is not None:
+        try:
+            cache_lookup = await asyncio.to_thread(cache.lookup, agent_id.value, body.model.value, body.message)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+    if cache_lookup is not None and cache_lookup.response is not None:
+        if body.stream:
+            return StreamingResponse(
+                cached_response_streamer(cache_lookup.response),
+                media_type="text/event-stream",
+            )
+        return cache_lookup.response
+
+    async def cache_response(content: str) -> None:
+        if cache is None or cache_lookup is None:
+            return
+        try:
+            await asyncio.to_thread(
+                cache.store, agent_id.value, body.model.value, body.message, cache_lookup.embedding, content
+            )
+        except Exception as e:
+            logger.warning(f"Could not store response in semantic cache: {e}")
+
+    if admission_controller.is_full:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many queued agent runs")
+
     try:
-        agent: Agent = get_agent(
+        agent: "Agent" = get_agent(
             model_id=body.model.value,
             agent_id=agent_id,
             user_id=body.user_id,
@@ -87,12 +250,131 @@ async def run_agent(agent_id: AgentType, body: RunRequest):
 
     if body.stream:
         return StreamingResponse(
-            chat_response_streamer(agent, body.message),
+            admitted_streamer(body.user_id, chat_response_streamer(agent, body.message, on_complete=cache_response)),
             media_type="text/event-stream",
         )
     else:
-        response = await agent.arun(body.message, stream=False)
+        try:
+            async with admission_controller.admit(body.user_id):
+                with AgentRunTracker(agent.agent_id) as run:
+                    response = await agent.arun(body.message, stream=False)
+                    run.record_tool_calls(response)
+        except AdmissionRejected as e:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+        if isinstance(response.content, str):
+            await cache_response(response.content)
         # response.content only contains the text response from the Agent.
         # For advanced use cases, we should yield the entire response
         # that contains the tool calls and intermediate steps.
         return response.content
+
+
+class JobRequest(BaseModel):
+    """Request model for submitting an agent run as a background job"""
+
+    message: str
+    model: Model = Model.gpt_4o
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+    # ID of a system in the `systems` table, only used by the Db2i agent
+    system_id: Optional[int] = None
+
+
+class JobResponse(BaseModel):
+    """Status of a background job"""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    status: JobStatus
+    agent_id: Optional[str] = None
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+    error: Optional[str] = None
+    # Progress reported by the running job, e.g. pages parsed and chunks embedded by knowledge ingestion
+    progress: Optional[Dict[str, Any]] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class JobResultResponse(JobResponse):
+    """Status and result of a finished background job"""
+
+    result: Optional[Dict[str, Any]] = None
+
+
+@agents_router.post("/{agent_id}/jobs", status_code=status.HTTP_202_ACCEPTED, response_model=JobResponse)
+async def submit_agent_job(agent_id: AgentType, body: JobRequest):
+    """
+    Submits an agent run to the background workers and returns immediately.
+
+    Args:
+        agent_id: The ID of the agent to run
+        body: Request parameters including the message
+
+    Returns:
+        JobResponse: The queued job, poll `/agents/jobs/{job_id}` for its status
+    """
+    logger.debug(f"JobRequest: {body}")
+
+    return await job_manager.submit(
+        kind="agent_run",
+        payload={"message": body.message, "model": body.model.value, "system_id": body.system_id},
+        agent_id=agent_id.value,
+        user_id=body.user_id,
+        session_id=body.session_id,
+    )
+
+
+@agents_router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_agent_job(job_id: str):
+    """
+    Returns the status of a background job.
+
+    Args:
+        job_id: The ID of the job
+
+    Returns:
+        JobResponse: The job status
+    """
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job not found: {job_id}")
+    return job
+
+
+@agents_router.get("/jobs/{job_id}/result", response_model=JobResultResponse)
+async def get_agent_job_result(job_id: str):
+    """
+    Returns the result of a finished background job.
+
+    Args:
+        job_id: The ID of the job
+
+    Returns:
+        JobResultResponse: The job status and the agent response
+    """
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job not found: {job_id}")
+    if job.status in (JobStatus.queued.value, JobStatus.running.value):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job.status}")
+    return job
+
+
+@agents_router.post("/jobs/{job_id}/cancel", response_model=JobResponse)
+async def cancel_agent_job(job_id: str):
+    """
+    Cancels a queued or running background job.
+
+    Args:
+        job_id: The ID of the job
+
+    Returns:
+        JobResponse: The job status after cancellation
+    """
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job not found: {job_id}")
+    return job
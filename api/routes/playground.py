@@ -1,23 +1,74 @@
+import asyncio
 from os import getenv
+from typing import Optional
 
-from agno.playground import Playground
+from starlette.routing import Router
+from starlette.types import ASGIApp, Receive, Scope, Send
 
-from agents.sage import get_sage
-from agents.scholar import get_scholar
-from workspace.dev_resources import dev_fastapi
+from utils.log import logger
 
 ######################################################
 ## Router for the Playground Interface
 ######################################################
 
-sage_agent = get_sage(debug_mode=True)
-scholar_agent = get_scholar(debug_mode=True)
+# The playground is mounted at `/v1/playground`, the router created by agno adds `/playground`
+PLAYGROUND_PREFIX = "/v1"
 
-# Create a playground instance
-playground = Playground(agents=[sage_agent, scholar_agent])
 
-# Register the endpoint where playground routes are served with agno.com
-if getenv("RUNTIME_ENV") == "dev":
-    playground.create_endpoint(f"http://localhost:{dev_fastapi.host_port}")
+def get_playground_router() -> Router:
+    """Build the playground agents and their router.
 
-playground_router = playground.get_async_router()
+    Building the agents connects to the database and imports agno, pgvector and the model clients,
+    so this is only called when the playground receives its first request.
+    """
+    from agno.playground import Playground
+    from fastapi import APIRouter
+
+    from agents.sage import get_sage
+    from agents.scholar import get_scholar
+
+    sage_agent = get_sage(debug_mode=True)
+    scholar_agent = get_scholar(debug_mode=True)
+
+    # Create a playground instance
+    playground = Playground(agents=[sage_agent, scholar_agent])
+
+    # Register the endpoint where playground routes are served with agno.com
+    if getenv("RUNTIME_ENV") == "dev":
+        from workspace.dev_resources import dev_fastapi
+
+        playground.create_endpoint(f"http://localhost:{dev_fastapi.host_port}")
+
+    router = APIRouter(prefix=PLAYGROUND_PREFIX)
+    router.include_router(playground.get_async_router())
+    return router
+
+
+class LazyPlayground:
+    """ASGI app that builds the playground router on its first request.
+
+    Mount it at `/v1/playground`. Playground routes are not part of the OpenAPI schema of the app.
+    """
+
+    def __init__(self):
+        self._router: Optional[ASGIApp] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def _get_router(self) -> ASGIApp:
+        if self._router is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._router is None:
+                    logger.info("Building playground agents")
+                    self._router = await asyncio.to_thread(get_playground_router)
+        return self._router
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        router = await self._get_router()
+        # The playground routes include the mount path, so match them against the full request path
+        scope = dict(scope, root_path=scope.get("app_root_path", ""))
+        await router(scope, receive, send)
+
+
+playground_app = LazyPlayground()
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 
 from utils.dttm import current_utc_str
+from utils.metrics import CONTENT_TYPE_LATEST, metrics_registry
 
 ######################################################
 ## Router for API status
@@ -19,3 +21,10 @@ def get_health():
         "path": "/health",
         "utc": current_utc_str(),
     }
+
+
+@status_router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Return Api metrics in the Prometheus text exposition format"""
+
+    return PlainTextResponse(metrics_registry.render(), media_type=CONTENT_TYPE_LATEST)
@@ -28,6 +28,21 @@ class ApiSettings(BaseSettings):
     # default cors origin list.
     cors_origin_list: Optional[List[str]] = Field(None, validate_default=True)
 
+    # Number of in-process workers that execute background jobs
+    job_workers: int = 4
+    # Seconds between heartbeats sent by running jobs
+    job_heartbeat_interval: int = 10
+    # Running jobs without a heartbeat for this many seconds are picked up by another worker
+    job_stale_after: int = 60
+
+    # Maximum number of agent runs executing at the same time, across all users
+    max_concurrent_runs: int = 8
+    # Sustained agent runs per minute and burst size allowed for each user
+    user_runs_per_minute: float = 20
+    user_run_burst: int = 5
+    # Runs waiting for admission beyond this are rejected with a 429, set to 0 for no limit
+    max_queued_runs: int = 200
+
     @field_validator("cors_origin_list", mode="before")
     def set_cors_origin_list(cls, cors_origin_list, info: FieldValidationInfo):
         valid_cors = cors_origin_list or []
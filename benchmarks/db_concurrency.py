@@ -0,0 +1,114 @@
+"""Compare sync and async Postgres access from an event loop under concurrent load.
+
+Runs the same number of concurrent queries three ways:
+    - sync: a sync session called directly from coroutines, which blocks the event loop
+    - thread: a sync session run with asyncio.to_thread
+    - async: an AsyncSession from db.session.AsyncSessionLocal
+
+For each mode the wall time, queries per second, latency percentiles and the worst event loop lag are
+reported. Event loop lag is how late a 10ms ticker wakes up, it is the delay every other request on the
+loop sees. Requires a running database.
+
+Usage:
+    python -m benchmarks.db_concurrency
+    python -m benchmarks.db_concurrency --queries 500 --concurrency 20 --sleep-ms 5
+"""
+
+import argparse
+import asyncio
+import statistics
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import text
+
+from db.session import AsyncSessionLocal, SessionLocal, async_db_engine, db_engine
+
+QUERY = text("SELECT pg_sleep(:seconds), count(*) FROM systems")
+
+
+def sync_query(seconds: float) -> None:
+    with SessionLocal() as db:
+        db.execute(QUERY, {"seconds": seconds}).all()
+
+
+async def run_sync(seconds: float) -> None:
+    sync_query(seconds)
+
+
+async def run_thread(seconds: float) -> None:
+    await asyncio.to_thread(sync_query, seconds)
+
+
+async def run_async(seconds: float) -> None:
+    async with AsyncSessionLocal() as db:
+        (await db.execute(QUERY, {"seconds": seconds})).all()
+
+
+MODES: Dict[str, Callable[[float], Awaitable[None]]] = {
+    "sync": run_sync,
+    "thread": run_thread,
+    "async": run_async,
+}
+
+
+async def measure_loop_lag(stop: asyncio.Event, lags: List[float], interval: float = 0.01) -> None:
+    while not stop.is_set():
+        started_at = perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(perf_counter() - started_at - interval)
+
+
+async def benchmark(mode: str, queries: int, concurrency: int, seconds: float) -> Dict[str, float]:
+    run = MODES[mode]
+    limit = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def timed() -> None:
+        async with limit:
+            started_at = perf_counter()
+            await run(seconds)
+            latencies.append(perf_counter() - started_at)
+
+    # Warm up the connection pools
+    await asyncio.gather(*(run(0) for _ in range(concurrency)))
+
+    stop = asyncio.Event()
+    lags: List[float] = []
+    ticker = asyncio.create_task(measure_loop_lag(stop, lags))
+    started_at = perf_counter()
+    await asyncio.gather(*(timed() for _ in range(queries)))
+    elapsed = perf_counter() - started_at
+    stop.set()
+    await ticker
+
+    latencies.sort()
+    return {
+        "seconds": elapsed,
+        "qps": queries / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "max_loop_lag_ms": max(lags, default=0.0) * 1000,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"{args.queries} queries, concurrency {args.concurrency}, {args.sleep_ms}ms server time per query")
+    print(f"{'mode':<8} {'seconds':>8} {'qps':>8} {'p50 ms':>8} {'p99 ms':>8} {'max loop lag ms':>16}")
+    for mode in args.modes:
+        result = await benchmark(mode, args.queries, args.concurrency, args.sleep_ms / 1000)
+        print(
+            f"{mode:<8} {result['seconds']:>8.2f} {result['qps']:>8.1f} {result['p50_ms']:>8.1f} "
+            f"{result['p99_ms']:>8.1f} {result['max_loop_lag_ms']:>16.1f}"
+        )
+    await async_db_engine.dispose()
+    db_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200, help="Total number of queries per mode")
+    parser.add_argument("--concurrency", type=int, default=10, help="Number of queries in flight")
+    parser.add_argument("--sleep-ms", type=float, default=10, help="Time each query spends in pg_sleep")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES), help="Modes to run")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""Measure how long it takes to import the api app and fail if it exceeds a budget.
+
+Every api worker and every `--reload` imports `api.main`, so work done at import time delays startup.
+Each run imports the module in a fresh interpreter and reports the median wall time and the slowest
+packages.
+
+Usage:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --module api.main --runs 5 --max-seconds 3
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MODULE = "api.main"
+DEFAULT_MAX_SECONDS = 3.0
+
+
+def measure_import(module: str) -> Tuple[float, Dict[str, int]]:
+    """Import `module` in a new interpreter.
+
+    Returns:
+        Tuple[float, Dict[str, int]]: Wall time in seconds and the import time in microseconds of
+            each top level package, including all of its submodules.
+    """
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    packages: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, _, name = line[len("import time:") :].split("|")
+        if not self_time.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_time)
+    return float(result.stdout.strip().splitlines()[-1]), packages
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="Module to import")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreters to import the module in")
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS, help="Budget for the median time")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest packages to show")
+    args = parser.parse_args(argv)
+
+    timings: List[float] = []
+    packages: Dict[str, int] = {}
+    for _ in range(args.runs):
+        seconds, packages = measure_import(args.module)
+        timings.append(seconds)
+
+    median = statistics.median(timings)
+    print(f"import {args.module}: median {median:.3f}s, min {min(timings):.3f}s, max {max(timings):.3f}s")
+    print("Slowest packages (last run):")
+    for package, micros in sorted(packages.items(), key=lambda item: item[1], reverse=True)[: args.top]:
+        print(f"  {package:<30} {micros / 1e6:.3f}s")
+
+    if median > args.max_seconds:
+        print(f"FAIL: median import time {median:.3f}s exceeds the budget of {args.max_seconds:.3f}s")
+        return 1
+    print(f"OK: median import time is within the budget of {args.max_seconds:.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
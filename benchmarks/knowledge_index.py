@@ -0,0 +1,199 @@
+"""Measure recall and latency of vector index configurations for knowledge tables.
+
+Seeds a knowledge table with `--rows` synthetic, clustered and normalized embeddings, computes the exact
+`--k` nearest neighbours of `--queries` query vectors, then for every index configuration:
+    - builds the index with agents.knowledge.index and reports build time and size
+    - runs the queries for every search parameter (hnsw.ef_search or ivfflat.probes)
+    - reports recall@k against the exact neighbours and p50/p95 latency
+
+The first row is an exact scan without an index. Seeding is skipped if the table already has `--rows`
+rows, the vectors are generated from `--seed`. Requires a running database.
+
+Usage:
+    python -m benchmarks.knowledge_index
+    python -m benchmarks.knowledge_index --rows 200000 --config hnsw:m=16,ef_construction=64 \\
+        --config hnsw:m=32,ef_construction=128 --config ivfflat:lists=450 --keep
+"""
+
+import argparse
+import statistics
+from time import perf_counter
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union, cast
+
+import numpy as np
+from agno.embedder.openai import OpenAIEmbedder
+from agno.vectordb.pgvector import PgVector
+from agno.vectordb.pgvector.index import HNSW, Ivfflat
+from pgvector.psycopg import register_vector
+
+from agents.knowledge.index import create_index, drop_index, get_index_status
+from db.session import db_engine
+
+if TYPE_CHECKING:
+    import psycopg
+
+TABLE_NAME = "bench_knowledge"
+DEFAULT_CONFIGS = ["hnsw:m=16,ef_construction=64", "hnsw:m=32,ef_construction=128", "ivfflat:lists=0"]
+
+
+def generate(
+    rows: int, dimensions: int, clusters: int, seed: int, batch: int, noise_seed: Optional[int] = None
+) -> Iterator[np.ndarray]:
+    """Yield batches of normalized embeddings around `clusters` centers, like embeddings of related documents."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions)).astype(np.float32)
+    if noise_seed is not None:
+        rng = np.random.default_rng(noise_seed)
+    for start in range(0, rows, batch):
+        size = min(batch, rows - start)
+        vectors = centers[rng.integers(clusters, size=size)] + 0.5 * rng.normal(size=(size, dimensions))
+        yield (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def seed(vector_db: PgVector, args: argparse.Namespace) -> np.ndarray:
+    """Fill the table and return all embeddings, row i has the id str(i)."""
+    vectors = np.concatenate(list(generate(args.rows, args.dimensions, args.clusters, args.seed, 10_000)))
+    existing = vector_db.get_count()
+    if existing == args.rows:
+        print(f"Using {existing} existing rows in {vector_db.table.fullname}")
+        return vectors
+
+    print(f"Seeding {args.rows} rows into {vector_db.table.fullname}...")
+    started_at = perf_counter()
+    vector_db.delete()
+    raw_connection = db_engine.raw_connection()
+    driver_connection = cast("psycopg.Connection", raw_connection.driver_connection)
+    try:
+        register_vector(driver_connection)
+        with driver_connection.cursor() as cursor:
+            with cursor.copy(
+                f"COPY {vector_db.table.fullname} (id, name, content, embedding) FROM STDIN WITH (FORMAT BINARY)"
+            ) as copy:
+                copy.set_types(["text", "text", "text", "vector"])
+                for i, vector in enumerate(vectors):
+                    copy.write_row((str(i), "bench", f"chunk {i}", vector))
+        driver_connection.commit()
+    finally:
+        raw_connection.close()
+    with db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql(f"VACUUM ANALYZE {vector_db.table.fullname}")
+    print(f"  {perf_counter() - started_at:.0f}s")
+    return vectors
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    # Vectors are normalized, the largest dot products have the smallest cosine distance
+    neighbours = []
+    for query in queries:
+        scores = vectors @ query
+        top = np.argpartition(-scores, k)[:k]
+        neighbours.append({str(i) for i in top})
+    return neighbours
+
+
+def measure(
+    vector_db: PgVector, queries: np.ndarray, truth: List[set], k: int, setting: Optional[Tuple[str, int]]
+) -> Dict[str, float]:
+    raw_connection = db_engine.raw_connection()
+    driver_connection = cast("psycopg.Connection", raw_connection.driver_connection)
+    latencies: List[float] = []
+    recalls: List[float] = []
+    try:
+        register_vector(driver_connection)
+        with driver_connection.cursor() as cursor:
+            if setting is not None:
+                cursor.execute(f"SET {setting[0]} = {int(setting[1])}")
+            sql = f"SELECT id FROM {vector_db.table.fullname} ORDER BY embedding <=> %s LIMIT %s"
+            # Warm up the cache of the table or the index
+            for query in queries[:5]:
+                cursor.execute(sql, (query, k))
+                cursor.fetchall()
+            for query, expected in zip(queries, truth):
+                started_at = perf_counter()
+                cursor.execute(sql, (query, k))
+                ids = {row[0] for row in cursor.fetchall()}
+                latencies.append(perf_counter() - started_at)
+                recalls.append(len(ids & expected) / k)
+        driver_connection.rollback()
+    finally:
+        raw_connection.close()
+    latencies.sort()
+    return {
+        "recall": statistics.mean(recalls),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+    }
+
+
+def parse_config(config: str) -> Union[HNSW, Ivfflat]:
+    """Parse "hnsw:m=16,ef_construction=64" or "ivfflat:lists=100"."""
+    index_type, _, options = config.partition(":")
+    params = {key: int(value) for key, value in (option.split("=") for option in options.split(",") if option)}
+    if index_type == "hnsw":
+        return HNSW(**params)
+    if index_type == "ivfflat":
+        return Ivfflat(**params)
+    raise ValueError(f"Unknown index type in {config}")
+
+
+def report_row(label: str, param: str, result: Dict[str, float]) -> None:
+    print(
+        f"{label:<36} {param:>14} {result['recall']:>10.3f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}",
+        flush=True,
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    vector_db = PgVector(
+        table_name=TABLE_NAME, db_engine=db_engine, embedder=OpenAIEmbedder(dimensions=args.dimensions)
+    )
+    vector_db.create()
+    try:
+        drop_index(vector_db)
+        vectors = seed(vector_db, args)
+        # Queries come from the same clusters as the rows, with other noise
+        queries = next(
+            generate(args.queries, args.dimensions, args.clusters, args.seed, args.queries, noise_seed=args.seed + 1)
+        )
+        truth = exact_neighbours(vectors, queries, args.k)
+
+        print(f"\n{'index':<36} {'param':>14} {f'recall@{args.k}':>10} {'p50 ms':>8} {'p95 ms':>8}")
+        report_row("none (exact scan)", "-", measure(vector_db, queries, truth, args.k, None))
+        for config in args.config or DEFAULT_CONFIGS:
+            index = parse_config(config)
+            started_at = perf_counter()
+            create_index(vector_db, index, replace=True, maintenance_work_mem=args.maintenance_work_mem)
+            build_seconds = perf_counter() - started_at
+            size_mb = sum(status.size_bytes for status in get_index_status(vector_db)) / 1e6
+            label = f"{config} ({build_seconds:.0f}s, {size_mb:.0f} MB)"
+            if isinstance(index, HNSW):
+                settings = [("hnsw.ef_search", value) for value in args.ef_search if value >= args.k]
+            else:
+                settings = [("ivfflat.probes", value) for value in args.probes]
+            for setting in settings:
+                result = measure(vector_db, queries, truth, args.k, setting)
+                report_row(label, f"{setting[0].split('.')[1]}={setting[1]}", result)
+    finally:
+        if args.keep:
+            drop_index(vector_db)
+        else:
+            vector_db.drop()
+        db_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="Embeddings in the table")
+    parser.add_argument("--dimensions", type=int, default=1536, help="Dimensions, 1536 for text-embedding-3-small")
+    parser.add_argument("--clusters", type=int, default=200, help="Clusters the embeddings are spread over")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per measurement")
+    parser.add_argument("--k", type=int, default=10, help="Results per query, recall is measured at k")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--config", action="append", help=f"Index to measure, repeatable, default {' '.join(DEFAULT_CONFIGS)}"
+    )
+    parser.add_argument("--ef-search", type=lambda v: [int(x) for x in v.split(",")], default=[10, 20, 40, 80, 160])
+    parser.add_argument("--probes", type=lambda v: [int(x) for x in v.split(",")], default=[1, 5, 10, 20, 40])
+    parser.add_argument("--maintenance-work-mem", default="1GB")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the {TABLE_NAME} table for the next run")
+    main(parser.parse_args())
@@ -0,0 +1,117 @@
+"""Compare full precision and quantized vector indexes of a knowledge table.
+
+Seeds a knowledge table like benchmarks.knowledge_index, then for the current layout (an HNSW index on the
+full precision embeddings) and for HNSW indexes on halfvec and binary quantized embeddings reports:
+    - index size, and the size of the table with its toasted embeddings, which all layouts share
+    - recall@k against the exact neighbours and p50/p95 latency of QuantizedPgVector.search_by_embedding,
+      for every `--rerank-factors` value of the quantized layouts
+
+Requires a running database.
+
+Usage:
+    python -m benchmarks.knowledge_quantization
+    python -m benchmarks.knowledge_quantization --rows 200000 --rerank-factors 1,4,10 --keep
+"""
+
+import argparse
+import statistics
+from time import perf_counter
+from typing import Dict, List, Optional
+
+import numpy as np
+from agno.embedder.openai import OpenAIEmbedder
+from agno.vectordb.pgvector.index import HNSW
+from sqlalchemy import text
+
+from agents.knowledge.index import create_index, drop_index, get_index_status
+from agents.knowledge.quantization import QUANTIZATIONS, QuantizedPgVector
+from benchmarks.knowledge_index import exact_neighbours, generate, seed
+from db.session import db_engine
+
+TABLE_NAME = "bench_knowledge"
+
+
+def measure(vector_db: QuantizedPgVector, queries: np.ndarray, truth: List[set], k: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    recalls: List[float] = []
+    # Warm up the cache of the table and the index
+    for query in queries[:5]:
+        vector_db.search_by_embedding(query.tolist(), limit=k)
+    for query, expected in zip(queries, truth):
+        started_at = perf_counter()
+        documents = vector_db.search_by_embedding(query.tolist(), limit=k)
+        latencies.append(perf_counter() - started_at)
+        recalls.append(len({document.id for document in documents} & expected) / k)
+    latencies.sort()
+    return {
+        "recall": statistics.mean(recalls),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    index = HNSW(m=args.m, ef_construction=args.ef_construction, ef_search=args.ef_search)
+    vector_db = QuantizedPgVector(
+        table_name=TABLE_NAME,
+        db_engine=db_engine,
+        embedder=OpenAIEmbedder(dimensions=args.dimensions),
+        vector_index=index,
+        quantization=None,
+    )
+    vector_db.create()
+    try:
+        drop_index(vector_db)
+        vectors = seed(vector_db, args)
+        queries = next(
+            generate(args.queries, args.dimensions, args.clusters, args.seed, args.queries, noise_seed=args.seed + 1)
+        )
+        truth = exact_neighbours(vectors, queries, args.k)
+        with db_engine.connect() as connection:
+            table_mb = connection.execute(
+                text("SELECT pg_table_size(:t)"), {"t": vector_db.table.fullname}
+            ).scalar_one() / 1e6
+        print(f"Table with embeddings: {table_mb:.0f} MB, the same for every layout")
+
+        print(
+            f"\n{'layout':<10} {'index MB':>9} {'build s':>8} {'rerank':>7} {f'recall@{args.k}':>10}"
+            f" {'p50 ms':>8} {'p95 ms':>8}"
+        )
+        quantization: Optional[str]
+        for quantization in (None, *QUANTIZATIONS):
+            vector_db.quantization = quantization
+            started_at = perf_counter()
+            create_index(vector_db, index, replace=True, maintenance_work_mem=args.maintenance_work_mem)
+            build_seconds = perf_counter() - started_at
+            index_mb = sum(status.size_bytes for status in get_index_status(vector_db)) / 1e6
+            for rerank_factor in args.rerank_factors if quantization is not None else [1]:
+                vector_db.rerank_factor = rerank_factor
+                result = measure(vector_db, queries, truth, args.k)
+                print(
+                    f"{quantization or 'vector':<10} {index_mb:>9.1f} {build_seconds:>8.1f} {rerank_factor:>7}"
+                    f" {result['recall']:>10.3f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}",
+                    flush=True,
+                )
+    finally:
+        if args.keep:
+            drop_index(vector_db)
+        else:
+            vector_db.drop()
+        db_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="Embeddings in the table")
+    parser.add_argument("--dimensions", type=int, default=1536, help="Dimensions, 1536 for text-embedding-3-small")
+    parser.add_argument("--clusters", type=int, default=200, help="Clusters the embeddings are spread over")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per measurement")
+    parser.add_argument("--k", type=int, default=10, help="Results per query, recall is measured at k")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--ef-search", type=int, default=40)
+    parser.add_argument("--rerank-factors", type=lambda v: [int(x) for x in v.split(",")], default=[1, 2, 4, 8])
+    parser.add_argument("--maintenance-work-mem", default="1GB")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the {TABLE_NAME} table for the next run")
+    main(parser.parse_args())
@@ -0,0 +1,187 @@
+"""Measure listing and loading agent sessions in a large session table.
+
+Seeds a session table with `--sessions` sessions spread over `--users` users and `--agents` agents,
+then measures:
+    - list: the first page of a user's sessions, as the session selector loads it
+    - page: the page after `--deep-pages` pages, following the cursor
+    - load: reading a whole session by id, as an agent does at the start of a run
+
+With --compare the measurements are repeated without the activity index added by AgentStorage, to show
+what it saves. Seeding is skipped if the table already has enough sessions. Requires a running database.
+
+Usage:
+    python -m benchmarks.session_tables
+    python -m benchmarks.session_tables --sessions 100000 --compare --keep
+"""
+
+import argparse
+import random
+import statistics
+from time import perf_counter, time
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import text
+
+from agents.storage import AgentStorage, get_activity_index_name, get_agent_storage, get_session_index
+from db.session import SessionLocal, db_engine
+
+TABLE_NAME = "bench_sessions"
+
+# Sessions are spread over the last 90 days, half of them were written again after they were created
+SEED_SQL = """
+INSERT INTO {table} (session_id, user_id, agent_id, memory, session_data, created_at, updated_at)
+SELECT
+    'bench-' || i,
+    'user-' || (i % :users),
+    'agent-' || (i % :agents),
+    jsonb_build_object('runs', jsonb_build_array(jsonb_build_object(
+        'message', (SELECT string_agg(md5(random()::text), '') FROM generate_series(1, :memory_chunks + 0 * i))
+    ))),
+    jsonb_build_object('session_name', 'Session ' || i),
+    :now - (random() * 7776000)::bigint,
+    CASE WHEN random() < 0.5 THEN :now - (random() * 86400)::bigint END
+FROM generate_series(:start, :stop) AS i
+ON CONFLICT (session_id) DO NOTHING
+"""
+
+
+def seed(storage: AgentStorage, sessions: int, users: int, agents: int, memory_bytes: int, batch: int) -> None:
+    with SessionLocal() as db:
+        existing = db.execute(text(f"SELECT count(*) FROM {storage.table.fullname}")).scalar() or 0
+    if existing >= sessions:
+        print(f"Using {existing} existing sessions in {storage.table.fullname}")
+        return
+
+    print(f"Seeding {sessions - existing} sessions into {storage.table.fullname}...")
+    started_at = perf_counter()
+    sql = text(SEED_SQL.format(table=storage.table.fullname))
+    for start in range(existing, sessions, batch):
+        with SessionLocal() as db, db.begin():
+            db.execute(
+                sql,
+                {
+                    "users": users,
+                    "agents": agents,
+                    "memory_chunks": max(memory_bytes // 32, 1),
+                    "now": int(time()),
+                    "start": start,
+                    "stop": min(start + batch, sessions) - 1,
+                },
+            )
+        print(f"  {min(start + batch, sessions)} sessions, {perf_counter() - started_at:.0f}s")
+    with SessionLocal() as db, db.begin():
+        db.execute(text(f"ANALYZE {storage.table.fullname}"))
+
+
+def timed(run: Callable[[], None], queries: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    for _ in range(queries):
+        started_at = perf_counter()
+        run()
+        latencies.append(perf_counter() - started_at)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def benchmark(storage: AgentStorage, args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    def random_owner() -> Tuple[str, str]:
+        return f"user-{random.randrange(args.users)}", f"agent-{random.randrange(args.agents)}"
+
+    def list_first_page() -> None:
+        user_id, agent_id = random_owner()
+        get_session_index(storage, user_id=user_id, agent_id=agent_id, limit=args.page_size)
+
+    def list_deep_page() -> None:
+        user_id, agent_id = random_owner()
+        _, cursor = get_session_index(storage, user_id=user_id, agent_id=agent_id, limit=args.page_size)
+        for _ in range(args.deep_pages):
+            if cursor is None:
+                break
+            _, cursor = get_session_index(
+                storage, user_id=user_id, agent_id=agent_id, limit=args.page_size, after=cursor
+            )
+
+    def load_session() -> None:
+        storage.read(f"bench-{random.randrange(args.sessions)}")
+
+    # Warm up the pool and the cache of the database
+    for run in (list_first_page, load_session):
+        run()
+    return {
+        "list": timed(list_first_page, args.queries),
+        f"page {args.deep_pages + 1}": timed(list_deep_page, max(args.queries // (args.deep_pages + 1), 1)),
+        "load": timed(load_session, args.queries),
+    }
+
+
+def explain(storage: AgentStorage, args: argparse.Namespace) -> None:
+    table = storage.table.fullname
+    with SessionLocal() as db:
+        plan = db.execute(
+            text(
+                f"EXPLAIN (ANALYZE, BUFFERS) SELECT session_id, session_data ->> 'session_name', "
+                f"coalesce(updated_at, created_at) FROM {table} WHERE user_id = 'user-0' AND agent_id = 'agent-0' "
+                f"ORDER BY coalesce(updated_at, created_at) DESC, session_id DESC LIMIT {args.page_size + 1}"
+            )
+        ).scalars()
+        print("\n".join(f"  {line}" for line in plan))
+
+
+def report(label: str, results: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n{label}")
+    print(f"{'query':<10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for query, result in results.items():
+        print(f"{query:<10} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['max_ms']:>8.2f}")
+
+
+def main(args: argparse.Namespace) -> None:
+    storage: AgentStorage = get_agent_storage(TABLE_NAME, compact_on_write=False, write_behind=False)  # type: ignore
+    storage.create()
+    index_name = f"{storage.schema}.{get_activity_index_name(storage.table)}"
+    try:
+        seed(storage, args.sessions, args.users, args.agents, args.memory_bytes, args.batch_size)
+        with SessionLocal() as db:
+            size = db.execute(text("SELECT pg_size_pretty(pg_total_relation_size(:t))"), {"t": storage.table.fullname})
+            print(f"Table size: {size.scalar()}")
+
+        report("With activity index", benchmark(storage, args))
+        if args.explain:
+            explain(storage, args)
+
+        if args.compare:
+            with SessionLocal() as db, db.begin():
+                db.execute(text(f"DROP INDEX {index_name}"))
+            try:
+                report("Without activity index", benchmark(storage, args))
+                if args.explain:
+                    explain(storage, args)
+            finally:
+                print("\nRecreating the activity index...")
+                for index in storage.table.indexes:
+                    if index.name == get_activity_index_name(storage.table):
+                        index.create(db_engine)
+    finally:
+        if not args.keep:
+            with SessionLocal() as db, db.begin():
+                db.execute(text(f"DROP TABLE {storage.table.fullname}"))
+        db_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1_000_000, help="Sessions in the table")
+    parser.add_argument("--users", type=int, default=10_000, help="Users the sessions are spread over")
+    parser.add_argument("--agents", type=int, default=3, help="Agents the sessions are spread over")
+    parser.add_argument("--memory-bytes", type=int, default=2048, help="Approximate size of each session memory")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="Sessions inserted per statement")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per measurement")
+    parser.add_argument("--page-size", type=int, default=20, help="Sessions per page, as in the ui")
+    parser.add_argument("--deep-pages", type=int, default=5, help="Pages to follow for the page measurement")
+    parser.add_argument("--compare", action="store_true", help="Also measure without the activity index")
+    parser.add_argument("--explain", action="store_true", help="Print the plan of the list query")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the {TABLE_NAME} table for the next run")
+    main(parser.parse_args())
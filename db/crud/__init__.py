@@ -0,0 +1,11 @@
+from db.crud.systems import (
+    SystemInfo,
+    SystemRegistry,
+    acreate_system,
+    adelete_system,
+    aget_system,
+    aget_system_by_host,
+    alist_systems,
+    aupdate_system,
+    system_registry,
+)
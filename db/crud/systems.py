@@ -0,0 +1,145 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from db.settings import db_settings
+from db.tables.systems import SystemsTable
+from utils.cache import Cache, get_cache
+from utils.log import logger
+
+
+@dataclass(frozen=True)
+class SystemInfo:
+    """A system without its password, safe to keep in caches and ui state."""
+
+    id: int
+    host: str
+    user: str
+    port: int
+    schema: str
+
+    @property
+    def label(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+class SystemRegistry:
+    """Cache of the systems, shared by all processes using the same cache backend.
+
+    The ui lists the systems on every rerun of a page. The registry reads them once and again after
+    `ttl` seconds, or after a system is created, updated or deleted through the functions in this module.
+    With the Redis cache backend, changes made by the api are seen by the ui immediately.
+    Passwords are not cached, get them with `aget_system` when connecting.
+    """
+
+    def __init__(self, ttl: float = 60):
+        self.cache: Cache = get_cache("systems", ttl=ttl)
+
+    async def alist(self, session_factory: async_sessionmaker[AsyncSession]) -> List[SystemInfo]:
+        """
+        List all systems ordered by id, from the cache if it is fresh.
+
+        Args:
+            session_factory (async_sessionmaker[AsyncSession]): Opens a session if the cache is stale.
+
+        Returns:
+            List[SystemInfo]: The systems.
+        """
+
+        async def load() -> List[Dict[str, Any]]:
+            stmt = select(
+                SystemsTable.id, SystemsTable.host, SystemsTable.user, SystemsTable.port, SystemsTable.schema
+            ).order_by(SystemsTable.id)
+            async with session_factory() as db_session:
+                rows = (await db_session.execute(stmt)).all()
+            return [dict(row._mapping) for row in rows]
+
+        return [SystemInfo(**system) for system in await self.cache.aget_or_set("all", load)]
+
+    def invalidate(self) -> None:
+        """Read the systems again on the next call to `alist`, lists read before are not cached."""
+        self.cache.invalidate("all")
+
+
+system_registry = SystemRegistry(ttl=db_settings.systems_cache_ttl)
+
+
+async def acreate_system(
+    db_session: AsyncSession, host: str, user: str, password: str, port: int, schema: str
+) -> SystemsTable:
+    """
+    Create a new system in the database.
+
+    Args:
+        db_session (AsyncSession): The SQLAlchemy async session to use.
+        host (str): The host of the system.
+        user (str): The user for the system.
+        password (str): The password for the system.
+        port (int): The port of the system.
+        schema (str): The schema of the system.
+
+    Returns:
+        SystemsTable: The created system object.
+    """
+    try:
+        new_system = SystemsTable(host=host, user=user, password=password, port=port, schema=schema)
+        db_session.add(new_system)
+        await db_session.commit()
+        await db_session.refresh(new_system)
+        system_registry.invalidate()
+        return new_system
+    except Exception as e:
+        logger.error(f"Error creating system: {e}")
+        await db_session.rollback()
+        raise
+
+
+async def aget_system(db_session: AsyncSession, system_id: int) -> Optional[SystemsTable]:
+    """Get a system by id, None if it does not exist."""
+    return await db_session.get(SystemsTable, system_id)
+
+
+async def aget_system_by_host(db_session: AsyncSession, host: str) -> Optional[SystemsTable]:
+    """Get the first system with the given host, None if there is none."""
+    result = await db_session.execute(select(SystemsTable).where(SystemsTable.host == host).limit(1))
+    return result.scalar_one_or_none()
+
+
+async def alist_systems(db_session: AsyncSession) -> List[SystemsTable]:
+    """List all systems ordered by id."""
+    result = await db_session.execute(select(SystemsTable).order_by(SystemsTable.id))
+    return list(result.scalars().all())
+
+
+async def aupdate_system(db_session: AsyncSession, system_id: int, **values: Any) -> Optional[SystemsTable]:
+    """
+    Update the columns of a system.
+
+    Args:
+        db_session (AsyncSession): The SQLAlchemy async session to use.
+        system_id (int): The ID of the system.
+        **values: Column values to set, e.g. `port=8076`.
+
+    Returns:
+        Optional[SystemsTable]: The updated system, None if it does not exist.
+    """
+    system = await db_session.get(SystemsTable, system_id)
+    if system is None:
+        return None
+    for column, value in values.items():
+        if column not in SystemsTable.__table__.columns or column == "id":
+            raise ValueError(f"Unknown system column: {column}")
+        setattr(system, column, value)
+    await db_session.commit()
+    system_registry.invalidate()
+    return system
+
+
+async def adelete_system(db_session: AsyncSession, system_id: int) -> bool:
+    """Delete a system. Returns False if it does not exist."""
+    result = await db_session.execute(delete(SystemsTable).where(SystemsTable.id == system_id))
+    await db_session.commit()
+    system_registry.invalidate()
+    return result.rowcount > 0
@@ -0,0 +1,56 @@
+"""Index agent session tables
+
+Revision ID: 6a1f3e9c2b74
+Revises: 2d7e4b6a1c58
+Create Date: 2026-10-19 15:21:09.640215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a1f3e9c2b74'
+down_revision = '2d7e4b6a1c58'
+branch_labels = None
+depends_on = None
+
+# Tables of agents.storage.AgentStorage. They are created by agno when an agent first writes a session,
+# tables created after this migration get the same index from AgentStorage.get_table().
+SESSION_SCHEMA = 'ai'
+SESSION_TABLES = ('sage_sessions', 'scholar_sessions', 'db2i_sessions')
+
+
+def _existing_tables():
+    bind = op.get_bind()
+    for table in SESSION_TABLES:
+        if bind.execute(sa.text('SELECT to_regclass(:name)'), {'name': f'{SESSION_SCHEMA}.{table}'}).scalar():
+            yield table
+
+
+def upgrade() -> None:
+    # Built concurrently outside the migration transaction, so agents keep writing sessions meanwhile
+    with op.get_context().autocommit_block():
+        for table in _existing_tables():
+            # Lists the sessions of a user and agent by last activity, see agents.storage.get_session_index
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{SESSION_SCHEMA}_{table}_user_agent_activity '
+                f'ON {SESSION_SCHEMA}.{table} '
+                '(user_id, agent_id, coalesce(updated_at, created_at) DESC, session_id DESC)'
+            )
+            # Every run rewrites the whole session, most of it in the toast table. Vacuum after 5% instead
+            # of 20% of the rows changed, so large tables don't accumulate dead session versions.
+            op.execute(
+                f'ALTER TABLE {SESSION_SCHEMA}.{table} SET ('
+                'autovacuum_vacuum_scale_factor = 0.05, toast.autovacuum_vacuum_scale_factor = 0.05)'
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table in _existing_tables():
+            op.execute(
+                f'ALTER TABLE {SESSION_SCHEMA}.{table} RESET ('
+                'autovacuum_vacuum_scale_factor, toast.autovacuum_vacuum_scale_factor)'
+            )
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {SESSION_SCHEMA}.ix_{SESSION_SCHEMA}_{table}_user_agent_activity')
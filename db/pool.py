@@ -0,0 +1,139 @@
+from functools import partial
+from time import monotonic, perf_counter
+from typing import Any, Union
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection, QueuePool
+
+from db.settings import db_settings
+from utils.log import logger
+from utils.metrics import metrics_registry
+
+######################################################
+## Connection pool instrumentation
+######################################################
+
+db_pool_connections = metrics_registry.gauge(
+    "db_pool_connections",
+    "Connections in the SQLAlchemy pool by state.",
+    ["engine", "state"],
+)
+db_pool_checkout_duration = metrics_registry.histogram(
+    "db_pool_checkout_seconds",
+    "Time to check out a pool connection, including waiting for a free connection, connecting and pings.",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0),
+)
+db_pool_timeouts_total = metrics_registry.counter(
+    "db_pool_timeouts_total",
+    "Checkouts that gave up waiting for a connection because the pool was exhausted.",
+    ["engine"],
+)
+db_pool_connects_total = metrics_registry.counter(
+    "db_pool_connects_total",
+    "New database connections opened by the pool, overflow connections are beyond pool_size.",
+    ["engine", "overflow"],
+)
+db_pool_invalidations_total = metrics_registry.counter(
+    "db_pool_invalidations_total",
+    "Pool connections invalidated, hard invalidations close the connection immediately.",
+    ["engine", "type"],
+)
+db_pool_pings_total = metrics_registry.counter(
+    "db_pool_pings_total",
+    "Pings of idle connections on checkout by result.",
+    ["engine", "result"],
+)
+
+
+class _InstrumentedPoolMixin:
+    """Records how long checkouts take and how often they time out.
+
+    The engine label is the `pool_logging_name` of the engine, it is kept when the pool is recreated.
+    """
+
+    def connect(self) -> PoolProxiedConnection:
+        engine_name = self.logging_name or "default"  # type: ignore[attr-defined]
+        started_at = perf_counter()
+        try:
+            connection = super().connect()  # type: ignore[misc]
+        except exc.TimeoutError:
+            db_pool_timeouts_total.inc(engine=engine_name)
+            logger.error(f"Timed out waiting for a {engine_name} db connection: {self.status()}")  # type: ignore
+            raise
+        finally:
+            waited = perf_counter() - started_at
+            db_pool_checkout_duration.observe(waited, engine=engine_name)
+        if waited > db_settings.db_pool_log_wait_over:
+            logger.warning(f"Waited {waited:.2f}s for a {engine_name} db connection: {self.status()}")  # type: ignore
+        return connection
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_stat(engine: Engine, method: str) -> float:
+    # The pool is read on every call, `engine.dispose()` replaces it
+    return getattr(engine.pool, method)()
+
+
+def instrument_engine(engine: Union[Engine, AsyncEngine], name: str) -> None:
+    """Add pool event listeners and gauges to an engine created with an instrumented pool class.
+
+    Listeners are registered on the engine, so they also apply to the pool created by `engine.dispose()`.
+    """
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+
+    for state, method in (
+        ("size", "size"),
+        ("checked_out", "checkedout"),
+        ("checked_in", "checkedin"),
+        ("overflow", "overflow"),
+    ):
+        db_pool_connections.set_function(partial(_pool_stat, sync_engine, method), engine=name, state=state)
+
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+        overflow = sync_engine.pool.overflow() > 0  # type: ignore[attr-defined]
+        db_pool_connects_total.inc(engine=name, overflow=str(overflow).lower())
+        if overflow:
+            logger.debug(f"Opened an overflow {name} db connection: {sync_engine.pool.status()}")
+
+    @event.listens_for(sync_engine, "invalidate")
+    def on_invalidate(dbapi_connection: Any, connection_record: Any, exception: Any) -> None:
+        db_pool_invalidations_total.inc(engine=name, type="hard")
+        logger.warning(f"Invalidated a {name} db connection: {exception}")
+
+    @event.listens_for(sync_engine, "soft_invalidate")
+    def on_soft_invalidate(dbapi_connection: Any, connection_record: Any, exception: Any) -> None:
+        db_pool_invalidations_total.inc(engine=name, type="soft")
+        logger.info(f"Soft invalidated a {name} db connection: {exception}")
+
+    if db_settings.db_pool_ping_strategy != "idle":
+        return
+
+    # Only ping connections that were idle for a while, connections in active use are known to be alive.
+    # Raising DisconnectionError makes the pool discard the connection and retry with a new one.
+    @event.listens_for(sync_engine, "checkin")
+    def on_checkin(dbapi_connection: Any, connection_record: Any) -> None:
+        connection_record.info["checked_in_at"] = monotonic()
+
+    @event.listens_for(sync_engine, "checkout")
+    def on_checkout(dbapi_connection: Any, connection_record: Any, connection_proxy: Any) -> None:
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or monotonic() - checked_in_at < db_settings.db_pool_ping_idle_after:
+            return
+        try:
+            sync_engine.dialect.do_ping(dbapi_connection)
+        except Exception as e:
+            db_pool_pings_total.inc(engine=name, result="failed")
+            logger.info(f"Idle {name} db connection is gone, reconnecting: {e}")
+            raise exc.DisconnectionError() from e
+        db_pool_pings_total.inc(engine=name, result="ok")
@@ -1,17 +1,42 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 from sqlalchemy.engine import Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
 
+from db.pool import InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool, instrument_engine
 from db.settings import db_settings
 
 # Create SQLAlchemy Engine using a database URL
 db_url: str = db_settings.get_db_url()
-db_engine: Engine = create_engine(db_url, pool_pre_ping=True)
+db_engine: Engine = create_engine(
+    db_url, poolclass=InstrumentedQueuePool, pool_logging_name="sync", **db_settings.get_pool_options()
+)
+instrument_engine(db_engine, "sync")
 
 # Create a SessionLocal class
 SessionLocal: sessionmaker[Session] = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
 
+# Create an async SQLAlchemy Engine, psycopg supports both sync and async connections with the same url
+async_db_engine: AsyncEngine = create_async_engine(
+    db_url, poolclass=InstrumentedAsyncAdaptedQueuePool, pool_logging_name="async", **db_settings.get_pool_options()
+)
+instrument_engine(async_db_engine, "async")
+
+# Create an AsyncSessionLocal class
+# Objects are not expired on commit, async sessions can't lazy load expired attributes
+AsyncSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
+    bind=async_db_engine, autoflush=False, expire_on_commit=False
+)
+
+# Async connections belong to the event loop that opened them. Streamlit runs every script run on a new
+# event loop, so the ui uses an engine that opens a connection per session instead of pooling them.
+unpooled_async_db_engine: AsyncEngine = create_async_engine(db_url, poolclass=NullPool)
+UnpooledAsyncSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
+    bind=unpooled_async_db_engine, autoflush=False, expire_on_commit=False
+)
+
 
 def get_db() -> Generator[Session, None, None]:
     """
@@ -25,3 +50,14 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency to get an async database session.
+
+    Yields:
+        AsyncSession: An SQLAlchemy async database session.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,5 +1,5 @@
 from os import getenv
-from typing import Optional
+from typing import Any, Dict, Literal, Optional
 
 from pydantic_settings import BaseSettings
 
@@ -20,6 +20,31 @@ class DbSettings(BaseSettings):
     # Create/Upgrade database on startup using alembic
     migrate_db: bool = False
 
+    # Connection pool, the settings apply to each engine in each process.
+    # The api and ui each have a sync and an async engine, so a container can open up to
+    # workers * 2 * (db_pool_size + db_max_overflow) connections. Keep the total for all containers
+    # below max_connections of the database, e.g. ~80 on an RDS db.t4g.micro and ~400 on a db.t4g.medium.
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    # Seconds to wait for a connection when the pool is exhausted
+    db_pool_timeout: float = 30
+    # Replace connections older than this many seconds, -1 to keep connections forever
+    db_pool_recycle: int = 1800
+    # Reuse the most recently returned connection, so idle connections beyond the load get recycled
+    db_pool_use_lifo: bool = True
+    # How checked out connections are tested:
+    # "always" pings on every checkout, "idle" only pings connections that were idle for
+    # db_pool_ping_idle_after seconds, "never" relies on recycling and invalidation on errors
+    db_pool_ping_strategy: Literal["always", "idle", "never"] = "idle"
+    db_pool_ping_idle_after: float = 60
+    # Log a warning when waiting for a connection takes longer than this many seconds
+    db_pool_log_wait_over: float = 1.0
+
+    # Seconds the system registry caches the list of systems. Changes made by this process are seen
+    # immediately, changes made by other processes (e.g. the api vs the ui) after at most this long,
+    # or immediately with the Redis cache backend.
+    systems_cache_ttl: float = 60
+
     def get_db_url(self) -> str:
         db_url = "{}://{}{}@{}:{}/{}".format(
             self.db_driver,
@@ -43,6 +68,17 @@ class DbSettings(BaseSettings):
             raise ValueError("Could not build database connection")
         return db_url
 
+    def get_pool_options(self) -> Dict[str, Any]:
+        """Keyword arguments for create_engine and create_async_engine."""
+        return {
+            "pool_size": self.db_pool_size,
+            "max_overflow": self.db_max_overflow,
+            "pool_timeout": self.db_pool_timeout,
+            "pool_recycle": self.db_pool_recycle,
+            "pool_use_lifo": self.db_pool_use_lifo,
+            "pool_pre_ping": self.db_pool_ping_strategy == "always",
+        }
+
 
 # Create DbSettings object
 db_settings = DbSettings()
@@ -1,2 +1,9 @@
 from db.tables.base import Base
+from db.tables.chunk_signatures import ChunkSignatureTable
+from db.tables.crawled_pages import CrawledPageTable
+from db.tables.embedding_cache import EmbeddingCacheTable
+from db.tables.jobs import JobsTable
+from db.tables.knowledge_documents import KnowledgeDocumentTable
+from db.tables.response_cache import ResponseCacheTable
+from db.tables.session_archive import SessionArchiveTable
 from db.tables.systems import SystemsTable
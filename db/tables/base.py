@@ -1,4 +1,6 @@
-from sqlalchemy import MetaData
+from typing import ClassVar
+
+from sqlalchemy import MetaData, Table
 from sqlalchemy.orm import DeclarativeBase
 
 
@@ -11,3 +13,5 @@ class Base(DeclarativeBase):
     """
 
     metadata = MetaData(schema="public")
+    # Every model is mapped to a Table, DeclarativeBase types it as any FromClause
+    __table__: ClassVar[Table]
@@ -0,0 +1,33 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import Index
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.expression import text
+from sqlalchemy.types import BigInteger, DateTime, LargeBinary, String
+
+from db.tables.base import Base
+
+
+class ChunkSignatureTable(Base):
+    """Table for storing MinHash signatures of knowledge chunks, see agents.knowledge.dedupe."""
+
+    __tablename__ = "chunk_signatures"
+
+    # The knowledge table the chunk is in, e.g. "sage_knowledge"
+    table_name: Mapped[str] = mapped_column(String, primary_key=True)
+    chunk_id: Mapped[str] = mapped_column(String, primary_key=True)
+    # meta_data["source"] of the chunk, chunks of a source being replaced are not compared
+    source: Mapped[Optional[str]] = mapped_column(String)
+    # content_hash of the chunk when the signature was computed, a signature of other content is ignored
+    content_hash: Mapped[str] = mapped_column(String, nullable=False)
+    # MinHash of the shingles of the content, little endian uint32 per permutation
+    signature: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    # Hashes of the bands of the signature, chunks sharing a band are compared
+    bands: Mapped[List[int]] = mapped_column(ARRAY(BigInteger), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
+
+
+# Finds the chunks sharing a band with new chunks, bands && ARRAY[...]
+Index("ix_public_chunk_signatures_bands", ChunkSignatureTable.bands, postgresql_using="gin")
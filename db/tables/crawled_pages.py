@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.expression import text
+from sqlalchemy.types import DateTime, String
+
+from db.tables.base import Base
+
+
+class CrawledPageTable(Base):
+    """Table for storing the pages of websites added to knowledge bases, see agents.knowledge.crawl."""
+
+    __tablename__ = "crawled_pages"
+
+    # The knowledge table the pages are indexed in, e.g. "sage_knowledge"
+    table_name: Mapped[str] = mapped_column(String, primary_key=True)
+    # The url the crawl starts from
+    source: Mapped[str] = mapped_column(String, primary_key=True)
+    url: Mapped[str] = mapped_column(String, primary_key=True)
+    # Validators of the last response, sent back as If-None-Match and If-Modified-Since
+    etag: Mapped[Optional[str]] = mapped_column(String)
+    last_modified: Mapped[Optional[str]] = mapped_column(String)
+    # md5 of the extracted text, None if the page has no main content
+    content_hash: Mapped[Optional[str]] = mapped_column(String)
+    # Links to follow when the page is not modified
+    links: Mapped[List[str]] = mapped_column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
+    crawled_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
+    changed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
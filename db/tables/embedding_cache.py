@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import List
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.expression import text
+from sqlalchemy.types import DateTime, String
+
+from db.tables.base import Base
+
+
+class EmbeddingCacheTable(Base):
+    """Table for storing embeddings of knowledge chunks by content hash, see agents.knowledge.ingest."""
+
+    __tablename__ = "embedding_cache"
+
+    # Embedding model and dimensions, e.g. "text-embedding-3-small:1536"
+    model: Mapped[str] = mapped_column(String, primary_key=True)
+    # md5 of the cleaned chunk content, like content_hash of the PgVector tables
+    content_hash: Mapped[str] = mapped_column(String, primary_key=True)
+    # Any number of dimensions, embeddings are only looked up by key
+    embedding: Mapped[List[float]] = mapped_column(Vector(), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=text("now()"), index=True)
@@ -0,0 +1,49 @@
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.expression import text
+from sqlalchemy.types import DateTime, String, Text
+
+from db.tables.base import Base
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+FINISHED_STATUSES = (JobStatus.succeeded.value, JobStatus.failed.value, JobStatus.cancelled.value)
+
+
+class JobsTable(Base):
+    """Table for storing background jobs and their results."""
+
+    __tablename__ = "jobs"
+
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    # Type of job, e.g. "agent_run"
+    kind: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    # One of: queued, running, succeeded, failed, cancelled
+    status: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    agent_id: Mapped[Optional[str]] = mapped_column(String)
+    user_id: Mapped[Optional[str]] = mapped_column(String, index=True)
+    session_id: Mapped[Optional[str]] = mapped_column(String)
+    # Request parameters for the job
+    payload: Mapped[Dict[str, Any]] = mapped_column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    result: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB)
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    # Id of the worker that claimed the job
+    worker_id: Mapped[Optional[str]] = mapped_column(String)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    # Updated periodically while a job is running, used to recover jobs from dead workers
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    # Progress reported by the running job, e.g. pages parsed and chunks embedded by knowledge ingestion
+    progress: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB)
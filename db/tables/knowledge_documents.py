@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.expression import text
+from sqlalchemy.types import DateTime, Integer, String
+
+from db.tables.base import Base
+
+
+class KnowledgeDocumentTable(Base):
+    """Table for storing the documents of knowledge bases by source, see agents.knowledge.documents."""
+
+    __tablename__ = "knowledge_documents"
+
+    # The knowledge table the chunks of the document are in, e.g. "sage_knowledge"
+    table_name: Mapped[str] = mapped_column(String, primary_key=True)
+    # The file name of an uploaded document or the url a website is crawled from
+    source: Mapped[str] = mapped_column(String, primary_key=True)
+    # One of: file, website
+    kind: Mapped[str] = mapped_column(String, nullable=False)
+    # Incremented every time a new version of the document changes chunks
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("1"))
+    # md5 of the uploaded file, a file with the same hash is not ingested again
+    content_hash: Mapped[Optional[str]] = mapped_column(String)
+    # Chunks of the latest version
+    chunks: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import List
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Index
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.expression import text
+from sqlalchemy.types import BigInteger, DateTime, String, Text
+
+from db.tables.base import Base
+
+# Dimensions of the prompt embeddings, must match agent_settings.semantic_cache_dimensions
+EMBEDDING_DIMENSIONS = 1536
+
+
+class ResponseCacheTable(Base):
+    """Table for storing agent answers keyed by the embedding of the prompt."""
+
+    __tablename__ = "response_cache"
+    __table_args__ = (
+        Index(
+            "ix_public_response_cache_embedding",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    agent_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    model_id: Mapped[str] = mapped_column(String, nullable=False)
+    prompt: Mapped[str] = mapped_column(Text, nullable=False)
+    embedding: Mapped[List[float]] = mapped_column(Vector(EMBEDDING_DIMENSIONS), nullable=False)
+    response: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=text("now()"), index=True)
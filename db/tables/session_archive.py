@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Index
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.expression import text
+from sqlalchemy.types import BigInteger, DateTime, Integer, LargeBinary, String
+
+from db.tables.base import Base
+
+
+class SessionArchiveTable(Base):
+    """Table for storing idle agent sessions moved out of the agent session tables, see agents.archive."""
+
+    __tablename__ = "session_archive"
+
+    # The agent session table the session was archived from, e.g. "sage_sessions"
+    table_name: Mapped[str] = mapped_column(String, primary_key=True)
+    session_id: Mapped[str] = mapped_column(String, primary_key=True)
+    # Copied from the session to list archived sessions without decompressing them
+    user_id: Mapped[Optional[str]] = mapped_column(String)
+    agent_id: Mapped[Optional[str]] = mapped_column(String)
+    session_name: Mapped[Optional[str]] = mapped_column(String)
+    # Epoch seconds, like the agent session tables
+    created_at: Mapped[Optional[int]] = mapped_column(BigInteger)
+    last_activity: Mapped[Optional[int]] = mapped_column(BigInteger)
+    # zlib compressed json of the session row
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    # Size of the uncompressed json
+    size_bytes: Mapped[int] = mapped_column(Integer, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=text("now()"))
+
+
+# Lists archived sessions of a user and agent by last activity, like the index of the agent session tables
+Index(
+    "ix_public_session_archive_user_agent_activity",
+    SessionArchiveTable.table_name,
+    SessionArchiveTable.user_id,
+    SessionArchiveTable.agent_id,
+    SessionArchiveTable.last_activity.desc(),
+    SessionArchiveTable.session_id.desc(),
+)
@@ -13,7 +13,7 @@ class SystemsTable(Base):
     __tablename__ = "systems"
     
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True, autoincrement=True)
-    host: Mapped[str] = mapped_column(String, nullable=False)
+    host: Mapped[str] = mapped_column(String, nullable=False, index=True)
     user: Mapped[str] = mapped_column(String, nullable=False)
     password: Mapped[str] = mapped_column(String, nullable=False)
     port: Mapped[int] = mapped_column(BigInteger, nullable=False)
@@ -6,7 +6,7 @@ from agno.agent import Agent
 from agno.tools.streamlit.components import check_password
 from agno.utils.log import logger
 
-from agents.db2i_agent import db2i_agent_session, get_db2i_agent
+from agents.db2i_agent import aget_system_connection_details, db2i_agent_session, get_db2i_agent
 from ui.css import CUSTOM_CSS
 from ui.utils import (
     add_message,
@@ -20,22 +20,20 @@ from ui.utils import (
 )
 
 
-def get_connection_details():
-    """Get connection details from session state or environment variables."""
-    # Check if we have a selected system in session state
+async def get_connection_details():
+    """Get connection details of the selected system or from environment variables."""
+    # The selected system in session state has no password, read it when connecting
     if (
         hasattr(st.session_state, "selected_system")
         and st.session_state.selected_system
     ):
-        system = st.session_state.selected_system
-        connection_details = {
-            "host": system["host"],
-            "user": system["user"],
-            "password": system["password"],
-            "port": system["port"],
-            "schema": system["schema"],
-        }
-        return connection_details
+        from db.session import UnpooledAsyncSessionLocal
+
+        connection_details = await aget_system_connection_details(
+            st.session_state.selected_system["id"], UnpooledAsyncSessionLocal
+        )
+        if connection_details is not None:
+            return connection_details
 
     # Fallback to environment variables
     import os
@@ -198,7 +196,7 @@ async def body() -> None:
                     current_session_id = st.session_state[agent_name].get("session_id")
                     logger.info(f"Using session ID: {current_session_id}")
 
-                    connection_details = get_connection_details()
+                    connection_details = await get_connection_details()
 
                     # Create temporary agent with existing session ID
                     async with db2i_agent_session(
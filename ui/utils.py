@@ -1,16 +1,18 @@
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import streamlit as st
 from agno.agent import Agent
-from agno.document import Document
-from agno.document.reader import Reader
-from agno.document.reader.csv_reader import CSVReader
-from agno.document.reader.docx_reader import DocxReader
-from agno.document.reader.pdf_reader import PDFReader
-from agno.document.reader.text_reader import TextReader
-from agno.document.reader.website_reader import WebsiteReader
 from agno.utils.log import logger
 
+from agents.knowledge.documents import delete_all_documents, delete_document, list_documents
+from agents.knowledge.ingest import get_reader
+from agents.knowledge.jobs import cancel_ingestion, get_ingestion_jobs, start_ingest_worker, submit_ingestion
+from agents.storage import SessionCursor, SessionIndexEntry, get_session_index
+from db.tables.jobs import FINISHED_STATUSES, JobsTable, JobStatus
+
+# Number of sessions listed in the session selector before "Show older sessions"
+SESSION_INDEX_PAGE_SIZE = 20
+
 
 async def initialize_agent_session_state(agent_name: str):
     logger.info(f"---*--- Initializing session state for {agent_name} ---*---")
@@ -144,6 +146,90 @@ async def example_inputs(agent_name: str) -> None:
                 )
 
 
+def queue_knowledge(agent: Agent, upload: Optional[Any] = None, url: Optional[str] = None) -> None:
+    """Queue a document or a website for the knowledge base of the agent, see agents.knowledge.jobs."""
+    start_ingest_worker()
+    try:
+        submit_ingestion(
+            agent.agent_id,  # type: ignore[arg-type]
+            upload=upload,
+            url=url,
+            user_id=agent.user_id,
+            session_id=agent.session_id,
+        )
+    except Exception as e:
+        logger.error(f"Could not queue knowledge: {e}")
+        st.sidebar.error("Could not add to the knowledge base")
+
+
+def ingestion_job_summary(job: JobsTable) -> str:
+    """Describe an ingestion job, with its progress while it runs and its result when it is done."""
+    name = job.payload.get("name", job.id)
+    progress = job.progress or {}
+    if job.status == JobStatus.queued.value:
+        return f"{name}: waiting"
+    if job.status == JobStatus.running.value:
+        done = progress.get("chunks_written", 0) + progress.get("chunks_skipped", 0)
+        pages = f"{progress['pages_parsed']}/{progress['pages']} pages, " if progress.get("pages") else ""
+        return f"{name}: {pages}{progress.get('chunks_embedded', 0)} chunks embedded, {done} added"
+    if job.status == JobStatus.cancelled.value:
+        return f"{name}: cancelled, {progress.get('chunks_written', 0)} chunks were added"
+    if job.status == JobStatus.failed.value:
+        return f"{name}: failed, {job.error}"
+    result = job.result or {}
+    report = result.get("ingestion")
+    if report is None:
+        if "url" not in job.payload:
+            return f"{name}: unchanged since it was added"
+        if result.get("unchanged"):
+            return f"{name}: no changes on {result['unchanged']} pages since the last crawl"
+        return f"{name}: could not read the website"
+    summary = f"{name}: added {report['written']} chunks"
+    if report["embedded"] < report["chunks"]:
+        summary += f", {report['skipped'] + report['cached']} unchanged or cached"
+    if report.get("duplicates"):
+        summary += f", {report['duplicates']} near-duplicates dropped"
+    if report["failed"]:
+        summary += f", {report['failed']} failed, add it again to retry"
+    return summary
+
+
+def ingestion_jobs_panel(agent: Agent) -> None:
+    """Display the latest knowledge ingestion jobs, refreshed while they run. Call it in the sidebar."""
+    active_key = f"{agent.agent_id}_knowledge_jobs_active"
+
+    def panel() -> None:
+        try:
+            jobs = get_ingestion_jobs(agent.agent_id, agent.user_id, limit=5)  # type: ignore[arg-type]
+        except Exception as e:
+            logger.error(f"Could not read knowledge ingestion jobs: {e}")
+            return
+        active = any(job.status not in FINISHED_STATUSES for job in jobs)
+        if active != st.session_state.get(active_key, False):
+            # Start polling when a job was queued, stop when the last one finished
+            st.session_state[active_key] = active
+            st.rerun(scope="app")
+        for job in jobs:
+            summary = ingestion_job_summary(job)
+            if job.status in FINISHED_STATUSES:
+                st.caption(summary)
+                continue
+            progress = job.progress or {}
+            if progress.get("pages"):
+                value = progress["pages_parsed"] / progress["pages"]
+            else:
+                done = progress.get("chunks_written", 0) + progress.get("chunks_skipped", 0)
+                value = done / max(progress.get("chunks", 0), 1)
+            st.progress(min(value, 1.0), text=summary)
+            if st.button("Cancel", key=f"cancel_ingestion_{job.id}"):
+                cancel_ingestion(job.id)
+                st.rerun(scope="fragment")
+
+    # Poll the jobs table only while jobs are queued or running
+    run_every = 2 if st.session_state.get(active_key, False) else None
+    st.fragment(panel, run_every=run_every)()
+
+
 async def knowledge_widget(agent_name: str, agent: Agent) -> None:
     """Display a knowledge widget in the sidebar."""
 
@@ -157,16 +243,9 @@ async def knowledge_widget(agent_name: str, agent: Agent) -> None:
         add_url_button = st.sidebar.button("Add URL")
         if add_url_button:
             if input_url is not None:
-                alert = st.sidebar.info("Processing URLs...", icon="ℹ️")
                 if f"{input_url}_scraped" not in st.session_state:
-                    scraper = WebsiteReader(max_links=2, max_depth=1)
-                    web_documents: List[Document] = scraper.read(input_url)
-                    if web_documents:
-                        agent.knowledge.load_documents(web_documents, upsert=True)
-                    else:
-                        st.sidebar.error("Could not read website")
+                    queue_knowledge(agent, url=input_url)
                     st.session_state[f"{input_url}_uploaded"] = True
-                alert.empty()
 
         # Add documents to knowledge base
         if "file_uploader_key" not in st.session_state:
@@ -176,35 +255,76 @@ async def knowledge_widget(agent_name: str, agent: Agent) -> None:
             key=st.session_state[agent_name]["file_uploader_key"],
         )
         if uploaded_file is not None:
-            alert = st.sidebar.info("Processing document...", icon="🧠")
-            document_name = uploaded_file.name.split(".")[0]
-            if f"{document_name}_uploaded" not in st.session_state:
-                file_type = uploaded_file.name.split(".")[-1].lower()
-
-                reader: Reader
-                if file_type == "pdf":
-                    reader = PDFReader()
-                elif file_type == "csv":
-                    reader = CSVReader()
-                elif file_type == "txt":
-                    reader = TextReader()
-                elif file_type == "docx":
-                    reader = DocxReader()
-                else:
+            # Keyed by the upload, a new version of a document with the same name replaces the previous one
+            if f"{uploaded_file.file_id}_uploaded" not in st.session_state:
+                if get_reader(uploaded_file.name) is None:
                     st.sidebar.error("Unsupported file type")
                     return
-                uploaded_file_documents: List[Document] = reader.read(uploaded_file)
-                if uploaded_file_documents:
-                    agent.knowledge.load_documents(uploaded_file_documents, upsert=True)
-                else:
-                    st.sidebar.error("Could not read document")
-                st.session_state[f"{document_name}_uploaded"] = True
-            alert.empty()
-
-        # Load and delete knowledge
-        if st.sidebar.button("🗑️ Delete Knowledge"):
-            agent.knowledge.delete()
-            st.sidebar.success("Knowledge deleted!")
+                # Ingested by a background worker, the page stays usable and the tab can be closed
+                queue_knowledge(agent, upload=uploaded_file)
+                st.session_state[f"{uploaded_file.file_id}_uploaded"] = True
+
+        with st.sidebar:
+            ingestion_jobs_panel(agent)
+
+        # List and delete documents, the other documents and the vector index are not touched
+        vector_db = agent.knowledge.vector_db
+        with st.sidebar.expander("Documents in the Knowledge Base"):
+            try:
+                documents = list_documents(vector_db)  # type: ignore[arg-type]
+            except Exception as e:
+                logger.error(f"Could not list knowledge documents: {e}")
+                documents = []
+            if not documents:
+                st.caption("No documents added yet")
+            for document in documents:
+                name_column, delete_column = st.columns([5, 1])
+                name_column.caption(f"{document.source}  \nversion {document.version}, {document.chunks} chunks")
+                if delete_column.button("🗑️", key=f"delete_document_{document.source}", help="Delete this document"):
+                    delete_document(vector_db, document.source)  # type: ignore[arg-type]
+                    st.rerun()
+            if st.button("🗑️ Delete All Knowledge"):
+                delete_all_documents(vector_db)  # type: ignore[arg-type]
+                st.success("Knowledge deleted!")
+
+
+def get_session_index_page(
+    agent_name: str, agent: Agent, user_id: str
+) -> Tuple[List[SessionIndexEntry], Optional[SessionCursor]]:
+    """Return the loaded sessions of the user and the cursor for older sessions.
+
+    The index is kept in the session state and only queried again when the user changes or the
+    current session is not listed yet, e.g. after its first run.
+    """
+    index = st.session_state[agent_name].get("session_index")
+    if (
+        index is None
+        or index["user_id"] != user_id
+        or (agent.session_id is not None and agent.session_id not in {s.session_id for s in index["sessions"]})
+    ):
+        sessions, next_cursor = get_session_index(
+            agent.storage,  # type: ignore[arg-type]
+            user_id=user_id,
+            agent_id=agent.agent_id,
+            limit=SESSION_INDEX_PAGE_SIZE,
+        )
+        index = {"user_id": user_id, "sessions": sessions, "next_cursor": next_cursor}
+        st.session_state[agent_name]["session_index"] = index
+    return index["sessions"], index["next_cursor"]
+
+
+def load_older_sessions(agent_name: str, agent: Agent) -> None:
+    """Append the next page of sessions to the session index."""
+    index = st.session_state[agent_name]["session_index"]
+    sessions, next_cursor = get_session_index(
+        agent.storage,  # type: ignore[arg-type]
+        user_id=index["user_id"],
+        agent_id=agent.agent_id,
+        limit=SESSION_INDEX_PAGE_SIZE,
+        after=index["next_cursor"],
+    )
+    index["sessions"] = index["sessions"] + sessions
+    index["next_cursor"] = next_cursor
 
 
 async def session_selector(agent_name: str, agent: Agent, get_agent: Callable, user_id: str, model_id: str) -> None:
@@ -214,33 +334,36 @@ async def session_selector(agent_name: str, agent: Agent, get_agent: Callable, u
         return
 
     try:
-        # Get all agent sessions.
-        agent_sessions = agent.storage.get_all_sessions()
-        if not agent_sessions:
+        # Get the most recent sessions of the user, without loading their memory.
+        sessions, next_cursor = get_session_index_page(agent_name, agent, user_id)
+        if not sessions:
             st.sidebar.info("No saved sessions found.")
             return
 
-        # Get session names if available, otherwise use IDs.
-        sessions_list = []
-        for session in agent_sessions:
-            session_id = session.session_id
-            session_name = session.session_data.get("session_name", None) if session.session_data else None
-            display_name = session_name if session_name else session_id
-            sessions_list.append({"id": session_id, "display_name": display_name})
+        session_names = {
+            session.session_id: f"🗄️ {session.display_name}" if session.archived else session.display_name
+            for session in sessions
+        }
 
         # Display session selector.
         st.sidebar.markdown("#### 💬 Session")
-        selected_session = st.sidebar.selectbox(
+        selected_session_id = st.sidebar.selectbox(
             "Session",
-            options=[s["display_name"] for s in sessions_list],
+            options=list(session_names),
+            format_func=lambda session_id: session_names[session_id],
             key="session_selector",
             label_visibility="collapsed",
         )
-        # Find the selected session ID.
-        selected_session_id = next(s["id"] for s in sessions_list if s["display_name"] == selected_session)
+        if next_cursor is not None and st.sidebar.button("Show older sessions", key="older_sessions"):
+            load_older_sessions(agent_name, agent)
+            st.rerun()
+
         # Update the agent session if it has changed.
         if st.session_state[agent_name]["session_id"] != selected_session_id:
             logger.info(f"---*--- Loading {agent_name} session: {selected_session_id} ---*---")
+            # Loading an archived session restores it, list it as active again
+            if any(session.archived and session.session_id == selected_session_id for session in sessions):
+                st.session_state[agent_name].pop("session_index", None)
             st.session_state[agent_name]["agent"] = get_agent(
                 user_id=user_id,
                 model_id=model_id,
@@ -274,6 +397,7 @@ async def session_selector(agent_name: str, agent: Agent, get_agent: Callable, u
                 if st.button("✓", key="save_session_name", type="primary"):
                     if new_session_name:
                         agent.rename_session(new_session_name)
+                        st.session_state[agent_name].pop("session_index", None)
                         st.session_state.session_edit_mode = False
                         container.success("Renamed!")
                         # Trigger a rerun to refresh the sessions list
@@ -344,7 +468,7 @@ async def create_system():
     - password: str
     - schema: str
 
-    the form has a submit button, that will create and upload a new entry to the `systems` database table using get_db() from db/session.py
+    the form has a submit button, that will create and upload a new entry to the `systems` database table using acreate_system() from db/crud/systems.py
     """
     # Initialize session state for systems if needed
     if "selected_system" not in st.session_state:
@@ -376,20 +500,18 @@ async def create_system():
                     
                     try:
                         # Create system in database
-                        from db.session import get_db
-                        from db.tables.systems import SystemsTable
-                        db = next(get_db())
-                        system = SystemsTable(host=host, user=user, password=password, port=port, schema=schema)
-                        db.add(system)
-                        db.commit()
-                        db.refresh(system)
+                        from db.crud.systems import acreate_system
+                        from db.session import UnpooledAsyncSessionLocal
+                        async with UnpooledAsyncSessionLocal() as db:
+                            system = await acreate_system(
+                                db, host=host, user=user, password=password, port=port, schema=schema
+                            )
                         
-                        # Update session state with the new system
+                        # Update session state with the new system, without its password
                         st.session_state.selected_system = {
                             "id": system.id,
                             "host": system.host,
                             "user": system.user,
-                            "password": system.password,
                             "port": system.port,
                             "schema": system.schema
                         }
@@ -410,10 +532,15 @@ async def system_selector():
     """
     UI dropdown to select a system connection from the `systems` database table.
     Stores the selected system in session state for access across pages.
-    Returns the selected system dictionary.
+    Returns the selected system dictionary, without the password.
+
+    Systems are listed from the process-wide system registry, which only reads the `systems` table
+    when a system was created, updated or deleted, or its cache expired.
     """
-    from db.session import get_db
-    from db.tables.systems import SystemsTable
+    from dataclasses import asdict
+
+    from db.crud.systems import system_registry
+    from db.session import UnpooledAsyncSessionLocal
     from sqlalchemy.exc import SQLAlchemyError
     
     # Initialize session state for system if it doesn't exist
@@ -424,30 +551,15 @@ async def system_selector():
         st.markdown("### Select System Connection")
         
         try:
-            # Query systems from database
-            db = next(get_db())
-            systems_data = []
-            
-            # Query all systems from the database
-            systems = db.query(SystemsTable).all()
-            
-            # Convert SQLAlchemy objects to dictionaries
-            for system in systems:
-                systems_data.append({
-                    "id": system.id,
-                    "host": system.host,
-                    "user": system.user,
-                    "password": system.password,
-                    "port": system.port,
-                    "schema": system.schema
-                })
+            systems = await system_registry.alist(UnpooledAsyncSessionLocal)
+            systems_data = [asdict(system) for system in systems]
             
             if not systems_data:
                 st.info("No system connections found. Please create one using the form above.")
                 return None
             
             # Create display options for the dropdown
-            system_options = [f"{system['host']}:{system['port']}" for system in systems_data]
+            system_options = [system.label for system in systems]
             system_options.insert(0, "Select a system...")
             
             # Determine the default index based on session state
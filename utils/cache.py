@@ -0,0 +1,462 @@
+"""Shared cache for values that are expensive to compute and cheap to store.
+
+Each `Cache` is a namespace with a default TTL on top of a backend:
+    - MemoryCacheBackend: an LRU cache in the process, the default and the stand-in for tests
+    - RedisCacheBackend: shared by all api workers and ui processes, used when REDIS_HOST is set
+
+Values are stored as json. `get_or_set` computes a missing value once: concurrent callers in a process
+wait for the first one, and with Redis, callers in other processes wait for the process that holds the
+load lock, up to `lock_timeout` seconds. `invalidate` deletes a key and bumps its generation, a load that
+started before is returned to its caller but not cached, so a value read before a write does not outlive it.
+
+A failing backend is treated as a cache miss, the cache never fails a request.
+
+Usage:
+    cache = get_cache("web_search", ttl=3600)
+    results = cache.get_or_set(query, lambda: search(query))
+"""
+
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import monotonic, sleep
+from typing import Any, Awaitable, Callable, Dict, Iterator, Literal, Optional, Tuple, TypeVar
+
+from pydantic_settings import BaseSettings
+
+from utils.log import logger
+from utils.metrics import metrics_registry
+
+T = TypeVar("T")
+
+cache_requests_total = metrics_registry.counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit, miss or error).",
+    ["cache", "result"],
+)
+cache_loads_total = metrics_registry.counter(
+    "cache_loads_total",
+    "Values computed after a cache miss, lower than misses when concurrent misses are coalesced.",
+    ["cache"],
+)
+
+
+class CacheSettings(BaseSettings):
+    """Cache settings that can be set using environment variables.
+
+    Reference: https://docs.pydantic.dev/latest/usage/pydantic_settings/
+    """
+
+    # "memory" or "redis", defaults to redis when REDIS_HOST is set
+    cache_backend: Optional[Literal["memory", "redis"]] = None
+    # Entries kept by the memory backend, per process
+    cache_max_entries: int = 10_000
+    # Prefix of all keys, to share a Redis database between apps
+    cache_key_prefix: str = "cache"
+    # Same variables as WAIT_FOR_REDIS in scripts/entrypoint.sh
+    redis_host: Optional[str] = None
+    redis_port: int = 6379
+    redis_db: int = 0
+    redis_password: Optional[str] = None
+
+    def get_backend_name(self) -> str:
+        if self.cache_backend is not None:
+            return self.cache_backend
+        return "redis" if self.redis_host else "memory"
+
+
+# Create CacheSettings object
+cache_settings = CacheSettings()
+
+######################################################
+## Backends
+######################################################
+
+
+class CacheBackend(ABC):
+    # True if other processes see the same entries
+    shared: bool = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value of a key, None if it is missing or expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """Set a key, it expires after `ttl` seconds or never if None."""
+
+    @abstractmethod
+    def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        """Set a key only if it is missing. Returns True if it was set."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Delete a key if it exists."""
+
+    @abstractmethod
+    def incr(self, key: str) -> int:
+        """Increment the integer value of a key that does not expire, a missing key is 0. Returns the new value."""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """LRU cache in the memory of the process."""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        # key -> (value, expires_at)
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[bytes]:
+        # Called with self._lock held
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key: str, value: bytes, ttl: Optional[float]) -> None:
+        # Called with self._lock held
+        self._entries[key] = (value, monotonic() + ttl if ttl is not None else None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._get(key) or 0) + 1
+            self._set(key, str(value).encode(), None)
+            return value
+
+
+class RedisCacheBackend(CacheBackend):
+    """Cache in Redis, shared by all processes using the same Redis database."""
+
+    shared = True
+
+    def __init__(
+        self, host: str, port: int = 6379, db: int = 0, password: Optional[str] = None, timeout: float = 1.0
+    ):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("`redis` not installed. Please install using `pip install redis`")
+
+        self.client = redis.Redis(
+            host=host,
+            port=port,
+            db=db,
+            password=password,
+            socket_timeout=timeout,
+            socket_connect_timeout=timeout,
+        )
+
+    @staticmethod
+    def _px(ttl: Optional[float]) -> Optional[int]:
+        return max(int(ttl * 1000), 1) if ttl is not None else None
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        self.client.set(key, value, px=self._px(ttl))
+
+    def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        return bool(self.client.set(key, value, px=self._px(ttl), nx=True))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(key))
+
+
+######################################################
+## Cache
+######################################################
+
+_MISSING: Any = object()
+
+
+class Cache:
+    """A namespace of json values in a cache backend."""
+
+    def __init__(
+        self,
+        namespace: str,
+        backend: CacheBackend,
+        ttl: Optional[float] = None,
+        key_prefix: str = "cache",
+        lock_timeout: float = 30,
+    ):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        # Seconds another process may hold the load lock of a key before callers load the value themselves
+        self.lock_timeout = lock_timeout
+
+        # Keys being loaded in this process, (event loop id or 0 for threads, key) -> waiters
+        self._loading: Dict[Tuple[int, str], Any] = {}
+        self._loading_lock = threading.Lock()
+
+    def _key(self, key: str) -> str:
+        return f"{self.key_prefix}:{self.namespace}:{key}"
+
+    def _get(self, key: str) -> Any:
+        try:
+            raw = self.backend.get(self._key(key))
+        except Exception as e:
+            cache_requests_total.inc(cache=self.namespace, result="error")
+            logger.warning(f"Could not read {key} from the {self.namespace} cache: {e}")
+            return _MISSING
+        if raw is None:
+            cache_requests_total.inc(cache=self.namespace, result="miss")
+            return _MISSING
+        cache_requests_total.inc(cache=self.namespace, result="hit")
+        return json.loads(raw)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value of a key, `default` if it is missing."""
+        value = self._get(key)
+        return default if value is _MISSING else value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Set the value of a key, it expires after `ttl` seconds or the default ttl of the cache."""
+        try:
+            self.backend.set(self._key(key), json.dumps(value).encode(), ttl if ttl is not None else self.ttl)
+        except Exception as e:
+            logger.warning(f"Could not write {key} to the {self.namespace} cache: {e}")
+
+    def delete(self, key: str) -> None:
+        """Delete a key, e.g. because the cached value changed."""
+        try:
+            self.backend.delete(self._key(key))
+        except Exception as e:
+            logger.warning(f"Could not delete {key} from the {self.namespace} cache: {e}")
+
+    def invalidate(self, key: str) -> None:
+        """Delete a key, and do not cache the values of loads of the key that started before."""
+        try:
+            self.backend.incr(self._key(f"{key}:generation"))
+        except Exception as e:
+            logger.warning(f"Could not invalidate {key} in the {self.namespace} cache: {e}")
+        self.delete(key)
+
+    def _generation(self, key: str) -> Optional[bytes]:
+        # An evicted generation reads as None, which differs from any generation read before, so it is safe
+        try:
+            return self.backend.get(self._key(f"{key}:generation"))
+        except Exception as e:
+            logger.warning(f"Could not read the generation of {key} from the {self.namespace} cache: {e}")
+            return None
+
+    def _store(self, key: str, value: Any, ttl: Optional[float], generation: Optional[bytes]) -> None:
+        """Cache a loaded value unless the key was invalidated since the load started."""
+        if self._generation(key) != generation:
+            return
+        self.set(key, value, ttl)
+        # Invalidated between the check and the set, `invalidate` may have deleted the key before the set
+        if self._generation(key) != generation:
+            self.delete(key)
+
+    @contextmanager
+    def _load_lock(self, key: str) -> Iterator[bool]:
+        """Hold the lock of a key in the backend while loading it. Yields False if another process holds it."""
+        if not self.backend.shared:
+            yield True
+            return
+        try:
+            locked = self.backend.add(self._key(f"{key}:lock"), b"1", ttl=self.lock_timeout)
+        except Exception as e:
+            logger.warning(f"Could not lock {key} in the {self.namespace} cache: {e}")
+            # Load without the lock rather than wait for nothing
+            yield True
+            return
+        try:
+            yield locked
+        finally:
+            if locked:
+                self.delete(f"{key}:lock")
+
+    def _wait_for_other_process(self, key: str) -> Any:
+        deadline = monotonic() + self.lock_timeout
+        while monotonic() < deadline:
+            sleep(0.05)
+            value = self._get(key)
+            if value is not _MISSING:
+                return value
+        return _MISSING
+
+    def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], T],
+        ttl: Optional[float] = None,
+        cache_if: Optional[Callable[[T], bool]] = None,
+    ) -> T:
+        """
+        Return the value of a key, computed with `loader` and cached if it is missing.
+
+        Concurrent calls for a missing key call `loader` once. Exceptions of `loader` are raised to the
+        caller that called it and are not cached, waiting callers then call `loader` themselves.
+
+        Args:
+            key (str): The key.
+            loader (Callable[[], T]): Computes the value, it must be json serializable.
+            ttl (Optional[float]): Seconds to keep the value, defaults to the ttl of the cache.
+            cache_if (Optional[Callable[[T], bool]]): Only cache values for which this returns True,
+                e.g. to not cache empty results.
+
+        Returns:
+            T: The cached or computed value.
+        """
+        value = self._get(key)
+        if value is not _MISSING:
+            return value
+
+        with self._loading_lock:
+            lock = self._loading.setdefault((0, key), threading.Lock())
+        with lock:
+            try:
+                # Loaded by another thread while waiting for the lock
+                value = self._get(key)
+                if value is not _MISSING:
+                    return value
+                with self._load_lock(key) as acquired:
+                    if not acquired:
+                        value = self._wait_for_other_process(key)
+                        if value is not _MISSING:
+                            return value
+                    cache_loads_total.inc(cache=self.namespace)
+                    generation = self._generation(key)
+                    value = loader()
+                    if cache_if is None or cache_if(value):
+                        self._store(key, value, ttl, generation)
+                    return value
+            finally:
+                with self._loading_lock:
+                    self._loading.pop((0, key), None)
+
+    async def aget_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[T]],
+        ttl: Optional[float] = None,
+        cache_if: Optional[Callable[[T], bool]] = None,
+    ) -> T:
+        """Async version of `get_or_set`, concurrent calls on the same event loop call `loader` once."""
+        value = self._get(key)
+        if value is not _MISSING:
+            return value
+
+        loading_key = (id(asyncio.get_running_loop()), key)
+        with self._loading_lock:
+            loading: Optional[asyncio.Future] = self._loading.get(loading_key)
+            if loading is None:
+                self._loading[loading_key] = asyncio.get_running_loop().create_future()
+        if loading is not None:
+            # shield() so a cancelled waiter does not cancel the load of the other callers
+            return await asyncio.shield(loading)
+
+        future: asyncio.Future = self._loading[loading_key]
+        try:
+            with self._load_lock(key) as acquired:
+                value = _MISSING
+                if not acquired:
+                    value = await asyncio.to_thread(self._wait_for_other_process, key)
+                if value is _MISSING:
+                    cache_loads_total.inc(cache=self.namespace)
+                    generation = self._generation(key)
+                    value = await loader()
+                    if cache_if is None or cache_if(value):
+                        self._store(key, value, ttl, generation)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieve the exception so it is not logged when no other caller waits for it
+            future.exception()
+            raise
+        finally:
+            with self._loading_lock:
+                self._loading.pop(loading_key, None)
+
+
+_backend: Optional[CacheBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_cache_backend() -> CacheBackend:
+    """Return the cache backend of the process, configured with CacheSettings."""
+    global _backend
+
+    with _backend_lock:
+        if _backend is None:
+            if cache_settings.get_backend_name() == "redis":
+                if cache_settings.redis_host is None:
+                    raise ValueError("CACHE_BACKEND=redis requires REDIS_HOST")
+                _backend = RedisCacheBackend(
+                    host=cache_settings.redis_host,
+                    port=cache_settings.redis_port,
+                    db=cache_settings.redis_db,
+                    password=cache_settings.redis_password,
+                )
+            else:
+                _backend = MemoryCacheBackend(max_entries=cache_settings.cache_max_entries)
+    return _backend
+
+
+_caches: Dict[str, Cache] = {}
+
+
+def get_cache(namespace: str, ttl: Optional[float] = None) -> Cache:
+    """
+    Get a cache namespace on the backend of the process.
+
+    Calls with the same namespace return the same Cache, so concurrent misses are coalesced.
+
+    Args:
+        namespace (str): Name of the cache, prefixes its keys and labels its metrics.
+        ttl (Optional[float]): Default seconds to keep values, None keeps them until they are evicted.
+
+    Returns:
+        Cache: The cache.
+    """
+    backend = get_cache_backend()
+    with _backend_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = _caches[namespace] = Cache(
+                namespace, backend, ttl=ttl, key_prefix=cache_settings.cache_key_prefix
+            )
+    return cache